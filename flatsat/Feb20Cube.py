@@ -1,13 +1,14 @@
 import os
 import time
-import csv
 from datetime import datetime
 from PIL import Image
 import numpy as np
-from picamera2 import Picamera2
+from camera_session import get_session
 from image_processor import calculate_average_light  # Ensure this function exists
-import subprocess  # For uploading to GitHub
+from block_grid import save_grid
+from uploader import get_uploader  # For uploading to GitHub
 from sensor_calc_V2 import *  # Import sensor functions
+from displacement import wait_for_return
 
 # Ensure the images folder exists
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,85 +17,41 @@ os.makedirs(IMAGE_DIR, exist_ok=True)
 
 def capture_image(filename):
     """Captures an image and saves it to the specified filename."""
-    picam2 = Picamera2()
-    picam2.start()
-    time.sleep(2)  # Allow camera to adjust
-    picam2.capture_file(filename)
-    picam2.close()
-
-def save_brightness_to_csv(brightness_array, csv_filename):
-    """Saves brightness data to a CSV file."""
-    with open(csv_filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["Pixel Index", "Brightness Difference"])
-        for i, brightness in enumerate(brightness_array):
-            writer.writerow([i, brightness])
-
-def compute_displacement(acceleration_data, time_interval):
-    """Uses kinematic equations to compute displacement based on acceleration data."""
-    velocity = 0
-    displacement = 0
-    for accel in acceleration_data:
-        velocity += accel * time_interval
-        displacement += velocity * time_interval + 0.5 * accel * (time_interval ** 2)
-    return displacement
+    get_session().capture(filename)  # Camera stays open between captures
 
 def main():
     print("Initializing sensors...")
-    calibrate_gyro()
-    calibrate_mag()
+    load_or_calibrate()  # Saved calibration if it is still good
     print("You can now place cubesat on gantry")
     time.sleep(10)  # give time to place cubesat on gantrys
 
     initial_image_path = os.path.join(IMAGE_DIR, "initial.jpg")
     capture_image(initial_image_path)
     print("Initial image captured. CubeSat can now be moved.")
-    acceleration_data = []
-    start_time = time.time()
-    #while time.time() - start_time <2:
-        #acceleration_data.append(accel_gyro.acceleration[0])
-        #time.sleep(0.1) 
-    
-    while True:
-        acceleration_data.append(accel_gyro.acceleration[0]) 
-        if len(acceleration_data) > 20:
-            acceleration_data.pop(0)
-        displacement = compute_displacement(acceleration_data, 0.1)
-        if abs(displacement) > 1:  # Determine whether CubeSat has travelled far enough from start position
-            print("CubeSat has travelled far enough")
-            break
-        time.sleep(0.1)
-    while True:
-        acceleration_data.append(accel_gyro.acceleration[0])  
-        if len(acceleration_data) > 20:
-            acceleration_data.pop(0)
-        displacement = compute_displacement(acceleration_data, 0.1)
-        if abs(displacement) < 0.3:  # Margin of Error for detecting return to start position
-            print("CubeSat has returned to its original position. Capturing second image...")
-            second_image_path = os.path.join(IMAGE_DIR, "second.jpg")
-            capture_image(second_image_path)
-            break
-        time.sleep(0.1)
-    
+    # Wait for the gantry to carry the CubeSat away and bring it back
+    wait_for_return(lambda: accel_gyro.acceleration[0], rate_hz=100)
+    print("Capturing second image...")
+    second_image_path = os.path.join(IMAGE_DIR, "second.jpg")
+    capture_image(second_image_path)
+
     # Analyze brightness differences
     initial_brightness = calculate_average_light(initial_image_path)
     second_brightness = calculate_average_light(second_image_path)
     brightness_diff = np.array(initial_brightness) - np.array(second_brightness)
     total_brightness_diff = np.sum((brightness_diff))
     
-    # Save to CSV
-    csv_filename = os.path.join(SCRIPT_DIR, "brightness_diff.csv")
-    save_brightness_to_csv(brightness_diff, csv_filename)
+    # Save the block grid (block_grid.py to-csv converts it if a CSV is needed)
+    grid_filename = os.path.join(SCRIPT_DIR, "brightness_diff.npy")
+    save_grid(grid_filename, diff=brightness_diff)
     
     # Generate grayscale image from brightness difference
     diff_image = Image.fromarray(np.uint8(np.clip(brightness_diff, 0, 255)))
     diff_image.save(os.path.join(IMAGE_DIR, "brightness_diff.jpg"))
     diff_image_path = os.path.join(IMAGE_DIR, "brightness_diff.jpg")
     
-    # Upload to GitHub 
-    subprocess.run(["git", "add", csv_filename, initial_image_path, second_image_path, diff_image_path])
-    subprocess.run(["git", "commit", "-m", "Updated brightness difference data"]) 
-    subprocess.run(["git", "push"])
+    # Upload to GitHub in the background
+    uploader = get_uploader(SCRIPT_DIR, message="Updated brightness difference data")
+    uploader.add(grid_filename, initial_image_path, second_image_path, diff_image_path)
     
     # Threshold check for power outage
     BRIGHTNESS_THRESHOLD = 100000  # Adjust based on expected conditions
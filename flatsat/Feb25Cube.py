@@ -1,152 +1,146 @@
 import os
 import time
-import csv
 from datetime import datetime
-from PIL import Image, ImageDraw
+from PIL import Image
 import numpy as np
-from picamera2 import Picamera2
-from image_processor import calculate_average_light 
-import subprocess  # For uploading to GitHub
+from camera_session import get_session, yuv420_to_rgb, FrameArchiver
+from image_processor import block_means, classify_blocks, render_overlay, BlockPyramid
+from registration import align, shift_image
+from block_grid import write_grid, make_grid, grid_to_csv
+from brightness_store import BrightnessStore
+from uploader import get_uploader  # For uploading to GitHub
 from sensor_calc_V2 import *  # Import sensor functions
+from displacement import wait_for_return
+from metrics import timed, timer  # Step timings, off unless FLATSAT_METRICS_FILE/PORT is set
 
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_DIR = os.path.join(SCRIPT_DIR, "images")
 os.makedirs(IMAGE_DIR, exist_ok=True)
+FRAME_SIZE = (640, 480)  # (width, height) of the in-memory YUV420 frames
+SAVE_IMAGES = True  # Archive each frame as JPEG in the background
+EXPORT_CSV = False  # Also write the old per-block CSV next to the .npy grid
+ALIGN_FRAMES = True  # Shift the second frame back onto the first before comparing blocks
+WAIT_FOR_RETURN = False  # Wait for the gantry to carry the CubeSat away and back instead of sleeping 5 s
+BLOCK_SIZE = 10  # Side of the blocks in the saved brightness grids, in pixels
 
 def get_timestamp():
     """Returns a timestamp string for filenames."""
     return datetime.now().strftime("%Y%m%d_%H%M%S")
 
-def capture_image(filename):
-    """Captures an image and saves it to the specified filename."""
-    picam2 = Picamera2()
-    picam2.start()
-    time.sleep(2)  # Allow camera to adjust
-    picam2.capture_file(filename)
-    picam2.close()
-
-
-def compute_displacement(acceleration_data, time_interval):
-    """Uses kinematic equations to compute displacement based on acceleration data."""
-    velocity = 0
-    displacement = 0
-    for accel in acceleration_data:
-        velocity += accel * time_interval
-        displacement += velocity * time_interval + 0.5 * accel * (time_interval ** 2)
-    return displacement
-
-
 def normalize_brightness(pixels):
     """Normalize brightness levels by scaling them to the same average."""
     avg_brightness = np.mean(pixels)
     return pixels * (100 / avg_brightness)  # Scale so avg is around 100
 
-def analyze_brightness_blocks(image_path, threshold):
-    """Analyzes brightness in 10x10 pixel blocks after normalization."""
-    image = Image.open(image_path).convert("L")
-    pixels = np.array(image, dtype=np.float32)  # Convert to float for scaling
-    pixels = normalize_brightness(pixels)  # Apply normalization
-
-    width, height = image.size
-    status_matrix = []
-
-    for y in range(0, height, 10):
-        row = []
-        for x in range(0, width, 10):
-            block = pixels[y:y+10, x:x+10]
-            avg_brightness = np.mean(block)
-            row.append(avg_brightness)
-        status_matrix.append(row)
+def analyze_brightness_frame(pixels):
+    """Analyzes brightness in BLOCK_SIZE pixel blocks of a luminance array after normalization."""
+    # Normalization is one scale factor, so scaling the block means is the
+    # same as scaling every pixel first and saves a full-frame float copy
+    return block_means(pixels, BLOCK_SIZE) * (100 / np.mean(pixels))
 
-    return status_matrix
+@timed()
+def analyze_brightness_blocks(image_path):
+    """Analyzes brightness in BLOCK_SIZE pixel blocks of an image file after normalization."""
+    image = Image.open(image_path).convert("L")
+    return analyze_brightness_frame(np.array(image))
 
 
+@timed()
 def save_brightness_to_csv(initial_matrix, second_matrix, csv_filename, threshold):
     """Saves block-wise brightness analysis to a CSV file with outage and restoration data."""
-    with open(csv_filename, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(["Block Row", "Block Column", "Status"])
-        for i, (row1, row2) in enumerate(zip(initial_matrix, second_matrix)):
-            for j, (val1, val2) in enumerate(zip(row1, row2)):
-                if val1 - val2 > threshold:
-                    status = "Outage"
-                elif val2 - val1 > (threshold + 90):
-                    status = "Restored"
-                else:
-                    status = "Same"
-                writer.writerow([i, j, status])
+    status = classify_blocks(initial_matrix, second_matrix, threshold)
+    grid_to_csv(make_grid(status=status), csv_filename)
 
-def overlay_outage_map(image_path, initial_matrix, second_matrix, threshold, output_path):
-    """Creates an overlay image highlighting outages (red) and restorations (green)."""
-    image = Image.open(image_path).convert("RGB")
-    draw = ImageDraw.Draw(image)
-   
-    for y, (row1, row2) in enumerate(zip(initial_matrix, second_matrix)):
-        for x, (val1, val2) in enumerate(zip(row1, row2)):
-            if val1 - val2 > threshold:
-                draw.rectangle([(x*10, y*10), (x*10+10, y*10+10)], width=2, fill=(255, 0, 0, 100))
-            elif val2 - val1 > (threshold+90):
-                draw.rectangle([(x*10, y*10), (x*10+10, y*10+10)], width=2, fill=(0, 255, 0, 100))
-   
-    image.save(output_path)
+@timed()
+def overlay_outage_map(image, initial_matrix, second_matrix, threshold, output_path, status=None):
+    """
+    Creates an overlay image highlighting outages (red) and restorations (green).
+    image is either an image file path or an RGB array. status is the block
+    status grid if it has already been worked out.
+    """
+    if isinstance(image, str):
+        image = Image.open(image).convert("RGB")
+    if status is None:
+        status = classify_blocks(initial_matrix, second_matrix, threshold)
+    Image.fromarray(render_overlay(image, status, BLOCK_SIZE)).save(output_path)
 
 def main():
     """
     print("Initializing sensors...")
-    calibrate_gyro()
-    calibrate_mag()
+    load_or_calibrate()  # Saved calibration if it is still good
     print("You can now place CubeSat on gantry")
     time.sleep(10)
     """   
+    session = get_session(size=FRAME_SIZE)
+    archiver = FrameArchiver()
+    BRIGHTNESS_THRESHOLD = 70  # Adjust based on expected conditions
+
+    # Frames stay in memory: the brightness plane goes straight to the
+    # block analysis and the JPEGs are written in the background
     timestamp = get_timestamp()
     initial_image_path = os.path.join(IMAGE_DIR, f"initial_{timestamp}.jpg")
-    capture_image(initial_image_path)
-    print("Initial image captured. Waiting 5 seconds to capture second image.....")
-    """    
-    acceleration_data = []
-    while True:
-        acceleration_data.append(accel_gyro.acceleration[0])
-        if len(acceleration_data) > 20:
-            acceleration_data.pop(0)
-        displacement = compute_displacement(acceleration_data, 0.1)
-        if abs(displacement) > 1:
-            print("CubeSat has traveled far enough")
-            break
-        time.sleep(0.1)
-   
-    while True:
-        acceleration_data.append(accel_gyro.acceleration[0])  
-        if len(acceleration_data) > 20:
-            acceleration_data.pop(0)
-        displacement = compute_displacement(acceleration_data, 0.1)
-        if abs(displacement) < 0.3:
-            print("CubeSat has returned to its original position. Capturing second image...")
-            second_image_path = os.path.join(IMAGE_DIR, f"second_{timestamp}.jpg")
-            capture_image(second_image_path)
-            break
-        time.sleep(0.1)
-    """
-        
-    
-    time.sleep(5)
+    with timer("capture_initial"):
+        initial_luma, initial_frame = session.capture_luminance()
+    with timer("analyze_initial"):
+        initial_pyramid = BlockPyramid(initial_luma, normalize=True)
+        initial_brightness = initial_pyramid.means(BLOCK_SIZE)
+    if SAVE_IMAGES:
+        archiver.save(initial_frame, initial_image_path)
+    if WAIT_FOR_RETURN:
+        print("Initial image captured. Waiting for the CubeSat to travel away and come back.....")
+        with timer("wait"):
+            wait_for_return(lambda: accel_gyro.acceleration[0], rate_hz=100)
+    else:
+        print("Initial image captured. Waiting 5 seconds to capture second image.....")
+        with timer("wait"):
+            time.sleep(5)
     print("Now capturing second image")
     second_image_path = os.path.join(IMAGE_DIR, f"second_{timestamp}.jpg")
-    capture_image(second_image_path)
-   
-    BRIGHTNESS_THRESHOLD = 70  # Adjust based on expected conditions
-    initial_brightness = analyze_brightness_blocks(initial_image_path, BRIGHTNESS_THRESHOLD)
-    second_brightness = analyze_brightness_blocks(second_image_path, BRIGHTNESS_THRESHOLD)
+    with timer("capture_second"):
+        second_luma, second_frame = session.capture_luminance()
+    shift = (0.0, 0.0)
+    if ALIGN_FRAMES:
+        # A few pixels of gantry misalignment would otherwise flag the edges of every light
+        with timer("align"):
+            second_luma, shift = align(initial_luma, second_luma)
+        print(f"Second frame was off by {shift[0]:.1f}, {shift[1]:.1f} pixels (rows, columns)")
+    with timer("analyze_second"):
+        second_pyramid = BlockPyramid(second_luma, normalize=True)
+        second_brightness = second_pyramid.means(BLOCK_SIZE)
+    if SAVE_IMAGES:
+        archiver.save(second_frame, second_image_path)
    
-    csv_filename = os.path.join(SCRIPT_DIR, f"brightness_diff_{timestamp}.csv")
-    save_brightness_to_csv(initial_brightness, second_brightness, csv_filename, BRIGHTNESS_THRESHOLD)
+    # Both BLOCK_SIZE grids are already built, so every block is compared
+    with timer("classify_blocks"):
+        status = classify_blocks(initial_brightness, second_brightness, BRIGHTNESS_THRESHOLD)
+
+    # Block grid as one small .npy file, CSV only if asked for
+    grid_filename = os.path.join(SCRIPT_DIR, f"brightness_diff_{timestamp}.npy")
+    grid = make_grid(initial=initial_brightness, second=second_brightness, status=status)
+    with timer("write_grid"):
+        write_grid(grid_filename, grid)
+        with BrightnessStore() as store:  # Index the run for time-range queries
+            run_time = datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
+            store.add_run(run_time, grid, store.source_key(grid_filename), BRIGHTNESS_THRESHOLD)
+    upload_files = [grid_filename]
+    if EXPORT_CSV:
+        csv_filename = os.path.join(SCRIPT_DIR, f"brightness_diff_{timestamp}.csv")
+        with timer("write_csv"):
+            grid_to_csv(make_grid(status=status), csv_filename)
+        upload_files.append(csv_filename)
    
     overlay_path = os.path.join(IMAGE_DIR, f"brightness_overlay_{timestamp}.jpg")
-    overlay_outage_map(second_image_path, initial_brightness, second_brightness, BRIGHTNESS_THRESHOLD, overlay_path)
-   
-    subprocess.run(["git", "add", csv_filename, initial_image_path, second_image_path, overlay_path])
-    subprocess.run(["git", "commit", "-m", "Updated brightness difference data"])
-    subprocess.run(["git", "push"])
+    second_rgb = shift_image(yuv420_to_rgb(second_frame), (-shift[0], -shift[1]))
+    overlay_outage_map(second_rgb, initial_brightness, second_brightness, BRIGHTNESS_THRESHOLD, overlay_path, status)
+    with timer("archive_wait"):
+        archiver.close()  # Wait for the JPEGs before staging them
+
+    upload_files.append(overlay_path)
+    if SAVE_IMAGES:
+        upload_files += [initial_image_path, second_image_path]
+    with timer("upload_queue"):  # git itself is timed as git_commit / git_push
+        get_uploader(SCRIPT_DIR, message="Updated brightness difference data").add(*upload_files)
    
     print("Brightness analysis complete.")
    
@@ -0,0 +1,86 @@
+"""
+Shutter timing for angle-triggered photos. Waiting until the angle is
+within a margin of the target misses the window when the board sweeps
+through it faster than margin / sample period, so instead the angular
+rate (and its change) is extrapolated to predict when the target will be
+crossed, and the shutter is scheduled for that moment.
+"""
+
+import math
+from orientation import wrap_angle
+
+
+def time_to_reach(error, rate, accel=0.0):
+    """
+    Seconds until an angle moving at rate deg/s, changing by accel deg/s^2,
+    covers error degrees. None if it isn't heading there.
+    """
+    if accel and error:
+        # error = rate * t + accel / 2 * t^2, smallest positive root
+        discriminant = rate * rate + 2 * accel * error
+        if discriminant >= 0:
+            roots = [(-rate + sign * math.sqrt(discriminant)) / accel for sign in (1, -1)]
+            roots = [t for t in roots if t >= 0]
+            if roots:
+                return min(roots)
+    if rate == 0 or error * rate < 0:
+        return None
+    return error / rate
+
+
+class ShutterScheduler:
+    """
+    Works out, sample by sample, when to fire for each target angle of a sweep.
+
+    Parameters:
+        targets (list): angles in degrees, in the order the sweep reaches them
+        period (float): seconds between samples
+        latency (float): seconds from asking for a frame to its exposure,
+            the shutter is fired this much early
+        margin (float): degrees; a target this close is taken right away,
+            which also covers a board that stops on the target
+    """
+
+    def __init__(self, targets, period, latency=0.0, margin=0.5):
+        self.targets = [float(target) for target in targets]
+        self.period = period
+        self.latency = latency
+        self.margin = margin
+        self.last_error = None
+        self.last_rate = None
+        self.last_time = None
+
+    @property
+    def done(self):
+        return not self.targets
+
+    def update(self, t, angle, rate):
+        """
+        Adds one sample (time in seconds, angle in degrees, rate in deg/s).
+        Returns a list of (fire time, target) for every target that will be
+        crossed before the next sample, in order; fire times are never
+        before t. Those targets are then done.
+        """
+        accel = 0.0
+        if self.last_time is not None and t > self.last_time:
+            accel = (rate - self.last_rate) / (t - self.last_time)
+        self.last_rate, self.last_time = rate, t
+
+        shots = []
+        while self.targets:
+            target = self.targets[0]
+            error = wrap_angle(target - angle)
+            crossed = self.last_error is not None and error * self.last_error < 0 and abs(error) < 90
+            reach = time_to_reach(error, rate, accel)
+            if abs(error) <= self.margin or crossed:
+                # On the target, or it went past between samples: fire now
+                fire_at = t
+            elif reach is not None and reach - self.latency < self.period:
+                fire_at = t + max(reach - self.latency, 0.0)
+            else:
+                self.last_error = error
+                break
+            shots.append((fire_at, target))
+            self.targets.pop(0)
+            self.last_error = None
+        return shots
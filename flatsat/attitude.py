@@ -0,0 +1,92 @@
+"""
+Roll, pitch and yaw math for the IMU. Nothing here touches the hardware,
+so offline scripts can import it without the I2C bus or the sensors.
+"""
+
+import numpy as np
+
+#Activity 1: RPY based on accelerometer and magnetometer
+def roll_am(accelX,accelY,accelZ):
+    roll = np.arctan2(accelY, np.sqrt(accelX**2 + accelZ**2))
+    return roll
+
+def pitch_am(accelX,accelY,accelZ):
+    pitch = np.arctan2(accelX, np.sqrt(accelY**2 + accelZ**2))
+    return pitch
+
+def yaw_am(accelX,accelY,accelZ,magX,magY,magZ):
+    # Roll and pitch (and their trig) are only computed once
+    roll = roll_am(accelX,accelY,accelZ)
+    pitch = pitch_am(accelX,accelY,accelZ)
+    return _yaw(roll, pitch, magX, magY, magZ)
+
+def _yaw(roll, pitch, magX, magY, magZ):
+    """Tilt-compensated yaw in degrees, works on scalars and arrays alike."""
+    sin_roll, cos_roll = np.sin(roll), np.cos(roll)
+    sin_pitch = np.sin(pitch)
+    # a. compute mag_x
+    mag_x = (
+        magX * np.cos(pitch)+
+        magY * sin_roll*sin_pitch+
+        magZ * cos_roll*sin_pitch
+    )
+
+    # b. compute mag_y
+    mag_y = magY * cos_roll - magZ * sin_roll
+    # c. compute yaw
+    return (180/np.pi)*np.arctan2(-mag_y, mag_x)
+
+def rpy_am(accel, mag):
+    """
+    Roll, pitch and yaw for a whole array of samples in one pass.
+
+    Parameters:
+        accel: (n, 3) array of accelerometer samples (m/s^2)
+        mag: (n, 3) array of calibrated magnetometer samples (gauss)
+
+    Returns roll and pitch in radians and yaw in degrees, the same units
+    as roll_am, pitch_am and yaw_am, each as an array of n values.
+    """
+    accel = np.asarray(accel, dtype=float)
+    mag = np.asarray(mag, dtype=float)
+    accelX, accelY, accelZ = accel[..., 0], accel[..., 1], accel[..., 2]
+    roll = roll_am(accelX, accelY, accelZ)
+    pitch = pitch_am(accelX, accelY, accelZ)
+    yaw = _yaw(roll, pitch, mag[..., 0], mag[..., 1], mag[..., 2])
+    return roll, pitch, yaw
+
+#Activity 2: RPY based on gyroscope
+def roll_gy(prev_angle, delT, gyro):
+    #TODO
+    roll = ( 
+    
+    prev_angle+
+    gyro * delT
+    
+    )
+    return roll
+def pitch_gy(prev_angle, delT, gyro):
+    pitch = (
+    
+    prev_angle+
+    gyro * delT
+    
+    )
+    return pitch
+def yaw_gy(prev_angle, delT, gyro):
+    yaw = (
+    
+    prev_angle+
+    gyro * delT
+    
+    )
+    return yaw
+
+def integrate_gy(prev_angle, delT, gyro):
+    """
+    Runs roll_gy/pitch_gy/yaw_gy over a whole array of gyro samples.
+    delT is a scalar or an array of time steps. Returns the angle after
+    every sample, adding in the same order as the one-at-a-time functions.
+    """
+    steps = np.asarray(gyro, dtype=float) * delT
+    return np.cumsum(np.concatenate(([prev_angle], steps)))[1:]
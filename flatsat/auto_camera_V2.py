@@ -5,22 +5,25 @@ sure you have completed the sensor_calc.py file before you begin this one.
 """
 
 #import libraries
-from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
-from adafruit_lis3mdl import LIS3MDL
 import time
 import os
-import board
-import busio
 from picamera2 import Picamera2
 import numpy as np
 import sys
 sys.path.append('/path/to/directory/containing/sensor_calc_V2')
 from sensor_calc_V2 import *
+from imu_service import hardware_imu
+from orientation import OrientationEstimator
+from angle_trigger import ShutterScheduler
+from camera_session import CameraSession, FrameArchiver
+
+SHUTTER_LATENCY = 1 / 60  # s, roughly half a frame at 30 fps
+# Frames stay in memory so the shutter doesn't wait on JPEG encoding. The
+# width is a multiple of 64 so the YUV420 rows have no stride padding.
+CAPTURE_SIZE = (1600, 1200)
 
 #imu and camera initialization
-i2c = busio.I2C(board.SCL, board.SDA)
-accel_gyro = LSM6DS(i2c)
-mag = LIS3MDL(i2c)
+accel_gyro, mag = hardware_imu()  # Same bus and sensors as sensor_calc_V2
 picam2 = Picamera2()
 
 
@@ -49,65 +52,73 @@ def capture(dir ='roll', target_angle = 30):
         #TODO: Everything else! Be sure to not take a picture on exactly a
         #certain angle: give yourself some margin for error. 
 """
-# Code to take a picture at a given offset angle
-def capture(dir='roll', target_angle=30):
+# Code to take pictures at given offset angles
+def capture(dir='roll', targets=(30,), rate_hz=50, latency=SHUTTER_LATENCY):
     """
-    Captures a picture when the target angle offset is achieved.
-   
+    Captures a picture at each target angle as the camera sweeps through them.
+
     Parameters:
         dir (str): Direction to monitor ('roll', 'pitch', or 'yaw').
-        target_angle (float): Target angle offset to capture the picture.
+        targets (list): Target angle offsets in degrees, in sweep order.
+        rate_hz (float): How often to read the IMU and update the angle.
+        latency (float): Seconds between asking for a frame and its exposure.
     """
-    # Calibration
-    offset_mag = calibrate_mag()
-    offset_gyro = calibrate_gyro()
-    initial_angle = set_initial(offset_mag)
-    prev_angle = initial_angle  # Store the initial RPY angles
+    axis = {'roll': 0, 'pitch': 1, 'yaw': 2}[dir]
+    rate_hz = float(rate_hz)
+    # Calibration: reuse the saved offsets if they are recent, only the
+    # starting angle has to be measured every time
+    offset_mag, offset_gyro, mag_matrix, initial_angle = calibrated_start()
+    # set_initial gives roll and pitch in radians, the estimator works in degrees
+    estimator = OrientationEstimator(
+        [np.degrees(initial_angle[0]), np.degrees(initial_angle[1]), initial_angle[2]],
+        rate_hz=rate_hz)
+    period = 1.0 / rate_hz
+    scheduler = ShutterScheduler(targets, period, latency)
+    session = CameraSession(picam2, size=CAPTURE_SIZE)
+    archiver = FrameArchiver()
+    session.start()  # Warmed up once, before the sweep
     print("Begin moving camera.")
+    try:
+        next_time = time.monotonic()
+        while not scheduler.done:
+            # Read accelerometer and magnetometer data
+            accelX, accelY, accelZ = accel_gyro.acceleration  # m/s^2
+            magX, magY, magZ = apply_mag(mag.magnetic, offset_mag, mag_matrix)  # gauss, hard and soft iron corrected
 
-    # Allowable margin for error in angle
-    angle_margin = 2  # degrees
-
-    while True:
-        # Read accelerometer and magnetometer data
-        accelX, accelY, accelZ = accel_gyro.acceleration  # m/s^2
-        magX, magY, magZ = mag.magnetic  # gauss
-        magX -= offset_mag[0]
-        magY -= offset_mag[1]
-        magZ -= offset_mag[2]
-
-        # Read gyroscope data
-        gyroX, gyroY, gyroZ = accel_gyro.gyro  # rad/s
-        gyroX = gyroX * 180 / np.pi - offset_gyro[0]
-        gyroY = gyroY * 180 / np.pi - offset_gyro[1]
-        gyroZ = gyroZ * 180 / np.pi - offset_gyro[2]
-
-        # Calculate current roll, pitch, and yaw
-        roll = roll_am(accelX, accelY, accelZ)
-        pitch = pitch_am(accelX, accelY, accelZ)
-        yaw = yaw_am(accelX, accelY, accelZ, magX, magY, magZ)
+            # Read gyroscope data
+            gyroX, gyroY, gyroZ = accel_gyro.gyro  # rad/s
+            gyroX = gyroX * 180 / np.pi - offset_gyro[0]
+            gyroY = gyroY * 180 / np.pi - offset_gyro[1]
+            gyroZ = gyroZ * 180 / np.pi - offset_gyro[2]
 
-        # Integrate gyroscope data for updated angles
-        delT = 0.1  # Time step in seconds (adjust as needed)
-        roll = roll_gy(prev_angle[0], delT, gyroX)
-        pitch = pitch_gy(prev_angle[1], delT, gyroY)
-        yaw = yaw_gy(prev_angle[2], delT, gyroZ)
+            # Fuse the gyro with the accelerometer/magnetometer angles, using the
+            # measured time since the last sample rather than a fixed step
+            t = time.monotonic()
+            angles = estimator.update(
+                (accelX, accelY, accelZ), (gyroX, gyroY, gyroZ), (magX, magY, magZ), t)
 
-        # Update previous angles
-        prev_angle = [roll, pitch, yaw]
+            # Schedule the shutter for when the angular rate says each target
+            # will be crossed, instead of hoping a sample lands inside a margin
+            current_angle = angles[axis]
+            for fire_at, target in scheduler.update(t, current_angle, (gyroX, gyroY, gyroZ)[axis]):
+                time.sleep(max(0, fire_at - time.monotonic()))
+                frame = session.capture_frame()
+                archiver.save(frame, f"{dir}_{target:+.0f}_{int(time.time())}.jpg")  # Written in the background
+                print(f"Picture taken for {dir} = {target:.1f}° (last reading {current_angle:.2f}°)")
 
-        # Check if the desired angle is achieved within margin
-        current_angle = {'roll': roll, 'pitch': pitch, 'yaw': yaw}[dir]
-        if abs(current_angle - target_angle) <= angle_margin:
-            print(f"Target angle reached: {dir} = {current_angle:.2f}°")
-            picam2.capture_file(f"{dir}_{int(time.time())}.jpg")
-            print(f"Picture taken at {dir} = {current_angle:.2f}°")
-            break
-
-        # Small delay to avoid excessive updates
-        time.sleep(0.1)
+            # Keep a steady loop rate however long the reads above took
+            next_time = max(next_time + period, time.monotonic())
+            time.sleep(max(0, next_time - time.monotonic()))
+    finally:
+        archiver.close()  # Waits for the last frames to be written
+        session.stop()  # The camera stays open for the next capture()
 
 
 if __name__ == '__main__':
-    capture(*sys.argv[1:])
-
+    if len(sys.argv) < 3:
+        print("Usage: python3 auto_camera_V2.py <roll|pitch|yaw> <angle> [angle ...]")
+        sys.exit(1)
+    try:
+        capture(sys.argv[1], [float(angle) for angle in sys.argv[2:]])
+    finally:
+        picam2.close()
@@ -0,0 +1,1189 @@
+"""
+Benchmarks that run without the CubeSat hardware attached.
+
+Usage: python3 benchmarks.py <name> [<name> ...]
+Run with no arguments to list the available benchmarks.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+
+def report(label, seconds, count=1):
+    """Prints the average time per item in milliseconds."""
+    print(f"{label:<40} {seconds / count * 1000:10.3f} ms")
+
+
+def bench_block_means(frames=8, repeats=20, tolerance=1e-9):
+    """
+    block_means against the original per-block loop from
+    calculate_average_light, on sizes that aren't a multiple of the block
+    size and on a batch of frames. Every block must agree to within
+    tolerance (the sums are added in a different order).
+    """
+    import numpy as np
+    from image_processor import block_means
+
+    def original_blocks(img_array, block_size):
+        height, width = img_array.shape
+        brightness_values = []
+        for y in range(0, height, block_size):
+            row = []
+            for x in range(0, width, block_size):
+                row.append(np.mean(img_array[y:y+block_size, x:x+block_size]))
+            brightness_values.append(row)
+        return np.array(brightness_values)
+
+    random = np.random.default_rng(0)
+    worst = 0.0
+    for height, width, block_size in ((480, 640, 10), (483, 647, 10), (17, 23, 7), (5, 3, 10)):
+        pixels = random.integers(0, 256, (height, width), dtype=np.uint8)
+        fast = block_means(pixels, block_size)
+        slow = original_blocks(pixels, block_size)
+        if fast.shape != slow.shape:
+            print(f"  {height}x{width} block {block_size}: shape {fast.shape}, loop gave {slow.shape}")
+            return False
+        worst = max(worst, np.abs(fast - slow).max())
+
+    batch = random.integers(0, 256, (frames, 483, 647), dtype=np.uint8)
+    batched = block_means(batch)
+    for frame, blocks in zip(batch, batched):
+        worst = max(worst, np.abs(blocks - original_blocks(frame, 10)).max())
+    print(f"largest difference from the loop: {worst:.3g} (limit {tolerance:g})")
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        original_blocks(batch[0], 10)
+    report("per-block loop, 483x647", time.perf_counter() - start, repeats)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        block_means(batch[0])
+    report("block_means, 483x647", time.perf_counter() - start, repeats)
+    return bool(worst <= tolerance)
+
+
+def bench_camera(captures=20, capture_budget=0.05):
+    """
+    Warm-up and per-capture latency of CameraSession on the fake camera.
+    Once warm, a capture must take less than capture_budget seconds (the
+    fake camera delivers a frame every 1/30 s).
+    """
+    from camera_session import CameraSession, FakeCamera
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Old behaviour: a new camera and a fixed 2 s sleep for every capture
+        start = time.perf_counter()
+        camera = FakeCamera()
+        camera.start()
+        time.sleep(2)
+        camera.capture_file(os.path.join(tmp, "old.jpg"))
+        camera.close()
+        report("open + sleep(2) + capture", time.perf_counter() - start)
+
+        session = CameraSession(FakeCamera())
+        report("session warm-up (AE settle)", session.start())
+        start = time.perf_counter()
+        for i in range(captures):
+            session.capture(os.path.join(tmp, f"frame_{i}.jpg"))
+        elapsed = time.perf_counter() - start
+        report(f"session capture (x{captures})", elapsed, captures)
+        session.close()
+    return elapsed / captures < capture_budget
+
+
+def bench_luminance(frames=20, tolerance=3.0):
+    """
+    JPEG write + decode versus handing the in-memory Y plane to block_means.
+    Both paths see the same FakeCamera scene, so their block means must agree
+    to within tolerance grey levels (JPEG is lossy).
+    """
+    import numpy as np
+    from camera_session import CameraSession, FakeCamera
+    from image_processor import block_means, calculate_average_light
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "frame.jpg")
+        session = CameraSession(FakeCamera(frame_time=0))
+        session.start()
+        start = time.perf_counter()
+        for _ in range(frames):
+            session.capture(path)
+            from_file = calculate_average_light(path)
+        report(f"capture_file + decode + blocks (x{frames})", time.perf_counter() - start, frames)
+        session.close()
+
+        session = CameraSession(FakeCamera(frame_time=0), size=(640, 480))
+        session.start()
+        start = time.perf_counter()
+        for _ in range(frames):
+            luma, frame = session.capture_luminance()
+            in_memory = block_means(luma)
+        report(f"capture_luminance + blocks (x{frames})", time.perf_counter() - start, frames)
+        session.close()
+
+    if from_file.shape != in_memory.shape:
+        print(f"  block grids differ: {from_file.shape} vs {in_memory.shape}")
+        return False
+    worst = np.abs(from_file - in_memory).max()
+    print(f"  worst block mean difference: {worst:.3f} grey levels")
+    return bool(worst <= tolerance)
+
+
+def bench_uploader(files=50, batch_files=10):
+    """
+    Queueing latency of the Uploader, pushing to a bare repo in a temp
+    folder. Also checks that files coalesce into at most one commit per
+    batch_files, that a push the remote rejects is rebased and retried,
+    and that after a failed push and a restart both the unpushed commit
+    and files left in .git/upload_queue reach the remote.
+    """
+    import subprocess
+    from uploader import Uploader
+
+    def git(*args):
+        return subprocess.run(["git"] + list(args), check=True, capture_output=True, text=True).stdout
+
+    def write(folder, name):
+        path = os.path.join(folder, name)
+        with open(path, "w") as file:
+            file.write(name)
+        return path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        remote = os.path.join(tmp, "remote.git")
+        clone = os.path.join(tmp, "clone")
+        other = os.path.join(tmp, "other")
+        git("init", "--bare", "-q", remote)
+        git("clone", "-q", remote, clone)
+        git("-C", clone, "config", "user.email", "bench@example.com")
+        git("-C", clone, "config", "user.name", "bench")
+        git("-C", clone, "commit", "-q", "--allow-empty", "-m", "start")
+        git("-C", clone, "push", "-q", "-u", "origin", "HEAD")
+        git("clone", "-q", remote, other)
+        git("-C", other, "config", "user.email", "bench@example.com")
+        git("-C", other, "config", "user.name", "bench")
+
+        def remote_commits():
+            return int(git("-C", remote, "rev-list", "--count", "HEAD"))
+
+        def remote_files():
+            return set(git("-C", remote, "ls-tree", "--name-only", "HEAD").split())
+
+        # Batching: files queued while a commit runs join the next batch,
+        # so there are never more commits than full batches
+        uploader = Uploader(clone, batch_files=batch_files, batch_seconds=60).start()
+        start = time.perf_counter()
+        names = []
+        for i in range(files):
+            names.append(f"file_{i}.txt")
+            uploader.add(write(clone, names[-1]))
+        report(f"add() per file (x{files})", time.perf_counter() - start, files)
+        start = time.perf_counter()
+        pushed = uploader.flush(timeout=60)
+        report("flush (commit + push remainder)", time.perf_counter() - start)
+        uploader.stop()
+        commits = remote_commits() - 1
+        coalesced = pushed and set(names) <= remote_files() and 1 <= commits <= -(-files // batch_files)
+        print(f"{files} files pushed: {pushed}, in {commits} commits on the remote")
+
+        # Someone else pushed first: the push is rejected, pulled with rebase and retried
+        git("-C", other, "pull", "-q")
+        git("-C", other, "add", write(other, "other.txt"))
+        git("-C", other, "commit", "-q", "-m", "other")
+        git("-C", other, "push", "-q")
+        uploader = Uploader(clone).start()
+        uploader.add(write(clone, "after_other.txt"))
+        rebased = uploader.flush(timeout=60) and {"other.txt", "after_other.txt"} <= remote_files()
+        uploader.stop()
+        print(f"rejected push rebased and pushed: {rebased}")
+
+        # The link goes down: the file is committed but can't be pushed
+        git("-C", clone, "remote", "set-url", "origin", os.path.join(tmp, "missing.git"))
+        uploader = Uploader(clone, batch_seconds=0)
+        uploader.add(write(clone, "offline.txt"))
+        failed = not uploader.start().flush(timeout=60)
+        uploader.stop(flush=False)
+        failed = failed and "offline.txt" in git("-C", clone, "ls-tree", "--name-only", "HEAD").split()
+        # ... then the script dies with a file queued but not yet committed
+        queue_path = os.path.join(clone, ".git", "upload_queue")
+        with open(queue_path, "a") as file:
+            file.write(write(clone, "queued.txt") + "\n")
+        git("-C", clone, "remote", "set-url", "origin", remote)
+        uploader = Uploader(clone).start()
+        recovered = uploader.flush(timeout=60) and {"offline.txt", "queued.txt"} <= remote_files()
+        uploader.stop()
+        with open(queue_path) as file:
+            recovered = recovered and not file.read().strip()
+        print(f"push failed while offline: {failed}, recovered after restart: {recovered}")
+    return bool(coalesced and rebased and failed and recovered)
+
+
+def bench_attitude(samples=100000, tolerance=1e-12):
+    """
+    Samples per second of rpy_am against the one-sample-at-a-time functions.
+    yaw_am must give exactly what the original formula (roll_am and
+    pitch_am recomputed for every term) gave, rpy_am must agree with the
+    scalar functions to within tolerance, and integrate_gy must give
+    exactly what a roll_gy loop gives.
+    """
+    import numpy as np
+    from attitude import roll_am, pitch_am, yaw_am, rpy_am, roll_gy, integrate_gy
+
+    def original_yaw_am(accelX, accelY, accelZ, magX, magY, magZ):
+        mag_x = (magX * np.cos(pitch_am(accelX, accelY, accelZ))
+                 + magY * np.sin(roll_am(accelX, accelY, accelZ)) * np.sin(pitch_am(accelX, accelY, accelZ))
+                 + magZ * np.cos(roll_am(accelX, accelY, accelZ)) * np.sin(pitch_am(accelX, accelY, accelZ)))
+        mag_y = (magY * np.cos(roll_am(accelX, accelY, accelZ))
+                 - magZ * np.sin(roll_am(accelX, accelY, accelZ)))
+        return (180 / np.pi) * np.arctan2(-mag_y, mag_x)
+
+    random = np.random.default_rng(0)
+    accel = random.normal(0, 5, (samples, 3))
+    mag = random.normal(0, 40, (samples, 3))
+
+    loop_samples = min(samples, 10000)
+    start = time.perf_counter()
+    scalar = np.array([(roll_am(*a), pitch_am(*a), yaw_am(*a, *m))
+                       for a, m in zip(accel[:loop_samples], mag[:loop_samples])])
+    loop_time = time.perf_counter() - start
+    print(f"{'scalar functions':<40} {loop_samples / loop_time:12.0f} samples/s")
+
+    start = time.perf_counter()
+    batch = np.column_stack(rpy_am(accel, mag))
+    batch_time = time.perf_counter() - start
+    print(f"{'rpy_am':<40} {samples / batch_time:12.0f} samples/s")
+    difference = np.abs(batch[:loop_samples] - scalar).max()
+    print(f"largest difference from scalar: {difference:.3g} (limit {tolerance:g})")
+
+    original = np.array([original_yaw_am(*a, *m) for a, m in zip(accel[:loop_samples], mag[:loop_samples])])
+    changed = int(np.count_nonzero(original != scalar[:, 2]))
+    print(f"yaw_am results that differ from the original formula: {changed} of {loop_samples}")
+
+    gyro = random.normal(0, 30, loop_samples)
+    steps = random.uniform(0.005, 0.015, loop_samples)
+    integrated = True
+    for delT in (0.01, steps):
+        angle, looped = 5.0, []
+        for k, rate in enumerate(gyro):
+            angle = roll_gy(angle, delT if np.isscalar(delT) else delT[k], rate)
+            looped.append(angle)
+        integrated &= bool(np.array_equal(integrate_gy(5.0, delT, gyro), looped))
+    print(f"integrate_gy identical to a roll_gy loop: {integrated}")
+    return bool(difference <= tolerance and changed == 0 and integrated)
+
+
+def rolling_trace(seconds=20, rate_hz=50, jitter=0.3, gyro_bias=0.5, noise=0.02, seed=0):
+    """
+    Simulated IMU log of the board rocking in roll (40 deg at 0.25 Hz),
+    with an uneven sample period, a gyro bias in deg/s and sensor noise.
+    Returns (samples, true_roll_degrees); samples has the imu_service.FIELDS columns.
+    """
+    import numpy as np
+    random = np.random.default_rng(seed)
+    steps = (1 + random.uniform(-jitter, jitter, int(seconds * rate_hz))) / rate_hz
+    t = np.cumsum(steps)
+    roll = np.radians(40) * np.sin(2 * np.pi * 0.25 * t)
+    roll_rate = np.radians(40) * 2 * np.pi * 0.25 * np.cos(2 * np.pi * 0.25 * t)
+    n = len(t)
+    samples = np.zeros((n, 10))
+    samples[:, 0] = t
+    samples[:, 2] = 9.81 * np.sin(roll)
+    samples[:, 3] = 9.81 * np.cos(roll)
+    samples[:, 4] = roll_rate + np.radians(gyro_bias)
+    samples[:, 7] = 20.0
+    samples[:, 8] = -40.0 * np.sin(roll)
+    samples[:, 9] = -40.0 * np.cos(roll)
+    samples[:, 1:] += random.normal(0, noise, (n, 9))
+    return samples, np.degrees(roll)
+
+
+def bench_orientation(max_rms=((10, 2.0), (50, 0.75), (200, 0.5))):
+    """
+    Replays a simulated log through the old fixed-delT integration and the
+    estimator. The estimator's roll RMS error against the true roll must
+    stay within the max_rms (rate_hz, degrees) bound at each sample rate.
+    """
+    import numpy as np
+    from attitude import roll_gy
+    from orientation import OrientationEstimator, replay
+
+    passed = True
+    for rate_hz, bound in max_rms:
+        samples, true_roll = rolling_trace(rate_hz=rate_hz)
+        # Old capture loop: gyro only, every step assumed to be 0.1 s
+        angle = true_roll[0]
+        gyro_only = []
+        for gyroX in np.degrees(samples[:, 4]):
+            angle = roll_gy(angle, 0.1, gyroX)
+            gyro_only.append(angle)
+        old_error = np.sqrt(np.mean((np.array(gyro_only) - true_roll) ** 2))
+
+        start = time.perf_counter()
+        fused = replay(samples, estimator=OrientationEstimator(rate_hz=rate_hz))
+        elapsed = time.perf_counter() - start
+        new_error = np.sqrt(np.mean((fused[:, 0] - true_roll) ** 2))
+        ok = bool(new_error <= bound)
+        passed &= ok
+        print(f"{rate_hz:4d} Hz  roll RMS error: fixed delT {old_error:8.2f} deg,"
+              f" estimator {new_error:5.2f} deg (limit {bound}) ({elapsed / len(samples) * 1e6:.1f} us/sample)"
+              f"{'' if ok else '  FAILED'}")
+    return passed
+
+
+def bench_plot(frames=5000, old_frames=300, frame_budget=0.05):
+    """
+    Headless frame time and memory of the blitted LivePlot against the old
+    clear-and-replot animate() with ever-growing lists. A blitted frame
+    must take less than frame_budget seconds (one frame at 20 Hz), and
+    memory must stay flat: at most 10% more after all frames than after
+    the first tenth.
+    """
+    import tracemalloc
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from plot_V2 import LivePlot
+
+    random = np.random.default_rng(0)
+
+    # Old way: lists grow forever and every frame redraws the whole axes
+    fig, ax = plt.subplots()
+    xs, y1, y2, y3 = [], [], [], []
+    start = time.perf_counter()
+    for i in range(old_frames):
+        xs.append(i * 0.05)
+        for series in (y1, y2, y3):
+            series.append(random.uniform(-180, 180))
+        ax.clear()
+        ax.plot(xs, y1, label="Roll")
+        ax.plot(xs, y2, label="Pitch")
+        ax.plot(xs, y3, label="Yaw")
+        ax.grid()
+        ax.legend()
+        fig.canvas.draw()
+    report(f"clear + replot + draw (x{old_frames})", time.perf_counter() - start, old_frames)
+    plt.close(fig)
+
+    # Blitting: draw the static axes once, then only the three lines
+    fig, ax = plt.subplots()
+    plot = LivePlot(ax, "benchmark", window=200, interval=0.05)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(ax.bbox)
+    plot.init()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(frames):
+        lines = plot.add(i * 0.05, random.uniform(-180, 180, 3))
+        fig.canvas.restore_region(background)
+        for line in lines:
+            ax.draw_artist(line)
+        fig.canvas.blit(ax.bbox)
+        if i == frames // 10:
+            early_memory = tracemalloc.get_traced_memory()[0]
+    elapsed = time.perf_counter() - start
+    late_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    report(f"LivePlot blitted frame (x{frames})", elapsed, frames)
+    print(f"memory after {frames // 10} frames: {early_memory / 1024:.0f} KiB, "
+          f"after {frames}: {late_memory / 1024:.0f} KiB")
+    plt.close(fig)
+    return elapsed / frames < frame_budget and late_memory <= early_memory * 1.1
+
+
+def gantry_trace(rate_hz, distance=1.5, ramp=1.0, cruise=0.0, bias=0.03, noise=0.01, seed=0):
+    """
+    Simulated X acceleration for a gantry round trip: rest, move out
+    distance metres (ramp s speeding up, cruise s at constant speed, ramp
+    s slowing down), rest 2 s, move back the same way, rest. Includes a
+    constant bias and noise. Returns (times, accel, true_displacement).
+    """
+    import numpy as np
+    random = np.random.default_rng(seed)
+    peak = distance / (ramp * (ramp + cruise))  # accel for a trapezoidal speed profile
+    phases = [(1, 0), (ramp, peak), (cruise, 0), (ramp, -peak), (2, 0),
+              (ramp, -peak), (cruise, 0), (ramp, peak), (2, 0)]
+    t = np.arange(0, sum(length for length, _ in phases), 1 / rate_hz)
+    accel = np.zeros_like(t)
+    edge = 0
+    for length, value in phases:
+        accel[(t >= edge) & (t < edge + length)] = value
+        edge += length
+    velocity = np.cumsum(accel) / rate_hz
+    true_displacement = np.cumsum(velocity) / rate_hz
+    return t, accel + bias + random.normal(0, noise, len(t)), true_displacement
+
+
+def bench_displacement(tolerance=0.3, end_error=0.1):
+    """
+    Return-to-origin detection on simulated gantry trips at several sample
+    rates, speeding straight up and down and with a constant-speed cruise
+    in the middle (which must not be taken for standing still). 'away' must come within tolerance seconds of the true position
+    passing away_distance, 'returned' within 1 s plus tolerance of the
+    board stopping back at the start (it has to be seen sitting still),
+    and the final position must be within end_error metres of the truth.
+    """
+    import numpy as np
+    from displacement import DisplacementTracker, ReturnDetector
+
+    profiles = (("no cruise", {}), ("3 s cruise", dict(distance=2.0, ramp=0.5, cruise=3.0)))
+    passed = True
+    for (name, profile), rate_hz in [(profile, rate) for profile in profiles for rate in (10, 100, 400)]:
+        t, accel, truth = gantry_trace(rate_hz, **profile)
+        true_away = t[np.argmax(np.abs(truth) > 1.0)]
+        moving = np.abs(np.diff(truth)) * rate_hz > 1e-6  # faster than 1 um/s, above rounding
+        stopped = t[np.nonzero(moving)[0][-1] + 1]  # the trip's last movement ends here
+        # Bias is measured from the first second at rest, as at startup
+        tracker = DisplacementTracker(rate_hz=rate_hz, bias=np.mean(accel[:rate_hz]))
+        detector = ReturnDetector(away_distance=1.0, return_margin=0.3)
+        away_at = returned_at = None
+        start = time.perf_counter()
+        estimate = []
+        for ti, a in zip(t, accel):
+            estimate.append(tracker.update(a, ti))
+            state = detector.update(estimate[-1], tracker.still)
+            if state == "away" and away_at is None:
+                away_at = ti
+            if state == "returned" and returned_at is None:
+                returned_at = ti
+        elapsed = time.perf_counter() - start
+        error = np.abs(np.array(estimate) - truth).max()
+        final = abs(estimate[-1] - truth[-1])
+        ok = (away_at is not None and abs(away_at - true_away) <= tolerance
+              and returned_at is not None and stopped <= returned_at <= stopped + 1.0 + tolerance
+              and final <= end_error)
+        passed &= ok
+        away = "never" if away_at is None else f"{away_at:.2f} s"
+        returned = "never" if returned_at is None else f"{returned_at:.2f} s"
+        print(f"{name:<10} {rate_hz:4d} Hz  away at {away} (true {true_away:.2f} s), returned at {returned},"
+              f" max error {error:.3f} m, end error {final:.3f} m, {elapsed / len(t) * 1e6:.1f} us/sample"
+              f"{'' if ok else '  FAILED'}")
+    return bool(passed)
+
+
+STARTUP_BUDGET = 1.0  # seconds, for a cold "import sensor_calc_V2" on the Pi
+HARDWARE_MODULES = ("board", "busio", "adafruit_lsm6ds", "adafruit_lis3mdl", "picamera2")
+
+
+def bench_overlay(runs=20):
+    """Per-block ImageDraw rectangles versus one classify_blocks + render_overlay pass."""
+    import numpy as np
+    from PIL import Image, ImageDraw
+    from image_processor import classify_blocks, render_overlay, STATUS_NAMES
+
+    random = np.random.default_rng(0)
+    frame = random.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    initial = random.uniform(0, 300, (48, 64))
+    second = random.uniform(0, 300, (48, 64))
+    threshold = 70
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        image = Image.fromarray(frame)
+        draw = ImageDraw.Draw(image)
+        old_status = []
+        for y, (row1, row2) in enumerate(zip(initial, second)):
+            for x, (val1, val2) in enumerate(zip(row1, row2)):
+                if val1 - val2 > threshold:
+                    old_status.append("Outage")
+                    draw.rectangle([(x*10, y*10), (x*10+10, y*10+10)], width=2, fill=(255, 0, 0, 100))
+                elif val2 - val1 > (threshold+90):
+                    old_status.append("Restored")
+                    draw.rectangle([(x*10, y*10), (x*10+10, y*10+10)], width=2, fill=(0, 255, 0, 100))
+                else:
+                    old_status.append("Same")
+    report(f"per-block rectangles (x{runs})", time.perf_counter() - start, runs)
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        status = classify_blocks(initial, second, threshold)
+        render_overlay(frame, status, 10)
+    report(f"classify + render_overlay (x{runs})", time.perf_counter() - start, runs)
+
+    same = old_status == [STATUS_NAMES[code] for code in status.ravel()]
+    print("classification matches old loop:", same)
+    return same
+
+
+def bench_grids(runs=300):
+    """Writing and reading a month of block grids as per-cell CSV versus .npy grid files."""
+    import csv
+    import numpy as np
+    from image_processor import classify_blocks, STATUS_NAMES
+    from block_grid import save_grid, load_grids
+
+    random = np.random.default_rng(0)
+    initial = random.uniform(0, 300, (48, 64))
+    second = random.uniform(0, 300, (48, 64))
+    status = classify_blocks(initial, second, 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_paths = [os.path.join(tmp, f"run_{i}.csv") for i in range(runs)]
+        grid_paths = [os.path.join(tmp, f"run_{i}.npy") for i in range(runs)]
+
+        # Old format: one text row per block
+        start = time.perf_counter()
+        for path in csv_paths:
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["Block Row", "Block Column", "Status"])
+                for (i, j), code in np.ndenumerate(status):
+                    writer.writerow([i, j, STATUS_NAMES[code]])
+        report(f"write per-cell CSV (x{runs})", time.perf_counter() - start, runs)
+
+        start = time.perf_counter()
+        for path in grid_paths:
+            save_grid(path, initial=initial, second=second, status=status)
+        report(f"write .npy grid (x{runs})", time.perf_counter() - start, runs)
+
+        start = time.perf_counter()
+        from_csv = np.zeros((runs,) + status.shape, dtype=np.uint8)
+        for n, path in enumerate(csv_paths):
+            with open(path, newline="") as file:
+                reader = csv.reader(file)
+                next(reader)
+                for row, col, name in reader:
+                    from_csv[n, int(row), int(col)] = STATUS_NAMES.index(name)
+        report(f"load status from CSV (x{runs})", time.perf_counter() - start, runs)
+
+        start = time.perf_counter()
+        from_grid = load_grids(grid_paths, "status")
+        report(f"load status from .npy grids (x{runs})", time.perf_counter() - start, runs)
+
+        csv_bytes = sum(os.path.getsize(path) for path in csv_paths)
+        grid_bytes = sum(os.path.getsize(path) for path in grid_paths)
+        print(f"CSV {csv_bytes / runs:.0f} bytes/run (status only), "
+              f".npy {grid_bytes / runs:.0f} bytes/run (status + both brightness grids)")
+        same = bool(np.array_equal(from_csv, from_grid))
+        print("loaded status matches:", same)
+        return same
+
+
+def bench_store(runs=300):
+    """Appending runs to the brightness store and querying them, versus re-reading every CSV."""
+    import csv
+    import numpy as np
+    from image_processor import classify_blocks, OUTAGE, STATUS_NAMES
+    from block_grid import make_grid, grid_to_csv
+    from brightness_store import BrightnessStore
+
+    random = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BrightnessStore(os.path.join(tmp, "brightness.db"))
+        csv_paths = []
+        start = time.perf_counter()
+        for n in range(runs):
+            initial = random.uniform(0, 300, (48, 64))
+            second = random.uniform(0, 300, (48, 64))
+            grid = make_grid(initial=initial, second=second, status=classify_blocks(initial, second, 70))
+            store.add_run(1740000000 + 600 * n, grid, f"run_{n}")
+            csv_paths.append(os.path.join(tmp, f"run_{n}.csv"))
+            grid_to_csv(make_grid(status=grid["status"]), csv_paths[-1])
+        report(f"add_run + write CSV (x{runs})", time.perf_counter() - start, runs)
+
+        # "Which blocks went dark in this hour", by scanning files and by query
+        begin, end = 1740000000 + 600 * 100, 1740000000 + 600 * 106
+        start = time.perf_counter()
+        from_files = []
+        for n, path in enumerate(csv_paths):
+            with open(path, newline="") as file:
+                reader = csv.reader(file)
+                next(reader)
+                for row, col, name in reader:
+                    if begin <= 1740000000 + 600 * n < end and name == STATUS_NAMES[OUTAGE]:
+                        from_files.append((1740000000 + 600 * n, int(row), int(col)))
+        report("one hour of outages from CSV files", time.perf_counter() - start)
+        start = time.perf_counter()
+        from_store = store.blocks_with_status(OUTAGE, begin, end)
+        report("one hour of outages from the store", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        times, values = store.block_history(20, 30, "second")
+        report(f"history of one block over {runs} runs", time.perf_counter() - start)
+        store.close()
+        same = [tuple(map(float, r)) for r in from_files] == [tuple(map(float, r)) for r in from_store]
+        print("query matches file scan:", same)
+        return same
+
+
+def city_scene(height=480, width=640, lights=150, seed=0):
+    """Synthetic night-time frame: dim background with Gaussian blobs of light."""
+    import numpy as np
+
+    random = np.random.default_rng(seed)
+    scene = np.full((height, width), 20.0)
+    for _ in range(lights):
+        cy, cx = random.uniform(0, height), random.uniform(0, width)
+        size, level = random.uniform(2, 8), random.uniform(80, 230)
+        top, bottom = int(max(cy - 4 * size, 0)), int(min(cy + 4 * size, height))
+        left, right = int(max(cx - 4 * size, 0)), int(min(cx + 4 * size, width))
+        y, x = np.mgrid[top:bottom, left:right]
+        scene[top:bottom, left:right] += level * np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / (2 * size ** 2))
+    scene += random.normal(0, 2, scene.shape)
+    return np.clip(scene, 0, 255).astype(np.uint8)
+
+
+def bench_registration(runs=20):
+    """
+    Shift recovery on synthetic frames, and false outages with and without
+    aligning the second frame first.
+    """
+    import numpy as np
+    from Feb25Cube import analyze_brightness_frame
+    from image_processor import classify_blocks, SAME
+    from registration import align, estimate_shift
+
+    pad = 40
+    scene = city_scene(480 + 2 * pad, 640 + 2 * pad)
+    initial = scene[pad:-pad, pad:-pad]
+    initial_blocks = analyze_brightness_frame(initial)
+    passed = True
+    for dy, dx in [(0, 0), (1, -1), (3, 2), (-6, 4), (9, -12), (-20, 25)]:
+        # Camera moved by (dy, dx): the second frame sees the scene offset the other way
+        second = scene[pad + dy:pad + dy + 480, pad + dx:pad + dx + 640]
+        found = estimate_shift(initial, second)
+        unaligned = classify_blocks(initial_blocks, analyze_brightness_frame(second), 70)
+        aligned = classify_blocks(initial_blocks, analyze_brightness_frame(align(initial, second)[0]), 70)
+        ok = abs(found[0] + dy) < 0.5 and abs(found[1] + dx) < 0.5 and np.all(aligned == SAME)
+        passed &= bool(ok)
+        print(f"camera moved ({dy:3d}, {dx:3d})  found ({found[0]:6.2f}, {found[1]:6.2f})  "
+              f"false outages/restorations {np.count_nonzero(unaligned != SAME):4d} -> "
+              f"{np.count_nonzero(aligned != SAME)}  {'ok' if ok else 'FAIL'}")
+
+    # A real outage must survive alignment
+    dark = scene.copy()
+    dark[pad + 200:pad + 260, pad + 300:pad + 380] = 20
+    second = dark[pad + 4:pad + 484, pad - 3:pad + 637]
+    status = classify_blocks(initial_blocks, analyze_brightness_frame(align(initial, second)[0]), 70)
+    kept = bool(np.any(status[20:26, 30:38] != SAME))
+    print("real outage still detected after alignment:", kept)
+    passed &= kept
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        align(initial, second)
+    report(f"estimate shift + align (x{runs})", time.perf_counter() - start, runs)
+    return passed
+
+
+def bench_pyramid(runs=20):
+    """Full-grid block comparison versus coarse-to-fine detection on a summed-area pyramid."""
+    import numpy as np
+    from image_processor import block_means, classify_blocks, BlockPyramid, detect_outages
+
+    initial = city_scene(seed=1)
+    second = initial.copy()
+    for top, left in [(100, 200), (300, 500), (400, 40)]:
+        second[top:top + 12, left:left + 12] = 0  # a few small lights go out
+    scale_a, scale_b = 100 / initial.mean(), 100 / second.mean()
+
+    passed = True
+    for sizes in [(40, 20, 10), (40, 20, 10, 5), (40, 20, 10, 5, 1)]:
+        finest = sizes[-1]
+        start = time.perf_counter()
+        for _ in range(runs):
+            full = classify_blocks(block_means(initial, finest) * scale_a, block_means(second, finest) * scale_b, 70)
+        report(f"full grid, {finest} px blocks (x{runs})", time.perf_counter() - start, runs)
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            status, refined = detect_outages(BlockPyramid(initial, True), BlockPyramid(second, True), 70, sizes)
+        report(f"pyramid {sizes} (x{runs})", time.perf_counter() - start, runs)
+        same = bool(np.array_equal(status, full))
+        passed &= same
+        print(f"    refined {refined:.1%} of the finest blocks, same result: {same}")
+
+    # Part of the frame going dark raises every normalized block, a light
+    # going out next to one coming on cancels in the coarse mean, and
+    # edge blocks of an odd-sized frame have cut-off children
+    rng = np.random.default_rng(0)
+    noisy = rng.integers(0, 256, (95, 33)).astype(np.uint8)
+    shifted = noisy.copy()
+    shifted[7:27, 12:32] = 0
+    shifted[60:65, 20:24] = 255
+    flat = np.full((480, 640), 100, dtype=np.uint8)
+    swapped = flat.copy()
+    swapped[0:10, 0:10] = 0
+    swapped[0:10, 10:20] = 200
+    ragged = rng.integers(90, 110, (483, 647)).astype(np.uint8)
+    edge = ragged.copy()
+    edge[480:483, 640:647] = 0
+    for name, initial, second in (("shifted frame", noisy, shifted), ("swapped lights", flat, swapped),
+                                  ("ragged edge", ragged, edge)):
+        first, later = BlockPyramid(initial, True), BlockPyramid(second, True)
+        for sizes in [(40, 20, 10), (40, 20, 10, 5, 1)]:
+            full = classify_blocks(first.means(sizes[-1]), later.means(sizes[-1]), 70)
+            status, refined = detect_outages(first, later, 70, sizes)
+            same = bool(np.array_equal(status, full))
+            passed &= same
+            print(f"  {name}, {sizes[-1]} px: {np.count_nonzero(full)} blocks changed, "
+                  f"pyramid found {np.count_nonzero(status)}, same result: {same}")
+    return passed
+
+
+def bench_monitor(frames=300):
+    """
+    Rolling-baseline monitor on a simulated night: one light goes out and
+    comes back, with sensor noise and a slow overall brightness drift.
+    """
+    import numpy as np
+    from image_processor import BlockPyramid, block_means, OUTAGE, SAME, STATUS_NAMES
+    from camera_session import CameraSession, FakeCamera
+    from monitor import BaselineMonitor, run_monitor
+
+    random = np.random.default_rng(0)
+    scene = city_scene(seed=2).astype(np.float32)
+    # Turn off the brightest 20x20 pixel patch (2x2 blocks)
+    means = block_means(scene, 20)
+    row, col = np.unravel_index(np.argmax(means), means.shape)
+    light = (slice(20 * row, 20 * row + 20), slice(20 * col, 20 * col + 20))
+    blocks = {(2 * row + r, 2 * col + c) for r in (0, 1) for c in (0, 1)}
+    monitor = BaselineMonitor()
+    events = []
+    start = time.perf_counter()
+    for n in range(frames):
+        frame = scene * (1 + 0.1 * np.sin(n / 50)) + random.normal(0, 3, scene.shape)
+        if 100 <= n < 200:
+            frame[light] = 20
+        grid = BlockPyramid(np.clip(frame, 0, 255).astype(np.uint8), normalize=True).means(10)
+        events += [(n,) + event[1:] for event in monitor.update(grid, t=n)]
+    report(f"simulate + analyze + update (x{frames})", time.perf_counter() - start, frames)
+
+    for event in events:
+        print(f"frame {event[0]:3d}  block ({event[1]}, {event[2]}): "
+              f"{STATUS_NAMES[event[3]]} -> {STATUS_NAMES[event[4]]}")
+    went_out = {(r, c) for n, r, c, old, new in events if new == OUTAGE and 100 <= n <= 102}
+    came_back = {(r, c) for n, r, c, old, new in events if old == OUTAGE and new == SAME and 200 <= n <= 202}
+    only_those = all((r, c) in blocks for n, r, c, old, new in events)
+    passed = bool(went_out) and went_out == came_back and only_those
+
+    # Paced capture on the fake camera: does it hold the target rate?
+    session = CameraSession(FakeCamera(frame_time=0), size=(640, 480))
+    session.start()
+    count, seconds = run_monitor(session, BaselineMonitor(), fps=10, duration=2, on_event=lambda event: None)
+    session.close()
+    print(f"run_monitor at 10 fps target: {count / seconds:.2f} fps")
+    print("events only on transitions of the dimmed light:", passed)
+    return passed
+
+
+def bench_pipeline(items=40):
+    """
+    Sequential capture -> analyze -> write -> upload versus the staged
+    pipeline, with sleeps standing in for each step's cost.
+    """
+    from pipeline import Pipeline, BLOCK, DROP_OLDEST
+
+    costs = {"capture": 0.03, "analyze": 0.06, "write": 0.02, "upload": 0.01}
+
+    def step(name):
+        def run(item):
+            time.sleep(costs[name])
+            return item
+        return run
+
+    start = time.perf_counter()
+    for n in range(items):
+        for name in costs:
+            step(name)(n)
+    sequential = time.perf_counter() - start
+    report(f"sequential, per item (x{items})", sequential, items)
+
+    produced = iter(range(items))
+    capture = lambda: time.sleep(costs["capture"]) or next(produced, None)
+    pipeline = Pipeline(capture)
+    pipeline.add_stage("analyze", step("analyze"), workers=2, queue_size=4, policy=BLOCK)
+    pipeline.add_stage("write", step("write"))
+    pipeline.add_stage("upload", step("upload"))
+    start = time.perf_counter()
+    pipeline.start().join()
+    staged = time.perf_counter() - start
+    report(f"pipeline, 2 analysis workers (x{items})", staged, items)
+    pipeline.report()
+    complete = pipeline.metrics()["upload"]["count"] == items
+
+    # One slow analysis worker and a drop-oldest queue: capture never waits
+    produced = iter(range(items))
+    pipeline = Pipeline(capture)
+    pipeline.add_stage("analyze", step("analyze"), workers=1, queue_size=2, policy=DROP_OLDEST)
+    pipeline.add_stage("write", step("write"))
+    start = time.perf_counter()
+    pipeline.start().join()
+    report(f"pipeline, 1 worker, drop oldest (x{items})", time.perf_counter() - start, items)
+    metrics = pipeline.metrics()
+    print(f"    analysed {metrics['analyze']['count']}, dropped {metrics['analyze']['dropped']}")
+    accounted = metrics["analyze"]["count"] + metrics["analyze"]["dropped"] == items
+    print(f"speed-up {sequential / staged:.1f}x, every item accounted for: {complete and accounted}")
+    return complete and accounted
+
+
+def bench_metrics(calls=200000):
+    """
+    Cost of a @timed call with metrics off and on, and a check that the
+    rendered histogram counts every call.
+    """
+    import metrics
+
+    def bare(x):
+        return x
+
+    wrapped = metrics.timed("bench")(bare)
+    was_enabled = metrics.enabled()
+    metrics.disable()
+    start = time.perf_counter()
+    for n in range(calls):
+        bare(n)
+    base = time.perf_counter() - start
+    start = time.perf_counter()
+    for n in range(calls):
+        wrapped(n)
+    off = time.perf_counter() - start
+    report(f"plain call (x{calls})", base, calls)
+    report(f"@timed, metrics off (x{calls})", off, calls)
+
+    metrics.enable()
+    registry, metrics.registry = metrics.registry, metrics.Registry()
+    try:
+        start = time.perf_counter()
+        for n in range(calls):
+            wrapped(n)
+        report(f"@timed, metrics on (x{calls})", time.perf_counter() - start, calls)
+        text = metrics.registry.render()
+    finally:
+        metrics.registry = registry
+        if not was_enabled:
+            metrics.disable()
+    counted = f'flatsat_step_seconds_count{{step="bench"}} {calls}' in text
+    overhead = (off - base) / calls * 1e9
+    print(f"overhead while off: {overhead:.0f} ns per call, all calls counted: {counted}")
+    return counted and overhead < 1000
+
+
+def bench_motion(seconds=1.0):
+    """
+    Idle CPU use of the old tight acceleration loop versus the polling and
+    wake-up triggers, and how soon each trigger reports a simulated shake.
+    """
+    import numpy as np
+    from motion_trigger import WakeupTrigger, PollingTrigger, SimulatedLSM6DSOX, idle_cpu
+
+    still = SimulatedLSM6DSOX(noise=0.02, seed=0)
+    wall = time.monotonic()
+    cpu = time.process_time()
+    while time.monotonic() - wall < seconds:
+        accelx, accely, accelz = still.acceleration
+    print(f"{'tight loop, idle CPU':<40} {(time.process_time() - cpu) / seconds:10.1%}")
+
+    shake_at = 0.5
+
+    def shake(t):
+        accel = 4.0 * np.sin(2 * np.pi * 5 * (t - shake_at)) if shake_at < t < shake_at + 0.5 else 0.0
+        return (accel, 0.0, 9.81), (0.0, 0.0, 0.0), (20.0, 0.0, -40.0)
+
+    ok = True
+    for name, make in (("polling trigger", PollingTrigger), ("wake-up trigger", WakeupTrigger)):
+        cpu = idle_cpu(make(SimulatedLSM6DSOX(noise=0.02, seed=0)), seconds)
+        sensor = SimulatedLSM6DSOX(shake, noise=0.02, seed=0)
+        event = make(sensor).wait(timeout=2.0)
+        latency = None if event is None else time.monotonic() - sensor.start_time - shake_at
+        print(f"{name + ', idle CPU':<40} {cpu:10.1%}")
+        print(f"{name + ', shake reported after':<40} "
+              + ("never" if latency is None else f"{latency * 1000:10.0f} ms"))
+        ok = ok and latency is not None and latency < 0.3 and cpu < 0.1
+    return ok
+
+
+def bench_burst(pre=15, post=15, fps=30):
+    """
+    Burst around a trigger on the fake camera: the frames saved must span
+    the trigger, the stream must keep its frame rate while the burst is
+    written, and memory must not grow with more triggers.
+    """
+    import numpy as np
+    from camera_session import CameraSession, FakeCamera
+    from burst_capture import BurstRecorder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        session = CameraSession(FakeCamera(size=(640, 480), frame_time=1 / fps), size=(640, 480))
+        recorder = BurstRecorder(session, pre, post).start()
+        time.sleep(1.0)  # Let the ring fill
+        bursts = []
+        ring_bytes = recorder.ring.frames.nbytes
+        for n in range(3):
+            seen = recorder.frames_seen
+            start = time.monotonic()
+            burst = recorder.trigger(os.path.join(tmp, f"burst{n}"))
+            burst.wait(10)
+            elapsed = time.monotonic() - start
+            stream_fps = (recorder.frames_seen - seen) / elapsed
+            bursts.append(burst)
+            before = sum(t < burst.trigger_time for t in burst.times)
+            print(f"burst {n}: {len(burst.paths)} frames, {before} before the trigger, "
+                  f"{burst.times[0] - burst.trigger_time:+.2f} s to {burst.times[-1] - burst.trigger_time:+.2f} s, "
+                  f"stream at {stream_fps:.0f} fps while saving")
+        recorder.stop()
+
+    print(f"ring of {pre} frames: {ring_bytes / 1e6:.1f} MB, unchanged: {recorder.ring.frames.nbytes == ring_bytes}")
+    print("old way: first still 2.00 s after the shake, nothing from before it")
+    return all(len(b.paths) == pre + post and b.times[0] < b.trigger_time < b.times[pre] for b in bursts) \
+        and stream_fps > fps * 0.8
+
+
+def bench_angle(targets=(10, 20, 30, 40, 50)):
+    """
+    Shots during a fast sweep: the old "within 2 degrees of the target"
+    check against ShutterScheduler, which predicts the crossing time.
+    """
+    import numpy as np
+    from angle_trigger import ShutterScheduler
+
+    random = np.random.default_rng(0)
+
+    def sweep(t):
+        # Speeds up from 60 to 180 deg/s across the targets
+        return 60 * t + 30 * t * t, 60 + 60 * t
+
+    ok = True
+    for rate_hz in (10, 50):
+        times = np.arange(0, 1.5, 1 / rate_hz)
+        old_hits = {}
+        scheduler = ShutterScheduler(targets, 1 / rate_hz)
+        errors = []
+        for t in times:
+            angle, rate = sweep(t)
+            angle += random.normal(0, 0.1)
+            rate += random.normal(0, 1.0)
+            for target in targets:
+                if target not in old_hits and abs(angle - target) <= 2:
+                    old_hits[target] = sweep(t)[0] - target
+            for fire_at, target in scheduler.update(t, angle, rate):
+                errors.append(sweep(fire_at)[0] - target)
+        old_errors = np.abs(list(old_hits.values())) if old_hits else np.array([np.nan])
+        errors = np.abs(errors)
+        print(f"{rate_hz:3d} Hz  margin check: {len(old_hits)}/{len(targets)} shots, "
+              f"worst {old_errors.max():.2f} deg;  predicted: {len(errors)}/{len(targets)} shots, "
+              f"worst {errors.max():.2f} deg")
+        ok = ok and len(errors) == len(targets) and errors.max() < 1.0
+    return ok
+
+
+def bench_calibration():
+    """
+    Startup with an empty calibration store (full calibration) and again
+    with the saved calibration and its quick check, on a simulated IMU.
+    Also checks the store's temperature matching, that the check catches
+    a moved hard-iron offset and that a reader of the IMU service finds
+    the calibration saved for the sensors themselves.
+    """
+    import numpy as np
+    import sensor_calc_V2
+    from calibration import CalibrationStore, check_calibration, device_key
+    from imu_service import SimulatedIMU, IMUService
+
+    offset = np.array([12.0, -7.0, 3.0])
+
+    def motion(t):
+        # Turned and tilted for the magnetometer calibration, then put down
+        angle = 2 * np.pi * t if t < 8 else 0.0
+        tilt = 0.9 * np.sin(3 * angle)
+        field = offset + 40 * np.array([np.cos(angle) * np.cos(tilt), np.sin(angle) * np.cos(tilt), np.sin(tilt)])
+        return (0.0, 0.0, 9.81), (0.01, -0.02, 0.005), tuple(field)
+
+    sensor = SimulatedIMU(motion, noise=0.002, seed=0, temperature=25.0)
+    saved = sensor_calc_V2.accel_gyro, sensor_calc_V2.mag
+    sensor_calc_V2.use_imu(sensor, sensor)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "store.json")
+            start = time.perf_counter()
+            first = sensor_calc_V2.calibrated_start(path=path)
+            report("startup, no saved calibration", time.perf_counter() - start)
+            start = time.perf_counter()
+            second = sensor_calc_V2.calibrated_start(path=path)
+            report("startup, saved calibration + check", time.perf_counter() - start)
+
+            # As in a child process of new_trial.py, reading through the service
+            with IMUService(sensor, sensor, rate_hz=200) as service:
+                reader = service.reader()
+                sensor_calc_V2.use_imu(reader, reader)
+                entries = len(CalibrationStore(path).entries())
+                third = sensor_calc_V2.calibrated_start(path=path)
+                shared = (device_key(reader, reader) == device_key(sensor, sensor) and reader.temperature == 25.0
+                          and len(CalibrationStore(path).entries()) == entries and np.allclose(third[0], first[0]))
+                reader.close()
+
+            store = CalibrationStore(path, max_temp_diff=5.0)
+            store.save("board", 20.0, mag_offset=[0, 0, 0], gyro_offset=[0, 0, 0])
+            store.save("board", 40.0, mag_offset=[1, 1, 1], gyro_offset=[0, 0, 0])
+            by_temperature = (store.lookup("board", 22.0)["temperature"] == 20.0
+                              and store.lookup("board", 37.0)["temperature"] == 40.0
+                              and store.lookup("board", 30.0) is None)
+            entry = store.lookup("board", 20.0)
+            entry = dict(entry, mag_offset=offset.tolist(), mag_field=40.0)
+            gyro = np.random.default_rng(0).normal(0, 0.001, (50, 3))
+            still = offset + [40.0, 0.0, 0.0]
+            good, _ = check_calibration(entry, gyro, np.tile(still, (50, 1)))
+            moved, reason = check_calibration(entry, gyro, np.tile(still + [15.0, 0, 0], (50, 1)))
+    finally:
+        sensor_calc_V2.use_imu(*saved)
+
+    same = np.allclose(first[0], second[0]) and np.allclose(first[1], second[1])
+    print(f"mag offset {np.round(first[0], 1)} (true {offset}), reused: {same}")
+    print(f"temperature matching: {by_temperature}, moved offset caught: {not moved} ({reason})")
+    print(f"IMU service reader found the saved calibration: {shared}")
+    return same and np.allclose(first[0], offset, atol=1.0) and by_temperature and good and not moved and shared
+
+
+def bench_ellipsoid(samples=1500):
+    """
+    Min/max midpoints against the ellipsoid fit on synthetic magnetometer
+    data with known hard and soft iron: offset error, spread of the
+    corrected field strength and level heading error. Also times feeding
+    and solving the fit, the numbers that matter on the Pi.
+    """
+    import numpy as np
+    from attitude import yaw_am
+    from calibration import MagCalibrator, EllipsoidCalibrator, apply_mag_calibration
+    from orientation import wrap_angle
+
+    random = np.random.default_rng(0)
+    field = 45.0 * np.array([np.cos(np.radians(60)), 0.0, np.sin(np.radians(60))])  # uT, 60 deg dip
+    soft = np.array([[1.15, 0.08, 0.03], [0.08, 0.88, -0.06], [0.03, -0.06, 1.02]])
+    hard = np.array([22.0, -14.0, 9.0])
+
+    def rotation(roll, pitch, yaw):
+        cr, sr, cp, sp, cy, sy = np.cos(roll), np.sin(roll), np.cos(pitch), np.sin(pitch), np.cos(yaw), np.sin(yaw)
+        rx = np.array([[1, 0, 0], [0, cr, -sr], [0, sr, cr]])
+        ry = np.array([[cp, 0, sp], [0, 1, 0], [-sp, 0, cp]])
+        rz = np.array([[cy, -sy, 0], [sy, cy, 0], [0, 0, 1]])
+        return rz @ ry @ rx
+
+    def board_fields(n, tilt):
+        angles = np.column_stack((random.uniform(-tilt, tilt, n), random.uniform(-tilt, tilt, n),
+                                  random.uniform(-np.pi, np.pi, n)))
+        return np.array([rotation(*a).T @ field for a in angles])
+
+    def measure(true, noise=0.3):
+        return true @ soft.T + hard + random.normal(0, noise, true.shape)
+
+    headings = np.radians(np.arange(0, 360, 5))
+    level_true = np.array([rotation(0, 0, h).T @ field for h in headings])
+    level_measured = measure(level_true, noise=0.0)  # Noise-free, so only calibration error shows
+    true_yaw = np.array([yaw_am(0, 0, 9.81, *b) for b in level_true])
+
+    ok = True
+    for name, tilt in (("tumbled", np.pi), ("turned, tilted +-30 deg", np.radians(30))):
+        readings = measure(board_fields(samples, tilt))
+        results = {}
+        midpoint = MagCalibrator()
+        for reading in readings:
+            midpoint.add(reading)
+        ellipsoid = EllipsoidCalibrator()
+        start = time.perf_counter()
+        for reading in readings:
+            ellipsoid.add(reading)
+        feed = time.perf_counter() - start
+        start = time.perf_counter()
+        ellipsoid.fit()
+        solve = time.perf_counter() - start
+        for label, offset, matrix in (("min/max", midpoint.offset(), None),
+                                      ("ellipsoid", ellipsoid.offset(), ellipsoid.matrix())):
+            corrected = apply_mag_calibration(readings, offset, matrix)
+            strength = np.linalg.norm(corrected, axis=1)
+            level = apply_mag_calibration(level_measured, offset, matrix)
+            yaw = np.array([yaw_am(0, 0, 9.81, *b) for b in level])
+            heading_error = np.abs(wrap_angle(yaw - true_yaw)).max()
+            results[label] = heading_error
+            print(f"{name:<24} {label:<10} offset error {np.linalg.norm(np.array(offset) - hard):5.2f} uT, "
+                  f"field spread {strength.std() / strength.mean():6.2%}, worst heading error {heading_error:5.2f} deg")
+        report(f"{name}: ellipsoid add() per sample", feed, samples)
+        report(f"{name}: ellipsoid solve", solve)
+        ok = ok and results["ellipsoid"] < results["min/max"] and results["ellipsoid"] < 1.0
+
+    start = time.perf_counter()
+    EllipsoidCalibrator().add_batch(readings)
+    report(f"add_batch of {samples} samples", time.perf_counter() - start)
+
+    # A board lying still or only turned flat must not give a fit
+    for name, tilt, turn in (("lying still", 0.0, 0.0), ("turned flat", 0.0, np.pi)):
+        angles = np.column_stack((np.zeros(samples), np.zeros(samples), random.uniform(-turn, turn, samples)))
+        readings = measure(np.array([rotation(*a).T @ field for a in angles]))
+        ellipsoid = EllipsoidCalibrator()
+        ellipsoid.add_batch(readings)
+        rejected = ellipsoid.fit() is None
+        print(f"{name:<24} fit rejected: {rejected}")
+        ok = ok and rejected
+    return bool(ok)
+
+
+def bench_startup(runs=5):
+    """
+    Import time of the modules offline scripts rely on, each in a fresh
+    interpreter. Fails if an import opens hardware or is over budget.
+    """
+    import subprocess
+    ok = True
+    for module in ("attitude", "sensor_calc_V2", "image_processor"):
+        code = ("import sys, time; t = time.perf_counter(); import " + module + "; "
+                "print(time.perf_counter() - t); "
+                "print(','.join(m for m in " + repr(HARDWARE_MODULES) + " if m in sys.modules))")
+        times = []
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            if result.returncode != 0:
+                print(f"import {module} failed:\n{result.stderr}")
+                return False
+            seconds, loaded = result.stdout.splitlines()
+            times.append(float(seconds))
+        best = min(times)
+        report(f"import {module} (best of {runs})", best)
+        if loaded:
+            print(f"  FAIL: import {module} loaded hardware modules: {loaded}")
+            ok = False
+        if best > STARTUP_BUDGET:
+            print(f"  FAIL: over the {STARTUP_BUDGET} s startup budget")
+            ok = False
+    return ok
+
+
+BENCHMARKS = {
+    "block_means": bench_block_means,
+    "camera": bench_camera,
+    "luminance": bench_luminance,
+    "uploader": bench_uploader,
+    "startup": bench_startup,
+    "attitude": bench_attitude,
+    "orientation": bench_orientation,
+    "plot": bench_plot,
+    "displacement": bench_displacement,
+    "overlay": bench_overlay,
+    "grids": bench_grids,
+    "store": bench_store,
+    "registration": bench_registration,
+    "pyramid": bench_pyramid,
+    "monitor": bench_monitor,
+    "pipeline": bench_pipeline,
+    "metrics": bench_metrics,
+    "motion": bench_motion,
+    "burst": bench_burst,
+    "angle": bench_angle,
+    "calibration": bench_calibration,
+    "ellipsoid": bench_ellipsoid,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:]
+    if not names:
+        print("Available benchmarks: " + ", ".join(BENCHMARKS))
+    failed = []
+    for name in names:
+        print(f"== {name}")
+        if BENCHMARKS[name]() is False:
+            failed.append(name)
+    if failed:
+        print("Failed: " + ", ".join(failed))
+        sys.exit(1)
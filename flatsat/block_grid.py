@@ -0,0 +1,137 @@
+"""
+Compact storage for block brightness grids. One grid is saved as a
+single .npy file holding a structured array with one record per block,
+e.g. initial and second brightness as float32 and the status code as
+uint8. Files open memory-mapped, so loading many runs only reads the
+bytes that are used, and any numpy install can read them.
+
+CSV is still available as a converter:
+    python3 block_grid.py to-csv brightness_diff_<ts>.npy [...]
+    python3 block_grid.py from-csv brightness_diff_<ts>.csv [...]
+"""
+
+import csv
+import os
+import sys
+import numpy as np
+from image_processor import STATUS_NAMES
+
+# Storage type of each known column, anything else is float32 brightness
+COLUMN_TYPES = {"status": np.uint8}
+DEFAULT_TYPE = np.float32
+
+
+def grid_dtype(names):
+    """Structured dtype for one block record with the given columns."""
+    return np.dtype([(name, COLUMN_TYPES.get(name, DEFAULT_TYPE)) for name in names])
+
+
+def make_grid(**columns):
+    """
+    Packs same-shaped (rows, cols) arrays into one structured grid.
+
+    Example: make_grid(initial=initial_brightness, second=second_brightness, status=status)
+    """
+    if not columns:
+        raise ValueError("a grid needs at least one column")
+    arrays = {name: np.asarray(values) for name, values in columns.items()}
+    shape = next(iter(arrays.values())).shape
+    grid = np.empty(shape, dtype=grid_dtype(arrays))
+    for name, values in arrays.items():
+        if values.shape != shape:
+            raise ValueError(f"column {name} has shape {values.shape}, expected {shape}")
+        grid[name] = values
+    return grid
+
+
+def save_grid(path, **columns):
+    """Saves (rows, cols) arrays as one .npy grid file and returns its path."""
+    return write_grid(path, make_grid(**columns))
+
+
+def write_grid(path, grid):
+    """Saves a grid from make_grid() and returns its path."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.save(file, grid)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_grid(path, mmap=True):
+    """
+    Opens a grid file. With mmap the data is paged in from disk as it is
+    used and the array is read-only. grid["status"] etc. give the columns.
+    """
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def load_grids(paths, column=None):
+    """
+    Stacks many grids of the same shape into one (n, rows, cols) array,
+    optionally of a single column, e.g. load_grids(paths, "status").
+    """
+    grids = [load_grid(path) for path in paths]
+    if column is not None:
+        grids = [grid[column] for grid in grids]
+    return np.stack(grids) if grids else np.empty((0, 0, 0))
+
+
+def grid_to_csv(grid, csv_filename):
+    """
+    Writes a grid as CSV, one row per block. Status codes are written as
+    their names, so a status-only grid gives back the old
+    "Block Row, Block Column, Status" layout.
+    """
+    names = grid.dtype.names
+    header = ["Block Row", "Block Column"] + ["Status" if name == "status" else name for name in names]
+    columns = [np.array(STATUS_NAMES)[grid[name]] if name == "status" else grid[name] for name in names]
+    rows, cols = np.indices(grid.shape)
+    with open(csv_filename, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(zip(rows.ravel(), cols.ravel(), *(column.ravel().tolist() for column in columns)))
+
+
+def csv_to_grid(csv_filename):
+    """
+    Reads a block CSV (as written by grid_to_csv or the old
+    save_brightness_to_csv) back into a grid.
+    """
+    with open(csv_filename, newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        records = list(reader)
+    if header[:2] != ["Block Row", "Block Column"]:
+        raise ValueError(f"{csv_filename} is not a block grid CSV")
+    names = ["status" if name == "Status" else name for name in header[2:]]
+    index = np.array([(int(r[0]), int(r[1])) for r in records], dtype=int).reshape(-1, 2)
+    shape = tuple(index.max(axis=0) + 1) if len(index) else (0, 0)
+    columns = {}
+    for k, name in enumerate(names, start=2):
+        values = [r[k] for r in records]
+        if name == "status":
+            values = [STATUS_NAMES.index(v) for v in values]
+        column = np.zeros(shape, dtype=COLUMN_TYPES.get(name, DEFAULT_TYPE))
+        column[index[:, 0], index[:, 1]] = values
+        columns[name] = column
+    return make_grid(**columns)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[0] not in ("to-csv", "from-csv"):
+        print(__doc__)
+        return 1
+    for path in argv[1:]:
+        stem = os.path.splitext(path)[0]
+        if argv[0] == "to-csv":
+            grid_to_csv(load_grid(path), stem + ".csv")
+            print(f"Wrote {stem}.csv")
+        else:
+            write_grid(stem + ".npy", csv_to_grid(path))
+            print(f"Wrote {stem}.npy")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,285 @@
+"""
+Time-series store for block brightness grids. Every run (one comparison
+or one photo) is appended to a local SQLite database with its timestamp,
+and every block of its grid is a row keyed by (run, block row, block
+column). Indexes on time and on block position make both "what happened
+to block (12, 30) over the last week" and "which blocks went dark
+between 22:00 and 23:00" single queries instead of parsing every file.
+
+    python3 brightness_store.py import [files...]   (default: all existing data)
+    python3 brightness_store.py dark "2025-02-26 22:00" "2025-02-26 23:00"
+    python3 brightness_store.py history ROW COL
+"""
+
+import ast
+import csv
+import glob
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+import numpy as np
+from image_processor import OUTAGE, STATUS_NAMES
+from block_grid import csv_to_grid, load_grid, make_grid
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(SCRIPT_DIR, "brightness.db")
+
+# Grid columns that have a column in the blocks table
+VALUE_COLUMNS = ("status", "initial", "second", "brightness", "diff")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    source TEXT UNIQUE,
+    rows INTEGER NOT NULL,
+    cols INTEGER NOT NULL,
+    threshold REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_time ON runs (timestamp);
+CREATE TABLE IF NOT EXISTS blocks (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    block_row INTEGER NOT NULL,
+    block_col INTEGER NOT NULL,
+    status INTEGER,
+    initial REAL,
+    second REAL,
+    brightness REAL,
+    diff REAL,
+    PRIMARY KEY (run_id, block_row, block_col)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS blocks_by_position ON blocks (block_row, block_col, run_id);
+"""
+
+
+def to_epoch(value):
+    """Seconds since the epoch from a number, a datetime or an ISO date string."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _time_range(start, end):
+    """SQL condition and arguments for runs.timestamp within [start, end)."""
+    conditions, args = [], []
+    if start is not None:
+        conditions.append("runs.timestamp >= ?")
+        args.append(to_epoch(start))
+    if end is not None:
+        conditions.append("runs.timestamp < ?")
+        args.append(to_epoch(end))
+    return (" AND ".join(conditions) or "1"), args
+
+
+def _check_column(column):
+    if column not in VALUE_COLUMNS:
+        raise ValueError(f"unknown column {column!r}, expected one of {VALUE_COLUMNS}")
+
+
+class BrightnessStore:
+    """
+    Append-only store of block grids.
+
+    Parameters:
+        path (str): SQLite database file, created if it doesn't exist
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def source_key(self, path):
+        """How a data file is recorded in runs.source: relative to the database folder."""
+        return os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(self.path)))
+
+    def has_run(self, source):
+        return self.db.execute("SELECT 1 FROM runs WHERE source = ?", (source,)).fetchone() is not None
+
+    def add_run(self, timestamp, grid, source=None, threshold=None):
+        """
+        Appends one run and returns its id. grid is a structured grid from
+        block_grid; columns not in VALUE_COLUMNS are ignored. A run whose
+        source is already stored is not added again, and its existing id
+        is returned.
+        """
+        if source is not None:
+            row = self.db.execute("SELECT id FROM runs WHERE source = ?", (source,)).fetchone()
+            if row is not None:
+                return row[0]
+        names = [name for name in grid.dtype.names if name in VALUE_COLUMNS]
+        rows, cols = grid.shape
+        block_rows, block_cols = np.indices(grid.shape)
+        values = [block_rows.ravel().tolist(), block_cols.ravel().tolist()]
+        values += [np.asarray(grid[name]).ravel().tolist() for name in names]
+
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (timestamp, source, rows, cols, threshold) VALUES (?, ?, ?, ?, ?)",
+                (to_epoch(timestamp), source, rows, cols, threshold))
+            run_id = cursor.lastrowid
+            placeholders = ", ".join("?" * (len(names) + 3))
+            self.db.executemany(
+                f"INSERT INTO blocks (run_id, block_row, block_col, {', '.join(names)}) VALUES ({placeholders})",
+                ((run_id,) + record for record in zip(*values)))
+        return run_id
+
+    def runs(self, start=None, end=None):
+        """(id, timestamp, source, threshold) of every run in the time range, oldest first."""
+        condition, args = _time_range(start, end)
+        return self.db.execute(
+            f"SELECT id, timestamp, source, threshold FROM runs WHERE {condition} ORDER BY timestamp",
+            args).fetchall()
+
+    def grid(self, run_id, column="status"):
+        """One column of a stored run as a (rows, cols) array. Missing blocks are NaN."""
+        _check_column(column)
+        rows, cols = self.db.execute("SELECT rows, cols FROM runs WHERE id = ?", (run_id,)).fetchone()
+        grid = np.full((rows, cols), np.nan)
+        for r, c, value in self.db.execute(
+                f"SELECT block_row, block_col, {column} FROM blocks WHERE run_id = ?", (run_id,)):
+            grid[r, c] = np.nan if value is None else value
+        return grid
+
+    def block_history(self, row, col, column="status", start=None, end=None):
+        """Timestamps and values of one block across every run in the time range, oldest first."""
+        _check_column(column)
+        condition, args = _time_range(start, end)
+        records = self.db.execute(
+            f"SELECT runs.timestamp, blocks.{column} FROM blocks JOIN runs ON runs.id = blocks.run_id "
+            f"WHERE blocks.block_row = ? AND blocks.block_col = ? AND {condition} ORDER BY runs.timestamp",
+            [row, col] + args).fetchall()
+        times = np.array([r[0] for r in records], dtype=float)
+        values = np.array([np.nan if r[1] is None else r[1] for r in records], dtype=float)
+        return times, values
+
+    def blocks_with_status(self, status=OUTAGE, start=None, end=None):
+        """(timestamp, block row, block column) of every block with this status in the time range."""
+        condition, args = _time_range(start, end)
+        return self.db.execute(
+            f"SELECT runs.timestamp, blocks.block_row, blocks.block_col FROM runs "
+            f"JOIN blocks ON blocks.run_id = runs.id "
+            f"WHERE {condition} AND blocks.status = ? ORDER BY runs.timestamp, blocks.block_row, blocks.block_col",
+            args + [status]).fetchall()
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Importers for the files the capture scripts have written over time
+
+def _file_time(path, pattern, time_format):
+    """Timestamp from the file name if it matches pattern, else the file's modification time."""
+    match = re.search(pattern, os.path.basename(path))
+    if match:
+        return datetime.strptime(match.group(1), time_format).timestamp()
+    return os.path.getmtime(path)
+
+
+def _read_rows(path):
+    csv.field_size_limit(sys.maxsize)  # brightness_data.csv has huge cells
+    with open(path, newline="") as file:
+        return list(csv.reader(file))
+
+
+def read_legacy_file(path):
+    """
+    Reads one data file in any of the formats the scripts have written and
+    returns a list of (timestamp, grid) pairs:
+
+        brightness_diff_<ts>.csv / .npy    Feb25Cube block status (and brightness) grids
+        brightness_diff.csv / .npy         Feb20Cube brightness difference
+        images/brightness_<ts>.csv         feb19Cube block brightness, one CSV row per block row
+        brightness_data.csv                feb18_Camera_6_19 log, one photo per row
+        ThinkerS_<time>.npy                feb18_Camera_6_19 brightness grids
+    """
+    name = os.path.basename(path)
+    if name.endswith(".npy"):
+        grid = load_grid(path, mmap=False)
+        return [(_file_time(path, r"_(\d{8}_\d{6})\.", "%Y%m%d_%H%M%S"), grid)]
+
+    rows = _read_rows(path)
+    if not rows:
+        return []
+    header = rows[0]
+    if header[:2] == ["Block Row", "Block Column"]:
+        return [(_file_time(path, r"_(\d{8}_\d{6})\.", "%Y%m%d_%H%M%S"), csv_to_grid(path))]
+    if header == ["Pixel Index", "Brightness Difference"]:
+        # One stringified NumPy row per block row
+        diff = np.array([np.array(cell.strip("[]").split(), dtype=float) for _, cell in rows[1:]])
+        return [(os.path.getmtime(path), make_grid(diff=diff))]
+    if header[0] == "Timestamp":
+        runs = []
+        for record in rows[1:]:
+            # [((x, y), brightness), ...] with x, y the pixel corner of each 10x10 block
+            blocks = ast.literal_eval(record[-1])
+            xs = np.array([x for (x, y), _ in blocks]) // 10
+            ys = np.array([y for (x, y), _ in blocks]) // 10
+            brightness = np.full((ys.max() + 1, xs.max() + 1), np.nan)
+            brightness[ys, xs] = [value for _, value in blocks]
+            timestamp = datetime.strptime(record[0], "%Y-%m-%d %H:%M:%S").timestamp()
+            runs.append((timestamp, make_grid(brightness=brightness)))
+        return runs
+    # Plain grid of numbers, one row of blocks per line
+    brightness = np.array(rows, dtype=float)
+    return [(_file_time(path, r"_(\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d)\.", "%Y-%m-%d_%H-%M-%S"),
+             make_grid(brightness=brightness))]
+
+
+def existing_data_files(folder=SCRIPT_DIR):
+    """Every brightness data file under folder that read_legacy_file understands."""
+    patterns = ["brightness_diff*.csv", "brightness_diff*.npy", "brightness_data.csv",
+                "ThinkerS_*.npy", "images/brightness_*.csv"]
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.join(folder, pattern)))
+    return sorted(paths)
+
+
+def import_files(store, paths):
+    """Imports data files into the store, skipping ones already imported. Returns the number of runs added."""
+    added = 0
+    for path in paths:
+        source = store.source_key(path)
+        if store.has_run(source) or store.has_run(f"{source}#0"):
+            continue
+        runs = [(timestamp, grid) for timestamp, grid in read_legacy_file(path) if grid.size]
+        for n, (timestamp, grid) in enumerate(runs):
+            # A log file holds several runs, each gets its own source key
+            store.add_run(timestamp, grid, source if len(runs) == 1 else f"{source}#{n}")
+            added += 1
+    return added
+
+
+def main(argv):
+    if not argv or argv[0] not in ("import", "dark", "history"):
+        print(__doc__)
+        return 1
+    with BrightnessStore() as store:
+        if argv[0] == "import":
+            paths = argv[1:] or existing_data_files()
+            print(f"Imported {import_files(store, paths)} runs from {len(paths)} files")
+        elif argv[0] == "dark":
+            start, end = (argv[1:3] + [None, None])[:2]
+            for timestamp, row, col in store.blocks_with_status(OUTAGE, start, end):
+                print(f"{datetime.fromtimestamp(timestamp)}  block ({row}, {col})")
+        else:
+            times, values = store.block_history(int(argv[1]), int(argv[2]))
+            for timestamp, value in zip(times, values):
+                label = "" if np.isnan(value) else STATUS_NAMES[int(value)]
+                print(f"{datetime.fromtimestamp(timestamp)}  {label}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
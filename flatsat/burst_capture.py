@@ -0,0 +1,210 @@
+"""
+Burst capture around an event. The camera streams low-resolution frames
+continuously into a fixed-size ring in memory. When trigger() is called
+(e.g. on a shake) the frames from just before it are kept along with the
+ones that follow, and the whole burst is written to JPEG in the
+background while the stream keeps running.
+
+    recorder = BurstRecorder(get_session(size=(640, 480)), pre_frames=15, post_frames=15).start()
+    ...
+    burst = recorder.trigger("images/shake_20250301_101500")
+    burst.wait()        # burst.paths are the saved frames, oldest first
+"""
+
+import queue
+import sys
+import threading
+import time
+import numpy as np
+from PIL import Image
+from camera_session import yuv420_to_rgb
+
+BURST_SIZE = (640, 480)  # Low resolution keeps the stream at full frame rate
+
+
+class FrameRing:
+    """
+    The last capacity frames, in one preallocated array, so memory stays
+    the same however long the stream runs. Frames are copied in, since the
+    camera may reuse its buffers.
+    """
+
+    def __init__(self, capacity, shape, dtype=np.uint8):
+        self.capacity = capacity
+        self.frames = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self.times = np.zeros(capacity)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, frame, t):
+        with self.lock:
+            slot = self.count % self.capacity
+            self.frames[slot] = frame
+            self.times[slot] = t
+            self.count += 1
+
+    def last(self, n):
+        """Copies of the newest n frames (fewer if not filled yet), oldest first, as (times, frames)."""
+        with self.lock:
+            n = min(n, self.count, self.capacity)
+            slots = np.arange(self.count - n, self.count) % self.capacity
+            return self.times[slots].copy(), self.frames[slots]
+
+
+class Burst:
+    """Frames around one trigger. wait() blocks until they have all been written to paths."""
+
+    def __init__(self, prefix, trigger_time, pre_times, pre_frames, post_frames):
+        self.prefix = prefix
+        self.trigger_time = trigger_time
+        self.times = list(pre_times)
+        self.frames = list(pre_frames)
+        self.pre = len(self.frames)
+        self.post_frames = post_frames
+        self.paths = []
+        self.done = threading.Event()
+
+    @property
+    def collecting(self):
+        return len(self.frames) - self.pre < self.post_frames
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class BurstRecorder:
+    """
+    Streams frames from a CameraSession into a FrameRing and saves bursts.
+
+    Parameters:
+        session: CameraSession opened with a size (YUV420 frames)
+        pre_frames (int): frames kept from before each trigger
+        post_frames (int): frames kept from after each trigger
+        max_bursts (int): bursts that can be collecting or waiting to be
+            written at once. trigger() returns None when this many are busy,
+            which bounds memory to about (pre + post) * max_bursts frames.
+    """
+
+    def __init__(self, session, pre_frames=15, post_frames=15, max_bursts=2):
+        self.session = session
+        self.pre_frames = pre_frames
+        self.post_frames = post_frames
+        self.max_bursts = max_bursts
+        self.ring = None
+        self.active = []  # bursts still collecting frames after their trigger
+        self.writes = queue.Queue()
+        self.busy = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.frames_seen = 0
+        self.capture_thread = None
+        self.write_thread = None
+
+    def start(self):
+        if self.running:
+            return self
+        frame = self.session.capture_frame()
+        self.ring = FrameRing(self.pre_frames, frame.shape, frame.dtype)
+        self.running = True
+        self.capture_thread = threading.Thread(target=self._capture, daemon=True)
+        self.write_thread = threading.Thread(target=self._write, daemon=True)
+        self.capture_thread.start()
+        self.write_thread.start()
+        return self
+
+    def _capture(self):
+        while self.running:
+            frame = self.session.capture_frame()
+            t = time.time()
+            self.frames_seen += 1
+            with self.lock:
+                for burst in self.active:
+                    burst.times.append(t)
+                    burst.frames.append(frame.copy())
+                finished = [burst for burst in self.active if not burst.collecting]
+                self.active = [burst for burst in self.active if burst.collecting]
+            for burst in finished:
+                self.writes.put(burst)
+            # After the bursts, so a trigger's pre frames and post frames never overlap
+            self.ring.append(frame, t)
+
+    def trigger(self, prefix):
+        """
+        Starts a burst: the last pre_frames frames and the next post_frames
+        are saved as <prefix>_<n>.jpg, n counting from -pre_frames, with 0
+        the first frame after the trigger. Returns the Burst, or None if
+        max_bursts are already busy.
+        """
+        with self.lock:
+            if self.busy >= self.max_bursts:
+                return None
+            self.busy += 1
+            times, frames = self.ring.last(self.pre_frames)
+            burst = Burst(prefix, time.time(), times, frames, self.post_frames)
+            if burst.collecting:
+                self.active.append(burst)
+        if not burst.collecting:
+            self.writes.put(burst)
+        return burst
+
+    def _write(self):
+        while True:
+            burst = self.writes.get()
+            if burst is None:
+                break
+            for n, frame in enumerate(burst.frames):
+                path = f"{burst.prefix}_{n - burst.pre:+03d}.jpg"
+                try:
+                    Image.fromarray(yuv420_to_rgb(frame)).save(path)
+                    burst.paths.append(path)
+                except Exception as e:
+                    print(f"Could not save {path}: {e}")
+            burst.frames = None  # Free the frames now they're on disk
+            with self.lock:
+                self.busy -= 1
+            burst.done.set()
+
+    def stop(self):
+        """Stops the stream. Bursts still collecting are written with the frames they have."""
+        self.running = False
+        if self.capture_thread is not None:
+            self.capture_thread.join()
+        with self.lock:
+            unfinished, self.active = self.active, []
+        for burst in unfinished:
+            self.writes.put(burst)
+        self.writes.put(None)
+        if self.write_thread is not None:
+            self.write_thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(pre_frames=15, post_frames=15):
+    """Records bursts on every shake until Ctrl+C."""
+    import os
+    from camera_session import get_session
+    from motion_trigger import motion_trigger
+    image_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+    trigger = motion_trigger()
+    with BurstRecorder(get_session(size=BURST_SIZE), int(pre_frames), int(post_frames)) as recorder:
+        print("Streaming, shake the board to save a burst (Ctrl+C to stop)")
+        try:
+            while True:
+                trigger.wait()
+                prefix = os.path.join(image_dir, time.strftime("burst_%Y%m%d_%H%M%S"))
+                if recorder.trigger(prefix) is None:
+                    print("Still saving earlier bursts, shake ignored")
+                else:
+                    print(f"Shake! Saving burst {prefix}")
+                trigger.rearm()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,420 @@
+"""
+Streaming sensor calibration. Samples are folded into running statistics
+as they arrive, so calibration uses constant memory however long it runs,
+reads at a fixed rate instead of spinning on the bus, and stops as soon
+as the estimate has converged. Results are kept in a CalibrationStore
+and reused on the next boot.
+"""
+
+import json
+import os
+import time
+import numpy as np
+
+
+class RunningStats:
+    """Running min, max, mean and variance of 3-axis samples (Welford's method)."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = np.zeros(3)
+        self.m2 = np.zeros(3)
+        self.minimum = np.full(3, np.inf)
+        self.maximum = np.full(3, -np.inf)
+
+    def add(self, sample):
+        sample = np.asarray(sample, dtype=float)
+        self.count += 1
+        delta = sample - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (sample - self.mean)
+        np.minimum(self.minimum, sample, out=self.minimum)
+        np.maximum(self.maximum, sample, out=self.maximum)
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return np.full(3, np.inf)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class GyroCalibrator:
+    """
+    Gyro bias from a board sitting still: the mean of each axis. Converged
+    once the standard error of every mean is below tolerance.
+
+    Parameters:
+        tolerance (float): standard error to stop at, in sensor units (rad/s)
+        min_samples (int): never stop before this many samples
+    """
+
+    def __init__(self, tolerance=0.0005, min_samples=100):
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.stats = RunningStats()
+
+    def add(self, sample):
+        self.stats.add(sample)
+
+    def converged(self):
+        if self.stats.count < self.min_samples:
+            return False
+        standard_error = self.stats.std / np.sqrt(self.stats.count)
+        return bool(np.all(standard_error < self.tolerance))
+
+    def offset(self):
+        return self.stats.mean.tolist()
+
+
+class MagCalibrator:
+    """
+    Hard-iron offset from a magnetometer being waved around: the midpoint
+    of each axis' min and max. Converged once every axis has been turned
+    through at least min_span and no min or max has moved by more than
+    tolerance for settle_samples samples in a row.
+
+    Parameters:
+        tolerance (float): movement of min/max that still counts as settled
+        settle_samples (int): samples without movement needed to stop
+        min_samples (int): never stop before this many samples
+        min_span (float): smallest max - min needed on every axis, in uT.
+            Turning an axis all the way round spans twice the Earth's
+            field (about 50-130 uT), a board lying still spans almost 0
+    """
+
+    def __init__(self, tolerance=0.5, settle_samples=300, min_samples=300, min_span=30.0):
+        self.tolerance = tolerance
+        self.settle_samples = settle_samples
+        self.min_samples = min_samples
+        self.min_span = min_span
+        self.stats = RunningStats()
+        self.span_at_last_change = None
+        self.steady = 0
+
+    def add(self, sample):
+        self.stats.add(sample)
+        span = np.concatenate((self.stats.minimum, self.stats.maximum))
+        if self.span_at_last_change is None or np.any(np.abs(span - self.span_at_last_change) > self.tolerance):
+            self.span_at_last_change = span
+            self.steady = 0
+        else:
+            self.steady += 1
+
+    def spans(self):
+        """max - min of each axis so far."""
+        return self.stats.maximum - self.stats.minimum
+
+    def turned_enough(self):
+        return bool(np.all(self.spans() >= self.min_span))
+
+    def converged(self):
+        return self.stats.count >= self.min_samples and self.steady >= self.settle_samples and self.turned_enough()
+
+    def offset(self):
+        """The midpoints. Raises RuntimeError if some axis was never turned through min_span."""
+        if not self.turned_enough():
+            spans = ", ".join(f"{span:.0f}" for span in np.maximum(self.spans(), 0))
+            raise RuntimeError(f"Magnetometer was not turned enough to calibrate (axis spans {spans} uT, "
+                               f"need {self.min_span:.0f}), wave the board around every axis and try again")
+        return ((self.stats.minimum + self.stats.maximum) / 2).tolist()
+
+    def field(self):
+        """
+        Strength of the field once the offset is removed: the largest
+        half-span of the axes, as the board may not have been turned fully
+        about every axis.
+        """
+        return float(np.max((self.stats.maximum - self.stats.minimum) / 2))
+
+
+def _design(samples):
+    """Rows [x^2, y^2, z^2, 2xy, 2xz, 2yz, 2x, 2y, 2z] of the ellipsoid equation for (n, 3) samples."""
+    x, y, z = samples[:, 0], samples[:, 1], samples[:, 2]
+    return np.column_stack((x * x, y * y, z * z, 2 * x * y, 2 * x * z, 2 * y * z, 2 * x, 2 * y, 2 * z))
+
+
+class EllipsoidCalibrator:
+    """
+    Hard- and soft-iron magnetometer calibration. Without distortion the
+    readings of a turning board lie on a sphere; hard iron moves its centre
+    and soft iron stretches it into an ellipsoid. The ellipsoid is fitted
+    by least squares, keeping only the 9x9 normal equations, so samples
+    are folded in as they arrive and memory stays constant.
+
+    offset() is the centre and matrix() the 3x3 soft-iron correction:
+    corrected = matrix @ (sample - offset) lies on a sphere of radius
+    field(). Stops, like MagCalibrator, once no axis' min or max has moved
+    for settle_samples samples. If the fit fails or is implausible (too
+    little of the ellipsoid was covered) it falls back to MagCalibrator's
+    midpoints, which raise if the board was not turned enough either.
+
+    Parameters:
+        tolerance, settle_samples, min_samples, min_span: as for MagCalibrator
+        field_range (tuple): (low, high) field strengths in uT a fit may
+            give; the Earth's field is 25-65 uT everywhere
+        max_ratio (float): largest ratio of the ellipsoid's longest and
+            shortest radius a fit may have
+        max_condition (float): largest condition number of the normal
+            equations; turning about one axis only makes them near singular
+    """
+
+    def __init__(self, tolerance=0.5, settle_samples=300, min_samples=300, min_span=30.0,
+                 field_range=(20.0, 70.0), max_ratio=2.0, max_condition=1e4):
+        self.spread = MagCalibrator(tolerance, settle_samples, min_samples, min_span)
+        self.field_range = field_range
+        self.max_ratio = max_ratio
+        self.max_condition = max_condition
+        self.normal = np.zeros((9, 9))
+        self.rhs = np.zeros(9)
+        self.origin = None
+        self.scale = 1.0
+        self.origin_samples = 50
+        self.pending = []
+        self._fit = None
+
+    def add(self, sample):
+        self.add_batch(np.asarray(sample, dtype=float).reshape(1, 3))
+
+    def add_batch(self, samples):
+        """Adds an (n, 3) array of readings in one step."""
+        samples = np.asarray(samples, dtype=float).reshape(-1, 3)
+        if not len(samples):
+            return
+        for sample in samples:
+            self.spread.add(sample)
+        self._fit = None
+        if self.origin is None:
+            # The fit is done around the mean of the first readings, scaled
+            # to about 1, which keeps the normal equations well conditioned.
+            # (The origin must not lie on the ellipsoid itself.)
+            self.pending.append(samples)
+            if sum(len(batch) for batch in self.pending) < self.origin_samples:
+                return
+            samples = np.concatenate(self.pending)
+            self.pending = []
+            self.origin = samples.mean(axis=0)
+            self.scale = max(float(np.abs(samples - self.origin).max()), 1e-9)
+        rows = _design((samples - self.origin) / self.scale)
+        self.normal += rows.T @ rows
+        self.rhs += rows.sum(axis=0)
+
+    def _flush(self):
+        """Folds in readings still waiting for the origin to be chosen."""
+        if self.pending:
+            self.origin_samples = 0
+            self.add_batch(np.concatenate(self.pending))
+
+    def converged(self):
+        return self.spread.converged()
+
+    def fit(self):
+        """(offset, matrix, field) as numpy arrays and a float, or None if the fit fails or is implausible."""
+        self._flush()
+        if self._fit is None and self.spread.stats.count >= 9:
+            if np.linalg.cond(self.normal) > self.max_condition:
+                return None
+            try:
+                a, b, c, d, e, f, g, h, i = np.linalg.solve(self.normal, self.rhs)
+                quadric = np.array([[a, d, e], [d, b, f], [e, f, c]])
+                centre = -np.linalg.solve(quadric, [g, h, i])
+                shape = quadric / (1 + centre @ quadric @ centre)
+                values, vectors = np.linalg.eigh(shape)
+            except np.linalg.LinAlgError:
+                return None
+            if np.all(values > 0):
+                radii = 1 / np.sqrt(values)
+                field = float(np.prod(radii) ** (1 / 3))
+                low, high = self.field_range
+                if low <= field * self.scale <= high and radii.max() <= self.max_ratio * radii.min():
+                    # Symmetric square root of the ellipsoid, scaled to keep the field strength
+                    matrix = vectors @ np.diag(field / radii) @ vectors.T
+                    self._fit = (self.origin + centre * self.scale, matrix, field * self.scale)
+        return self._fit
+
+    def offset(self):
+        fit = self.fit()
+        return self.spread.offset() if fit is None else fit[0].tolist()
+
+    def matrix(self):
+        fit = self.fit()
+        return np.eye(3).tolist() if fit is None else fit[1].tolist()
+
+    def field(self):
+        fit = self.fit()
+        return self.spread.field() if fit is None else fit[2]
+
+
+def apply_mag_calibration(samples, offset, matrix=None):
+    """
+    Corrects one reading or an (n, 3) array of them: matrix @ (sample - offset).
+    Without a matrix only the offset is removed.
+    """
+    corrected = np.asarray(samples, dtype=float) - offset
+    if matrix is not None:
+        corrected = corrected @ np.asarray(matrix, dtype=float).T
+    return corrected
+
+
+def run_calibration(calibrator, read, duration, rate_hz=100):
+    """
+    Feeds calibrator one read() every 1/rate_hz seconds until it has
+    converged or duration seconds have passed. Returns its offset, which
+    raises RuntimeError for a magnetometer that was never turned enough.
+    """
+    period = 1.0 / rate_hz
+    start_time = time.monotonic()
+    next_time = start_time
+    while time.monotonic() - start_time < duration:
+        calibrator.add(read())
+        if calibrator.converged():
+            break
+        next_time += period
+        time.sleep(max(0, next_time - time.monotonic()))
+    return calibrator.offset()
+
+
+# Calibrations are stored per IMU and per temperature (gyro bias moves
+# with temperature), so a script can reuse one instead of recalibrating
+
+def device_key(accel_gyro, mag):
+    """
+    Identifies the IMU: the Pi's serial number plus each sensor's I2C
+    address. An IMUReader reports the key of the IMU its service reads.
+    Other sensors without an I2C device (SimulatedIMU) are identified by
+    their class.
+    """
+    key = getattr(accel_gyro, "device_key", None)
+    if isinstance(key, str) and key:
+        return key
+    serial = "unknown"
+    try:
+        with open("/proc/cpuinfo") as file:
+            for line in file:
+                if line.startswith("Serial"):
+                    serial = line.split(":")[1].strip()
+    except OSError:
+        pass
+    parts = [serial]
+    for sensor in (accel_gyro, mag):
+        try:
+            parts.append(f"i2c@0x{sensor.i2c_device.device_address:02x}")
+        except (AttributeError, OSError):
+            parts.append(type(sensor).__name__)
+    return "/".join(parts)
+
+
+def read_temperature(accel_gyro):
+    """The LSM6DSOX die temperature in degrees C, or None if the sensor can't report it."""
+    try:
+        return float(accel_gyro.temperature)
+    except (AttributeError, OSError, TypeError, ValueError):
+        return None
+
+
+def check_calibration(entry, gyro_samples, mag_samples, gyro_tolerance=0.01, still_tolerance=0.02,
+                      field_tolerance=0.25):
+    """
+    Quick sanity check of a stored calibration against a short burst of
+    samples taken with the board still. Returns (ok, reason).
+
+    Parameters:
+        entry (dict): stored calibration with gyro_offset, mag_offset and mag_field
+        gyro_samples, mag_samples: (n, 3) readings in sensor units
+        gyro_tolerance (float): largest difference between the stored gyro
+            bias and the measured mean, in sensor units (rad/s)
+        still_tolerance (float): largest gyro standard deviation for the
+            board to count as still; if it is moving, the bias can't be checked
+        field_tolerance (float): largest relative error of the corrected
+            field strength against the one measured at calibration
+    """
+    gyro_samples = np.asarray(gyro_samples, dtype=float)
+    mag_samples = np.asarray(mag_samples, dtype=float)
+    if np.any(gyro_samples.std(axis=0) > still_tolerance):
+        return False, "board was moving"
+    drift = np.abs(gyro_samples.mean(axis=0) - entry["gyro_offset"]).max()
+    if drift > gyro_tolerance:
+        return False, f"gyro bias moved by {drift:.4f}"
+    field = entry.get("mag_field")
+    if field:
+        strength = np.linalg.norm(apply_mag_calibration(mag_samples.mean(axis=0), entry["mag_offset"],
+                                                        entry.get("mag_matrix")))
+        if abs(strength - field) > field_tolerance * field:
+            return False, f"magnetic field is {strength:.1f}, calibrated at {field:.1f}"
+    return True, "ok"
+
+
+class CalibrationStore:
+    """
+    Saved calibrations in one JSON file, each with the device key, the
+    temperature it was made at and when.
+
+    Parameters:
+        path (str): JSON file holding the calibrations
+        max_age (float): seconds a calibration stays valid
+        max_temp_diff (float): degrees C a calibration can be used away
+            from its own temperature
+        keep (int): calibrations kept per device
+    """
+
+    def __init__(self, path, max_age=7 * 24 * 3600, max_temp_diff=5.0, keep=10):
+        self.path = path
+        self.max_age = max_age
+        self.max_temp_diff = max_temp_diff
+        self.keep = keep
+
+    def entries(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file).get("calibrations", [])
+        except (OSError, ValueError, AttributeError):
+            return []
+
+    def _matches(self, entry, device, temperature):
+        if entry.get("device") != device:
+            return False
+        if time.time() - entry.get("created", 0) > self.max_age:
+            return False
+        stored = entry.get("temperature")
+        if temperature is not None and stored is not None:
+            return abs(temperature - stored) <= self.max_temp_diff
+        return True
+
+    def lookup(self, device, temperature=None):
+        """The newest valid calibration for device near temperature, or None."""
+        matches = [entry for entry in self.entries() if self._matches(entry, device, temperature)]
+        if not matches:
+            return None
+        # Closest temperature first, then newest
+        def rank(entry):
+            stored = entry.get("temperature")
+            gap = abs(temperature - stored) if temperature is not None and stored is not None else 0
+            return (gap, -entry.get("created", 0))
+        return min(matches, key=rank)
+
+    def save(self, device, temperature=None, **values):
+        """
+        Stores a calibration (e.g. mag_offset=[...], gyro_offset=[...]) and
+        returns it. It replaces any for the same device near the same
+        temperature, and only the newest keep per device are kept.
+        """
+        entry = dict(values, device=device, temperature=temperature, created=time.time())
+        kept = []
+        for old in self.entries():
+            if old.get("device") == device:
+                stored = old.get("temperature")
+                if stored is None or temperature is None or abs(stored - temperature) <= self.max_temp_diff:
+                    continue
+            kept.append(old)
+        kept.append(entry)
+        mine = [old for old in kept if old.get("device") == device]
+        for old in mine[:-self.keep]:
+            kept.remove(old)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"calibrations": kept}, file, indent=2)
+        os.replace(tmp_path, self.path)
+        return entry
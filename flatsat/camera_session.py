@@ -0,0 +1,273 @@
+"""
+Long-lived camera session. Opening Picamera2 and waiting for auto-exposure
+takes seconds, so scripts open one session at startup and reuse it for
+every capture instead of building a new Picamera2 each time.
+"""
+
+import atexit
+import queue
+import threading
+import time
+import numpy as np
+from PIL import Image
+import metrics
+
+
+def luminance(frame):
+    """
+    Returns the Y plane of a YUV420 frame, shape (height, width). This is a
+    view into the captured buffer, so nothing is copied.
+    """
+    height = frame.shape[0] * 2 // 3
+    return frame[:height]
+
+
+def yuv420_to_rgb(frame):
+    """Converts a YUV420 frame from capture_array() to an RGB array."""
+    height = frame.shape[0] * 2 // 3
+    width = frame.shape[1]
+    # The U and V planes are quarter size, stored after the Y plane
+    chroma = frame[height:].reshape(2, height // 2, width // 2)
+    u = chroma[0].repeat(2, axis=0).repeat(2, axis=1)
+    v = chroma[1].repeat(2, axis=0).repeat(2, axis=1)
+    ycbcr = np.dstack((frame[:height], u, v))
+    return np.array(Image.fromarray(ycbcr, mode="YCbCr").convert("RGB"))
+
+
+class FakeCamera:
+    """
+    Stand-in for Picamera2 that needs no hardware. It implements the parts
+    of the Picamera2 API the session uses, produces a fixed synthetic scene
+    and lets the exposure converge over a few frames like the real AE does.
+    """
+
+    def __init__(self, size=(640, 480), frame_time=1 / 30, settle_frames=8):
+        self.size = size
+        self.frame_time = frame_time
+        self.settle_frames = settle_frames
+        self.started = False
+        self.frame_count = 0
+        self.format = "RGB888"
+        self._make_scene()
+
+    def _make_scene(self):
+        width, height = self.size
+        y, x = np.mgrid[0:height, 0:width]
+        self.scene = ((x * 255 // max(width - 1, 1) + y * 64 // max(height - 1, 1)) % 256).astype(np.uint8)
+
+    def create_preview_configuration(self, main=None, **kwargs):
+        return {"main": main or {}}
+
+    def configure(self, config):
+        main = config.get("main", {})
+        self.format = main.get("format", self.format)
+        self.size = tuple(main.get("size", self.size))
+        self._make_scene()
+
+    def start(self, show_preview=False):
+        self.started = True
+        self.frame_count = 0
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.started = False
+
+    def _next_frame(self):
+        if not self.started:
+            raise RuntimeError("Camera is not started")
+        time.sleep(self.frame_time)
+        self.frame_count += 1
+
+    def capture_metadata(self):
+        """Exposure closes half the remaining gap every frame until it settles."""
+        self._next_frame()
+        remaining = 0.5 ** min(self.frame_count, self.settle_frames)
+        if self.frame_count >= self.settle_frames:
+            remaining = 0
+        return {
+            "ExposureTime": int(10000 * (1 + remaining)),
+            "AnalogueGain": 1.0 + remaining,
+        }
+
+    def capture_array(self, name="main"):
+        self._next_frame()
+        if self.format == "YUV420":
+            # Grey scene: Y plane followed by neutral quarter-size U and V planes
+            height, width = self.scene.shape
+            chroma = np.full((height // 2, width), 128, dtype=np.uint8)
+            return np.vstack((self.scene, chroma))
+        return np.dstack([self.scene] * 3)
+
+    def capture_file(self, filename):
+        frame = self.capture_array()
+        if self.format == "YUV420":
+            frame = yuv420_to_rgb(frame)
+        Image.fromarray(frame).save(filename)
+
+
+class CameraSession:
+    """
+    Keeps one camera open between captures. start() warms the camera up
+    and waits until auto-exposure has settled, after that capture() just
+    grabs the next frame.
+
+    Parameters:
+        camera: a Picamera2 (or FakeCamera). Defaults to a new Picamera2.
+        settle_timeout (float): longest time in seconds to wait for AE
+        settle_tolerance (float): relative change in exposure*gain that
+            still counts as settled
+        settle_frames (int): consecutive steady frames needed
+        size (tuple): (width, height) of the in-memory YUV420 stream. If
+            given, the camera is configured for capture_luminance(),
+            otherwise the default Picamera2 configuration is kept. The
+            width must be a multiple of 64: Picamera2 pads rows out to
+            that stride, and luminance() and yuv420_to_rgb() expect none.
+    """
+
+    def __init__(self, camera=None, settle_timeout=2.0, settle_tolerance=0.02, settle_frames=3,
+                 size=None):
+        if size is not None and size[0] % 64:
+            raise ValueError(f"YUV420 width {size[0]} is not a multiple of 64")
+        self.camera = camera
+        self.size = size
+        self.settle_timeout = settle_timeout
+        self.settle_tolerance = settle_tolerance
+        self.settle_frames = settle_frames
+        self.started = False
+
+    def start(self):
+        """Opens and starts the camera, then waits for auto-exposure. Returns the warm-up time."""
+        if self.started:
+            return 0.0
+        start_time = time.monotonic()
+        if self.camera is None:
+            from picamera2 import Picamera2
+            self.camera = Picamera2()
+        if self.size is not None:
+            main = {"format": "YUV420", "size": tuple(self.size)}
+            self.camera.configure(self.camera.create_preview_configuration(main=main))
+        self.camera.start()
+        self.started = True
+        self.wait_for_settle()
+        warmup = time.monotonic() - start_time
+        metrics.observe("camera_warmup", warmup)
+        return warmup
+
+    def wait_for_settle(self):
+        """
+        Reads frame metadata until exposure stops changing, or until
+        settle_timeout runs out. Returns True if AE settled in time.
+        """
+        deadline = time.monotonic() + self.settle_timeout
+        previous = None
+        steady = 0
+        while time.monotonic() < deadline:
+            metadata = self.camera.capture_metadata()
+            if metadata.get("AeLocked"):
+                return True
+            exposure = metadata.get("ExposureTime", 0) * metadata.get("AnalogueGain", 1.0)
+            if previous and abs(exposure - previous) <= self.settle_tolerance * previous:
+                steady += 1
+                if steady >= self.settle_frames:
+                    return True
+            else:
+                steady = 0
+            previous = exposure
+        print("Camera auto-exposure did not settle, capturing anyway.")
+        return False
+
+    def capture(self, filename):
+        """Captures an image from the running camera and saves it to filename."""
+        self.start()
+        self.camera.capture_file(filename)
+        return filename
+
+    @metrics.timed("capture_frame")
+    def capture_frame(self):
+        """Captures one YUV420 frame into memory, without going through a file."""
+        if self.size is None:
+            raise RuntimeError("Open the session with a size to capture YUV420 frames")
+        self.start()
+        return self.camera.capture_array("main")
+
+    def capture_luminance(self):
+        """
+        Captures one frame and returns its (height, width) brightness plane,
+        ready for image_processor.block_means. Also returns the full frame
+        so it can be handed to a FrameArchiver.
+        """
+        frame = self.capture_frame()
+        return luminance(frame), frame
+
+    def stop(self):
+        """Stops the camera but keeps it open, so start() can warm it up again."""
+        if self.camera is not None and self.started:
+            self.camera.stop()
+        self.started = False
+
+    def close(self):
+        if self.camera is not None and self.started:
+            self.camera.close()
+        self.started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameArchiver:
+    """
+    Writes frames to JPEG on a background thread so archiving never holds
+    up the capture loop. Call close() to wait for pending writes.
+    """
+
+    def __init__(self, max_pending=8):
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, frame, filename, yuv420=True):
+        """
+        Queues a frame to be saved as filename. Frames from capture_frame()
+        are YUV420; pass yuv420=False for plain RGB or greyscale arrays.
+        """
+        self.pending.put((frame, filename, yuv420))
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            frame, filename, yuv420 = item
+            try:
+                if yuv420:
+                    frame = yuv420_to_rgb(frame)
+                Image.fromarray(frame).save(filename)
+            except Exception as e:
+                print(f"Could not save {filename}: {e}")
+            finally:
+                self.pending.task_done()
+
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+
+
+_session = None
+
+def get_session(size=None):
+    """
+    Returns the shared camera session, opening it on first use. Pass size
+    to open it in the in-memory YUV420 mode.
+    """
+    global _session
+    if _session is None:
+        _session = CameraSession(size=size)
+        atexit.register(_session.close)
+    _session.start()
+    return _session
@@ -0,0 +1,118 @@
+"""
+Incremental displacement tracking along one accelerometer axis, used to
+tell when the CubeSat has been moved away on the gantry and brought back.
+Each sample updates velocity and displacement in constant time, and
+velocity is reset to zero whenever the board is sitting still, so
+accelerometer bias doesn't build up into runaway drift. A steady
+acceleration alone can't tell standing still from cruising at constant
+speed, so the board only counts as still while the integrated velocity
+is small too.
+"""
+
+import time
+
+
+class DisplacementTracker:
+    """
+    Integrates acceleration into velocity and displacement, one sample at a time.
+
+    Parameters:
+        rate_hz (float): sample rate, used when no timestamps are given
+        still_threshold (float): |acceleration - bias| in m/s^2 below which
+            a sample counts as still
+        still_time (float): seconds of still samples in a row before
+            velocity is zeroed (zero-velocity update)
+        still_speed (float): m/s; the update is only made while |velocity|
+            is below this, so a gantry cruising faster keeps its speed
+        bias_alpha (float): how quickly the bias estimate follows the
+            acceleration while the board is still
+        bias (float): starting bias in m/s^2, the first sample if not given
+    """
+
+    def __init__(self, rate_hz=100, still_threshold=0.05, still_time=1.0, still_speed=0.15, bias_alpha=0.02,
+                 bias=None):
+        self.rate_hz = rate_hz
+        self.still_threshold = still_threshold
+        self.still_time = still_time
+        self.still_speed = still_speed
+        self.bias_alpha = bias_alpha
+        self.bias = bias
+        self.velocity = 0.0
+        self.displacement = 0.0
+        self.last_accel = 0.0
+        self.last_time = None
+        self.still_for = 0.0
+
+    @property
+    def still(self):
+        return self.still_for >= self.still_time and abs(self.velocity) < self.still_speed
+
+    def update(self, accel, t=None):
+        """Adds one acceleration sample (m/s^2) and returns the displacement in metres."""
+        if self.bias is None:
+            self.bias = accel
+        if t is None:
+            delT = 1.0 / self.rate_hz
+        else:
+            delT = 1.0 / self.rate_hz if self.last_time is None else t - self.last_time
+            self.last_time = t
+
+        corrected = accel - self.bias
+        if abs(corrected) < self.still_threshold:
+            self.still_for += delT
+        else:
+            self.still_for = 0.0
+
+        if self.still:
+            # Zero-velocity update, and let the bias follow any slow drift
+            self.velocity = 0.0
+            self.bias += self.bias_alpha * corrected
+            corrected = 0.0
+        else:
+            # Trapezoidal integration of acceleration and velocity
+            previous_velocity = self.velocity
+            self.velocity += 0.5 * (self.last_accel + corrected) * delT
+            self.displacement += 0.5 * (previous_velocity + self.velocity) * delT
+        self.last_accel = corrected
+        return self.displacement
+
+
+class ReturnDetector:
+    """
+    Watches displacement for a round trip: 'start' until the board has moved
+    more than away_distance, then 'away' until it is back within
+    return_margin of the start and sitting still, then 'returned'.
+    """
+
+    def __init__(self, away_distance=1.0, return_margin=0.3):
+        self.away_distance = away_distance
+        self.return_margin = return_margin
+        self.state = "start"
+
+    def update(self, displacement, still=True):
+        if self.state == "start" and abs(displacement) > self.away_distance:
+            self.state = "away"
+        elif self.state == "away" and abs(displacement) < self.return_margin and still:
+            self.state = "returned"
+        return self.state
+
+
+def wait_for_return(read_accel, rate_hz=100, away_distance=1.0, return_margin=0.3):
+    """
+    Reads read_accel() at rate_hz until the CubeSat has travelled away and
+    come back to where it started.
+    """
+    tracker = DisplacementTracker(rate_hz=rate_hz)
+    detector = ReturnDetector(away_distance, return_margin)
+    period = 1.0 / rate_hz
+    next_time = time.monotonic()
+    state = detector.state
+    while state != "returned":
+        displacement = tracker.update(read_accel(), time.monotonic())
+        new_state = detector.update(displacement, tracker.still)
+        if new_state == "away" and state == "start":
+            print("CubeSat has travelled far enough")
+        state = new_state
+        next_time += period
+        time.sleep(max(0, next_time - time.monotonic()))
+    print("CubeSat has returned to its original position.")
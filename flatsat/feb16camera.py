@@ -1,70 +1,60 @@
 # Import libraries
 import time
-import board
-from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
-from adafruit_lis3mdl import LIS3MDL
-from git import Repo
+from imu_service import hardware_imu
+from uploader import get_uploader
 from picamera2 import Picamera2
-from image_processor.py import *
+from camera_session import CameraSession
+from burst_capture import BurstRecorder, BURST_SIZE
+from image_processor import *
+from motion_trigger import motion_trigger, peak
 # VARIABLES
-THRESHOLD = 0.08      # Any desired value from the accelerometer
+THRESHOLD = 1.5      # Change in acceleration (m/s^2) that counts as a shake
 REPO_PATH = "/home/pi/thinker_repo"  # Your GitHub repo path
 FOLDER_PATH = "/flatsat"  # Image folder path in your GitHub repo
-NUM_PHOTOS = 3  # Number of photos to take per shake event
-PHOTO_INTERVAL = 1  # Seconds between photos
+PRE_FRAMES = 15  # Frames saved from just before each shake (about 0.5 s of stream)
+POST_FRAMES = 15  # Frames saved from after it
 # IMU and camera initialization
-i2c = board.I2C()
-accel_gyro = LSM6DS(i2c)
-mag = LIS3MDL(i2c)
+accel_gyro, mag = hardware_imu()
 picam2 = Picamera2()
 
 def git_push():
     """
-    This function is complete. Stages, commits, and pushes new images to your GitHub repo.
+    Queues the image folder for the background uploader, which commits and
+    pushes in batches without holding up the capture loop.
     """
-    try:
-        repo = Repo(REPO_PATH)
-        origin = repo.remote('origin')
-        origin.pull()
-        repo.git.add(REPO_PATH + FOLDER_PATH)
-        repo.index.commit('New Photo')
-        origin.push()
-        print('Photos uploaded to GitHub.')
-    except Exception as e:
-        print(f'Git upload failed: {e}')
+    get_uploader(REPO_PATH, message='New Photo').add(REPO_PATH + FOLDER_PATH)
 
-def img_gen(name, count):
+def img_gen(name):
     """
-    Generates a new image name.
+    Generates the name prefix of a burst; frames are saved as <prefix>_-15.jpg ... <prefix>_+14.jpg.
 
     Parameters:
         name (str): User-defined identifier (e.g., "ThinkerS")
-        count (int): Photo sequence number
     """
     t = time.strftime("_%H%M%S")
-    return f'{REPO_PATH}/{FOLDER_PATH}/{name}{t}_{count}.jpg'
+    return f'{REPO_PATH}/{FOLDER_PATH}/{name}{t}'
 
 def take_photo():
     """
-    Captures multiple images when acceleration exceeds the threshold.
+    Saves the frames from just before and just after each shake.
     """
-    picam2.start(show_preview=False)  # Prevent DRM error in SSH
+    # The camera streams continuously into a ring of recent frames, so the
+    # moment of the shake itself is in the burst
+    recorder = BurstRecorder(CameraSession(picam2, size=BURST_SIZE), PRE_FRAMES, POST_FRAMES).start()
+    trigger = motion_trigger(accel_gyro, THRESHOLD)  # The IMU wakes us up on a shake
 
     while True:
-        accelx, accely, accelz = accel_gyro.acceleration
-
-        if accelx > THRESHOLD and accely > THRESHOLD:
-            print("Shake detected! Capturing images...")
-            time.sleep(2)  # Pause before taking photos
-           
-            name = "ThinkerS"  # First Name, Last Initial
-            for i in range(NUM_PHOTOS):
-                filename = img_gen(name, i + 1)
-                picam2.capture_file(filename)
-                print(f"Photo {i+1} saved: {filename}")
-                time.sleep(PHOTO_INTERVAL)  # Wait between captures
-
+        event = trigger.wait()
+        print(f"Shake detected ({peak(event):.1f} m/s^2)! Saving burst...")
+        name = "ThinkerS"  # First Name, Last Initial
+        burst = recorder.trigger(img_gen(name))
+        if burst is None:
+            print("Still saving the last bursts, shake skipped")
+        else:
+            burst.wait()  # The stream keeps running while the burst is written
+            print(f"{len(burst.paths)} frames saved: {burst.prefix}_*.jpg")
             git_push()
+        trigger.rearm()  # Ignore motion from while we were saving
 
 def main():
     take_photo()
@@ -3,55 +3,32 @@
 
 # Import necessary libraries
 import time
-import board
 import sys
-import csv
 import os
-from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
-from adafruit_lis3mdl import LIS3MDL
-from git import Repo
+from imu_service import hardware_imu
+from block_grid import save_grid
+from uploader import get_uploader
 from picamera2 import Picamera2
 from image_processor import *  # Import the function
+from motion_trigger import motion_trigger
 
 # VARIABLES
-THRESHOLD = 0.08  # Acceleration threshold for detecting a shake
+THRESHOLD = 1.5  # Change in acceleration (m/s^2) that counts as a shake
 REPO_PATH = "/home/pi/thinker_repo"  # GitHub repo path
 FOLDER_PATH = "/flatsat"  # Folder where images are saved
-CSV_FILE = f"{REPO_PATH}/{FOLDER_PATH}/brightness_data.csv"  # CSV file path
-IMAGE_INTERVAL = 3  # Time (in seconds) between each photo
+IMAGE_INTERVAL = 3  # Minimum time (in seconds) between photos
 
 # Initialize IMU and Camera
-i2c = board.I2C()
-accel_gyro = LSM6DS(i2c)
-mag = LIS3MDL(i2c)
+accel_gyro, mag = hardware_imu()
 picam2 = Picamera2()
 
-def setup_csv():
-    """Create CSV file if it doesn't exist and add headers."""
-    if not os.path.exists(CSV_FILE):
-        with open(CSV_FILE, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(["Timestamp", "Image Filename", "Brightness Values"])  # Header row
-
-def save_to_csv(image_path, brightness_values):
-    """Save image brightness values to CSV."""
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    with open(CSV_FILE, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow([timestamp, image_path, brightness_values])  # Save data
+def save_brightness(image_path, brightness_values):
+    """Save image brightness values as a block grid next to the image (ThinkerS_<time>.npy)."""
+    save_grid(os.path.splitext(image_path)[0] + ".npy", brightness=brightness_values)
 
 def git_push():
-    """Push new images and CSV data to GitHub."""
-    try:
-        repo = Repo(REPO_PATH)
-        origin = repo.remote('origin')
-        origin.pull()
-        repo.git.add(REPO_PATH + FOLDER_PATH)
-        repo.index.commit('New Photo and Brightness Data')
-        origin.push()
-        print('Uploaded images and CSV data to GitHub')
-    except:
-        print("Couldn't upload to GitHub")
+    """Queue new images and brightness data for the background GitHub uploader."""
+    get_uploader(REPO_PATH, message='New Photo and Brightness Data').add(REPO_PATH + FOLDER_PATH)
 
 def img_gen(name):
     """Generate a timestamped image filename."""
@@ -60,29 +37,30 @@ def img_gen(name):
 
 def take_photos(duration):
     """Take multiple photos for the specified duration and save brightness data."""
-    setup_csv()  # Ensure CSV is set up
     start_time = time.time()
     name = "ThinkerS"  # Replace with your name
+    trigger = motion_trigger(accel_gyro, THRESHOLD)  # Sleeps until the IMU reports a shake
 
     while time.time() - start_time < duration:
-        accelx, accely, accelz = accel_gyro.acceleration
-        
-        if accelx > THRESHOLD or accely > THRESHOLD:
-            time.sleep(2)  # Pause before capturing
-            filename = img_gen(name)
-            picam2.start_and_capture_file(filename)
-            print(f"Photo saved: {filename}")
+        if trigger.wait(timeout=duration - (time.time() - start_time)) is None:
+            break  # Time is up
+
+        time.sleep(2)  # Pause before capturing
+        filename = img_gen(name)
+        picam2.start_and_capture_file(filename)
+        print(f"Photo saved: {filename}")
 
-            # Analyze the photo
-            brightness_values = calculate_average_light(filename)
-            print(f"Brightness Values: {brightness_values}")
+        # Analyze the photo
+        brightness_values = calculate_average_light(filename)
+        print(f"Brightness Values: {brightness_values}")
 
-            # Save to CSV
-            save_to_csv(filename, brightness_values)
+        # Save the brightness grid
+        save_brightness(filename, brightness_values)
 
         time.sleep(IMAGE_INTERVAL)  # Wait before taking another photo
+        trigger.rearm()  # Ignore motion from while we were capturing
 
-    git_push()  # Push all images and CSV after capturing
+    git_push()  # Push all images and brightness grids after capturing
 
 def main():
     """Main function to get user input and start photo capture."""
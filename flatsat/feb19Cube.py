@@ -4,9 +4,9 @@ import csv
 from datetime import datetime
 from PIL import Image
 import numpy as np
-from picamera2 import Picamera2  # Ensure you have this installed
+from camera_session import get_session
 from image_processor import calculate_average_light  # Import your function
-import subprocess  # For uploading to GitHub
+from uploader import get_uploader  # For uploading to GitHub
 from sensor_calc_V2 import *
 
 # Ensure the images folder exists
@@ -14,13 +14,9 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))  # Get current script's
 IMAGE_DIR = os.path.join(SCRIPT_DIR, "images")  # Ensure we use the existing images folder
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
-def capture_image(filename): 
+def capture_image(filename):
     """Captures an image and saves it to the specified filename."""
-    picam2 = Picamera2()
-    picam2.start()
-    time.sleep(2)  # Allow camera to adjust
-    picam2.capture_file(filename)
-    picam2.close()
+    get_session().capture(filename)  # Camera stays open between captures
 
 def save_brightness_to_csv(brightness_array, csv_filename):
     """Saves brightness data to a CSV file."""
@@ -34,15 +30,10 @@ def generate_grayscale_image(brightness_array, image_filename):
     img = Image.fromarray(brightness_array.astype(np.uint8), mode='L')
     img.save(image_filename)
 
-def upload_to_github(image_path, csv_path):
-    """Uploads the grayscale image and CSV file to GitHub."""
-    try:
-        subprocess.run(["git", "add", image_path, csv_path], check=True)
-        subprocess.run(["git", "commit", "-m", f"Added image & CSV: {os.path.basename(image_path)}"], check=True)
-        subprocess.run(["git", "push"], check=True)
-        print("✅ Files uploaded to GitHub successfully!")
-    except subprocess.CalledProcessError:
-        print("⚠ Error uploading to GitHub. Check your repo setup.")
+def upload_to_github(*paths):
+    """Queues the files for the background uploader, which commits and pushes them in batches."""
+    get_uploader(SCRIPT_DIR, message="Added images & CSVs").add(*paths)
+    print("✅ Files queued for upload to GitHub.")
 
 def main():
     """Main function to take photos and process brightness."""
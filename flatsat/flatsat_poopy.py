@@ -15,41 +15,27 @@ You will need to complete the take_photo() function and configure the VARIABLES
 
 #import libraries
 import time
-import board
-from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
-from adafruit_lis3mdl import LIS3MDL
-from git import Repo
+from imu_service import hardware_imu
+from uploader import get_uploader
 from picamera2 import Picamera2
+from motion_trigger import motion_trigger
 
 #VARIABLES
-THRESHOLD = 0.002      #Any desired value from the accelerometer
+THRESHOLD = 1.5      #Change in acceleration (m/s^2) that counts as a shake
 REPO_PATH = "/home/pi/thinker_repo"     #Your github repo path: ex. /home/pi/FlatSatChallenge
 FOLDER_PATH = "/flatsat"   #Your image folder path in your GitHub repo: ex. /Images
 
 #imu and camera initialization
-i2c = board.I2C()
-accel_gyro = LSM6DS(i2c)
-mag = LIS3MDL(i2c)
+accel_gyro, mag = hardware_imu()
 picam2 = Picamera2()
 
 
 def git_push():
     """
-    This function is complete. Stages, commits, and pushes new images to your GitHub repo.
+    Queues the image folder for the background uploader, which commits and
+    pushes in batches without holding up the capture loop.
     """
-    try:
-        repo = Repo(REPO_PATH)
-        origin = repo.remote('origin')
-        print('added remote')
-        origin.pull()
-        print('pulled changes')
-        repo.git.add(REPO_PATH + FOLDER_PATH)
-        repo.index.commit('New Photo')
-        print('made the commit')
-        origin.push()
-        print('pushed changes')
-    except:
-        print('Couldn\'t upload to git')
+    get_uploader(REPO_PATH, message='New Photo').add(REPO_PATH + FOLDER_PATH)
 
 
 def img_gen(name):
@@ -65,25 +51,22 @@ def img_gen(name):
 
 
 def take_photo():
+    trigger = motion_trigger(accel_gyro, THRESHOLD)  #SLEEPS UNTIL THE IMU REPORTS A SHAKE
 
     while True:
-        accelx, accely, accelz = accel_gyro.acceleration
-        
-        if accelx>THRESHOLD and accely>THRESHOLD:
-        #CHECKS IF READINGS ARE ABOVE THRESHOLD
-            time.sleep(2) #PAUSE
-            name = "ThinkerS"     #First Name, Last Initial  ex. MasonM
-            picam2.start_and_capture_file(filename)
-            git_push()
-            print("Photo saved successfully") 
-            
+        trigger.wait()
+        time.sleep(2) #PAUSE
+        name = "ThinkerS"     #First Name, Last Initial  ex. MasonM
+        picam2.start_and_capture_file(img_gen(name))
+        git_push()
+        print("Photo saved successfully")
+        trigger.rearm() #IGNORE MOTION FROM WHILE WE WERE CAPTURING
+
 
 def main():
     take_photo()
 
 
 if __name__ == '__main__':
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"photo_{timestamp}.jpg"
     main()
     
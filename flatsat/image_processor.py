@@ -1,31 +1,244 @@
 from PIL import Image
 import numpy as np
 
+def _block_edges(length, size):
+    """Start index of every block along one axis (the last block may be short)."""
+    return np.arange(0, length, size)
+
+def block_means(pixels, block_size=10):
+    """
+    Average brightness of every block_size x block_size block.
+
+    pixels can be a single frame (height, width) or a batch of frames
+    (n, height, width). block_size is an int or a (rows, cols) pair.
+    Blocks on the right and bottom edges that don't fill a whole block
+    are averaged over the pixels they do have, same as the old loop.
+    """
+    pixels = np.asarray(pixels)
+    if np.isscalar(block_size):
+        block_h = block_w = int(block_size)
+    else:
+        block_h, block_w = (int(b) for b in block_size)
+    if block_h < 1 or block_w < 1:
+        raise ValueError("block_size must be at least 1")
+
+    height, width = pixels.shape[-2:]
+    ys = _block_edges(height, block_h)
+    xs = _block_edges(width, block_w)
+
+    # Sum each run of rows, then each run of columns, in one pass apiece
+    sums = np.add.reduceat(pixels, ys, axis=-2, dtype=np.float64)
+    sums = np.add.reduceat(sums, xs, axis=-1)
+
+    # Pixel count per block, smaller for the ragged edge blocks
+    rows = np.minimum(block_h, height - ys)
+    cols = np.minimum(block_w, width - xs)
+    return sums / np.outer(rows, cols)
+
 def calculate_average_light(image_path, block_size=10):
     # Open the image
     image = Image.open(image_path).convert('L')  # Convert to grayscale
-   
+
     # Convert image to numpy array
     img_array = np.array(image)
-   
-    # Get image dimensions
-    height, width = img_array.shape
-   
-    # Store the average brightness values
-    brightness_values = []
-   
-    # Iterate over the image in block_size steps
-    for y in range(0, height, block_size):
-        row = []
-        for x in range(0, width, block_size):
-            # Extract block
-            block = img_array[y:y+block_size, x:x+block_size]
-           
-            # Calculate average brightness of the block
-            avg_brightness = np.mean(block)
-            row.append(avg_brightness)
-        brightness_values.append(row)
-    return np.array(brightness_values)
 
+    # Average brightness of every block, as a (rows, cols) array
+    return block_means(img_array, block_size)
+
+# Block status codes from classify_blocks
+SAME = 0
+OUTAGE = 1
+RESTORED = 2
+STATUS_NAMES = ("Same", "Outage", "Restored")
+
+# Extra brightness gain, on top of the threshold, needed to call a block restored
+RESTORE_MARGIN = 90
+
+# RGBA overlay colour for each status, alpha 0-255 (Same is left untouched)
+STATUS_COLORS = {
+    OUTAGE: (255, 0, 0, 100),
+    RESTORED: (0, 255, 0, 100),
+}
+
+def classify_blocks(initial_matrix, second_matrix, threshold, restore_margin=RESTORE_MARGIN):
+    """
+    Compares two block brightness grids and returns a uint8 grid of
+    SAME, OUTAGE or RESTORED for every block.
+
+    A block is an outage if it got darker by more than threshold, and
+    restored if it got brighter by more than threshold + restore_margin.
+    """
+    diff = np.asarray(second_matrix, dtype=np.float64) - np.asarray(initial_matrix, dtype=np.float64)
+    status = np.full(diff.shape, SAME, dtype=np.uint8)
+    status[diff > threshold + restore_margin] = RESTORED
+    status[-diff > threshold] = OUTAGE
+    return status
+
+def render_overlay(image, status, block_size=10, colors=STATUS_COLORS):
+    """
+    Tints every block of an RGB image by its status and returns a new
+    uint8 RGB array.
+
+    Each status gets an (r, g, b, alpha) colour from colors, blended as
+    image * (1 - alpha) + colour * alpha. The status grid is broadcast
+    over the image viewed as blocks, so the whole frame is composited in
+    one integer NumPy expression however many blocks changed.
+    """
+    image = np.asarray(image, dtype=np.uint8)
+    status = np.asarray(status)
+    if np.isscalar(block_size):
+        block_h = block_w = int(block_size)
+    else:
+        block_h, block_w = (int(b) for b in block_size)
+    rows, cols = status.shape
+    height, width = image.shape[:2]
+
+    # Per-status colour and opacity lookup tables
+    count = max(len(STATUS_NAMES), max(colors, default=0) + 1)
+    color_table = np.zeros((count, 3), dtype=np.uint16)
+    alpha_table = np.zeros(count, dtype=np.uint16)
+    for code, (r, g, b, a) in colors.items():
+        color_table[code] = (r, g, b)
+        alpha_table[code] = a
+
+    # Ragged edge blocks: pad the image out to whole blocks, crop afterwards
+    padded = image[:rows * block_h, :cols * block_w]
+    pad_h = rows * block_h - padded.shape[0]
+    pad_w = cols * block_w - padded.shape[1]
+    if pad_h or pad_w:
+        padded = np.pad(padded, ((0, pad_h), (0, pad_w), (0, 0)), mode="edge")
+
+    # Each block row of pixels, RGB interleaved, is one contiguous run of
+    # block_w * 3 values, so status broadcasts over (rows, block_h, cols, run)
+    blocks = padded.reshape(rows, block_h, cols, block_w * 3)
+    alpha = alpha_table[status][:, None, :, None]
+    tint = color_table[status] * alpha_table[status][..., None]
+    tint = np.tile(tint, block_w)[:, None]
+
+    blended = blocks * (255 - alpha)
+    blended += tint
+    blended += 127
+    blended //= 255
+
+    out = image.copy()
+    covered = blended.reshape(rows * block_h, cols * block_w, 3)
+    out[:rows * block_h, :cols * block_w] = covered[:height, :width]
+    return out
+
+def summed_area_table(pixels):
+    """
+    Integral image of a (height, width) array with a leading row and
+    column of zeros, so the sum of pixels[y0:y1, x0:x1] is
+    sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0].
+    """
+    pixels = np.asarray(pixels)
+    if pixels.dtype.kind in "ub":
+        # Integer sums are exact, and int32 is faster while it can't overflow
+        fits = pixels.size * int(pixels.max(initial=0)) < 2 ** 31
+        dtype = np.int32 if fits else np.int64
+    else:
+        dtype = np.float64
+    sat = np.zeros((pixels.shape[0] + 1, pixels.shape[1] + 1), dtype=dtype)
+    np.cumsum(pixels, axis=0, dtype=dtype, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+def box_sums(sat, y0, x0, y1, x1):
+    """Sums of pixels[y0:y1, x0:x1] from summed_area_table(pixels), for arrays of corners."""
+    return (sat[y1, x1] - sat[y0, x1]) - (sat[y1, x0] - sat[y0, x0])
+
+class BlockPyramid:
+    """
+    Block means of one frame at any block size. The summed-area table is
+    built once, after which every block mean costs four lookups, however
+    large the block. Full grids are cached per block size.
+
+    Parameters:
+        pixels: (height, width) luminance array
+        normalize (bool): scale every mean so the frame average is 100,
+            like Feb25Cube.normalize_brightness
+    """
+
+    def __init__(self, pixels, normalize=False):
+        self.pixels = np.asarray(pixels)
+        self.shape = self.pixels.shape
+        self.sat = summed_area_table(self.pixels)
+        height, width = self.shape
+        total = float(self.sat[-1, -1])
+        self.scale = 100 * height * width / total if normalize and total else 1.0
+        self.levels = {}
+
+    def grid_shape(self, block_size):
+        height, width = self.shape
+        return -(-height // block_size), -(-width // block_size)
+
+    def block_values(self, block_size, rows, cols):
+        """Means of the blocks at (rows[k], cols[k]) only, for index arrays rows and cols."""
+        height, width = self.shape
+        y0 = np.asarray(rows) * block_size
+        x0 = np.asarray(cols) * block_size
+        y1 = np.minimum(y0 + block_size, height)
+        x1 = np.minimum(x0 + block_size, width)
+        return box_sums(self.sat, y0, x0, y1, x1) * self.scale / ((y1 - y0) * (x1 - x0))
+
+    def means(self, block_size):
+        """Every block_size x block_size block mean, as a (rows, cols) grid."""
+        if block_size not in self.levels:
+            rows, cols = np.indices(self.grid_shape(block_size))
+            self.levels[block_size] = self.block_values(block_size, rows, cols)
+        return self.levels[block_size]
+
+def detect_outages(initial, second, threshold, sizes=(40, 20, 10), restore_margin=RESTORE_MARGIN):
+    """
+    Coarse-to-fine version of classify_blocks for two BlockPyramids, for
+    when the finest size is small enough that comparing every block is
+    slow. At BLOCK_SIZE the full grids are cheap, use classify_blocks.
+    Nothing in the capture scripts needs blocks that fine yet, so this is
+    only used from benchmarks.py for now.
+
+    The frames are first compared in sizes[0] blocks, and only blocks that
+    could hold a changed finest block are split into the next size down,
+    until sizes[-1]. Each size must divide the one before it.
+
+    Mean differences would let a light going out cancel one coming on
+    next to it, so the test uses a summed-area table of the per-pixel
+    |normalized second - normalized initial| instead. A finest block whose
+    mean changes by more than threshold has an absolute difference above
+    threshold times its area, and so does every block containing it, so
+    no change is ever missed.
+
+    Returns (status, refined): the sizes[-1] status grid (SAME wherever it
+    wasn't refined) and the fraction of finest blocks actually compared.
+    """
+    for coarse, fine in zip(sizes, sizes[1:]):
+        if coarse % fine:
+            raise ValueError(f"block size {fine} does not divide {coarse}")
+    finest = sizes[-1]
+    height, width = initial.shape
+    difference = second.pixels * second.scale
+    difference -= initial.pixels * initial.scale
+    changed = summed_area_table(np.abs(difference, out=difference))
 
+    candidates = np.ones(initial.grid_shape(sizes[0]), dtype=bool)
+    for level, size in enumerate(sizes):
+        if level > 0:
+            # Split every candidate block into its children at this size
+            factor = sizes[level - 1] // size
+            rows, cols = initial.grid_shape(size)
+            candidates = candidates.repeat(factor, axis=0).repeat(factor, axis=1)[:rows, :cols]
+        rows, cols = np.nonzero(candidates)
+        if size == finest:
+            diff = second.block_values(size, rows, cols) - initial.block_values(size, rows, cols)
+            break
+        y0, x0 = rows * size, cols * size
+        y1, x1 = np.minimum(y0 + size, height), np.minimum(x0 + size, width)
+        # Smallest finest block inside each block (only edge blocks have cut-off ones)
+        child_h = np.minimum(finest, (y1 - y0) - finest * ((y1 - y0 - 1) // finest))
+        child_w = np.minimum(finest, (x1 - x0) - finest * ((x1 - x0 - 1) // finest))
+        candidates[rows, cols] = box_sums(changed, y0, x0, y1, x1) > threshold * child_h * child_w
 
+    status = np.full(initial.grid_shape(finest), SAME, dtype=np.uint8)
+    status[rows[diff > threshold + restore_margin], cols[diff > threshold + restore_margin]] = RESTORED
+    status[rows[-diff > threshold], cols[-diff > threshold]] = OUTAGE
+    refined = len(rows) / status.size if status.size else 0.0
+    return status, refined
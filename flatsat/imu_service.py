@@ -0,0 +1,269 @@
+"""
+One IMU sampling service for the whole program. The service is the only
+thing that talks to the I2C bus: it reads the LSM6DSOX and LIS3MDL at a
+fixed rate into a shared-memory ring buffer, and any number of readers
+(threads or processes) take samples from there without touching the bus.
+The service also publishes which IMU it reads and its die temperature,
+so readers find the same saved calibration as the sensors themselves.
+"""
+
+import math
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from calibration import device_key, read_temperature
+
+# Columns of one sample row in the ring buffer
+FIELDS = ("time", "accelX", "accelY", "accelZ", "gyroX", "gyroY", "gyroZ", "magX", "magY", "magZ")
+# Header: int64 count of samples written so far, float64 die temperature
+# (NaN if unknown), then the calibration device key as UTF-8
+KEY_OFFSET = 16
+HEADER_BYTES = 128
+
+_hardware = None
+
+def hardware_imu():
+    """
+    Opens the I2C bus and both sensors the first time it is called and
+    returns the same (accel_gyro, mag) pair on every call after that.
+    """
+    global _hardware
+    if _hardware is None:
+        import board
+        import busio
+        from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
+        from adafruit_lis3mdl import LIS3MDL
+        i2c = busio.I2C(board.SCL, board.SDA)
+        _hardware = (LSM6DS(i2c), LIS3MDL(i2c))
+    return _hardware
+
+
+class LazyDevice:
+    """
+    Placeholder for one of the hardware_imu() sensors. The bus is opened
+    the first time any attribute (acceleration, gyro, ...) is read.
+    """
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getattr__(self, name):
+        return getattr(hardware_imu()[self._index], name)
+
+
+def lazy_imu():
+    """Like hardware_imu(), but does not touch the I2C bus until first use."""
+    return LazyDevice(0), LazyDevice(1)
+
+
+class SimulatedIMU:
+    """
+    Stand-in for the LSM6DSOX/LIS3MDL pair with the same acceleration,
+    gyro and magnetic properties as the Adafruit drivers. Use the same
+    object as both accel_gyro and mag.
+
+    Parameters:
+        motion: function of time in seconds returning (acceleration, gyro,
+            magnetic) tuples. Defaults to a level board sitting still.
+        noise (float): standard deviation of noise added to every axis
+        seed (int): random seed for the noise
+        temperature (float): die temperature in degrees C to report, if any
+    """
+
+    def __init__(self, motion=None, noise=0.0, seed=None, temperature=None):
+        self.motion = motion or self.still
+        self.noise = noise
+        self.temperature = temperature
+        self.random = np.random.default_rng(seed)
+        self.start_time = time.monotonic()
+        self.reads = 0
+
+    @staticmethod
+    def still(t):
+        return (0.0, 0.0, 9.81), (0.0, 0.0, 0.0), (20.0, 0.0, -40.0)
+
+    def _read(self, index):
+        self.reads += 1
+        values = np.array(self.motion(time.monotonic() - self.start_time)[index], dtype=float)
+        if self.noise:
+            values += self.random.normal(0, self.noise, 3)
+        return tuple(values.tolist())
+
+    @property
+    def acceleration(self):
+        return self._read(0)
+
+    @property
+    def gyro(self):
+        return self._read(1)
+
+    @property
+    def magnetic(self):
+        return self._read(2)
+
+
+def _attach(name):
+    """Attaches to an existing block without letting this process unlink it at exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument. Processes forked from the
+        # service share its resource tracker, so registering again is harmless.
+        return shared_memory.SharedMemory(name=name)
+
+
+class IMUService:
+    """
+    Samples the IMU at rate_hz on a background thread and writes every
+    sample into a shared-memory ring buffer holding the last capacity
+    samples. Readers attach by name, so forked processes can share it.
+    The die temperature is read again every temperature_period seconds.
+
+    Parameters:
+        accel_gyro, mag: sensor objects. Default to hardware_imu().
+        rate_hz (float): sampling rate
+        capacity (int): samples kept in the ring buffer
+        temperature_period (float): seconds between temperature reads
+    """
+
+    def __init__(self, accel_gyro=None, mag=None, rate_hz=100, capacity=1024, temperature_period=1.0):
+        if accel_gyro is None or mag is None:
+            accel_gyro, mag = hardware_imu()
+        self.accel_gyro = accel_gyro
+        self.mag = mag
+        self.rate_hz = rate_hz
+        self.capacity = capacity
+        self.temperature_period = temperature_period
+        size = HEADER_BYTES + capacity * len(FIELDS) * 8
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.name = self.shm.name
+        self.count = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.count[0] = 0
+        self.die_temperature = np.ndarray((1,), dtype=np.float64, buffer=self.shm.buf, offset=8)
+        self._update_temperature()
+        key = device_key(accel_gyro, mag).encode()[:HEADER_BYTES - KEY_OFFSET]
+        self.shm.buf[KEY_OFFSET:KEY_OFFSET + len(key)] = key
+        self.ring = np.ndarray((capacity, len(FIELDS)), dtype=np.float64,
+                               buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def _update_temperature(self):
+        temperature = read_temperature(self.accel_gyro)
+        self.die_temperature[0] = np.nan if temperature is None else temperature
+
+    def _run(self):
+        period = 1.0 / self.rate_hz
+        next_time = time.monotonic()
+        next_temperature = next_time + self.temperature_period
+        while self.running:
+            t = time.monotonic()
+            if t >= next_temperature:
+                self._update_temperature()
+                next_temperature = t + self.temperature_period
+            row = self.ring[self.count[0] % self.capacity]
+            row[0] = t
+            row[1:4] = self.accel_gyro.acceleration  # m/s^2
+            row[4:7] = self.accel_gyro.gyro  # rad/s
+            row[7:10] = self.mag.magnetic  # gauss
+            # Publish the row only after it is completely written
+            self.count[0] += 1
+
+            # Fixed rate: sleep to the next slot, skip slots we overran
+            next_time += period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time += math.ceil(-delay / period) * period
+
+    def reader(self):
+        return IMUReader(self.name, self.capacity)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.count = self.die_temperature = self.ring = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class IMUReader:
+    """
+    Reads samples from an IMUService's ring buffer without any I2C traffic.
+
+    The acceleration, gyro and magnetic properties return the newest
+    sample in the same units as the Adafruit drivers, so a reader can be
+    used anywhere accel_gyro or mag objects are. read_new() returns every
+    sample written since the previous call, for consumers that must not
+    miss any. device_key and temperature are the service's IMU's, for
+    calibration.device_key() and read_temperature().
+    """
+
+    def __init__(self, name, capacity=1024):
+        self.shm = _attach(name)
+        self.capacity = capacity
+        self.count = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.ring = np.ndarray((capacity, len(FIELDS)), dtype=np.float64,
+                               buffer=self.shm.buf, offset=HEADER_BYTES)
+        self.position = int(self.count[0])
+        self.die_temperature = np.ndarray((1,), dtype=np.float64, buffer=self.shm.buf, offset=8)
+        self.device_key = bytes(self.shm.buf[KEY_OFFSET:HEADER_BYTES]).rstrip(b"\0").decode()
+
+    def latest(self, timeout=1.0):
+        """Returns the newest sample row, waiting up to timeout for the first one."""
+        deadline = time.monotonic() + timeout
+        while self.count[0] == 0:
+            if time.monotonic() > deadline:
+                raise TimeoutError("IMU service has not produced a sample")
+            time.sleep(0.001)
+        return self.ring[(int(self.count[0]) - 1) % self.capacity].copy()
+
+    def read_new(self):
+        """
+        Returns an (n, 10) array of the samples written since the last call,
+        columns as in FIELDS. If the reader fell more than capacity samples
+        behind, the oldest ones are lost and only the last capacity are returned.
+        """
+        end = int(self.count[0])
+        start = max(self.position, end - self.capacity)
+        self.position = end
+        indices = np.arange(start, end) % self.capacity
+        return self.ring[indices]
+
+    @property
+    def acceleration(self):
+        return tuple(self.latest()[1:4].tolist())
+
+    @property
+    def gyro(self):
+        return tuple(self.latest()[4:7].tolist())
+
+    @property
+    def magnetic(self):
+        return tuple(self.latest()[7:10].tolist())
+
+    @property
+    def temperature(self):
+        """The die temperature the service last read, None if unknown."""
+        temperature = float(self.die_temperature[0])
+        return None if math.isnan(temperature) else temperature
+
+    def close(self):
+        self.count = self.die_temperature = self.ring = None
+        self.shm.close()
@@ -0,0 +1,198 @@
+"""
+Lightweight timing and counters for the capture scripts. Steps wrapped
+with @timed or `with timer(...)` are recorded in histograms, which can
+be written to a file or served over HTTP in the Prometheus text format.
+
+Metrics are off unless switched on, and then a wrapped call costs one
+flag check. Switch them on with enable() or from the environment:
+
+    FLATSAT_METRICS_FILE=/tmp/flatsat.prom python3 Feb25Cube.py   (written at exit)
+    FLATSAT_METRICS_PORT=9100 python3 monitor.py                  (http://<pi>:9100/metrics)
+"""
+
+import atexit
+import bisect
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, from 1 ms to 1 minute
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_enabled = False
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum, for one label value."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Named metric families. Histograms and counters are keyed by one label
+    value (e.g. the step name), created the first time they are used.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # name -> (help, label, {value: Histogram})
+        self.counters = {}  # name -> (help, label, {value: number})
+
+    def observe(self, name, label, value, seconds, help="", buckets=DEFAULT_BUCKETS):
+        with self.lock:
+            family = self.histograms.setdefault(name, (help, label, {}))[2]
+            if value not in family:
+                family[value] = Histogram(buckets)
+            family[value].observe(seconds)
+
+    def inc(self, name, label, value, amount=1, help=""):
+        with self.lock:
+            family = self.counters.setdefault(name, (help, label, {}))[2]
+            family[value] = family.get(value, 0) + amount
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, (help, label, family) in sorted(self.counters.items()):
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+                for value, total in sorted(family.items()):
+                    lines.append(f'{name}{{{label}="{value}"}} {total}')
+            for name, (help, label, family) in sorted(self.histograms.items()):
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+                for value, histogram in sorted(family.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{label}="{value}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}="{value}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Writes render() to path, replacing it atomically (e.g. for node_exporter's textfile collector)."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port=9100, host="0.0.0.0"):
+        """Serves /metrics over HTTP from a background thread. Returns the server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+registry = Registry()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def observe(step, seconds):
+    """Records seconds for step in flatsat_step_seconds."""
+    if _enabled:
+        registry.observe("flatsat_step_seconds", "step", step, seconds, "Time spent in each step")
+
+
+def count(name, amount=1):
+    """Adds amount to the flatsat_events_total counter for name."""
+    if _enabled:
+        registry.inc("flatsat_events_total", "event", name, amount, "Things that happened, by kind")
+
+
+class _Timer:
+    def __init__(self, step):
+        self.step = step
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.step, time.perf_counter() - self.start)
+        if exc_type is not None:
+            count(f"{self.step}_errors")
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timer(step):
+    """Context manager that times its block as step (does nothing while metrics are off)."""
+    return _Timer(step) if _enabled else _NO_TIMER
+
+
+def timed(step=None):
+    """Decorator that times every call of a function, as step or the function's name."""
+    def decorate(func):
+        name = step or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def configure_from_env():
+    """Switches metrics on if FLATSAT_METRICS_FILE or FLATSAT_METRICS_PORT is set."""
+    path = os.environ.get("FLATSAT_METRICS_FILE")
+    port = os.environ.get("FLATSAT_METRICS_PORT")
+    if path:
+        enable()
+        atexit.register(registry.write, path)
+    if port:
+        enable()
+        registry.serve(int(port))
+
+
+configure_from_env()
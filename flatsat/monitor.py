@@ -0,0 +1,132 @@
+"""
+Long-running outage monitor. Instead of comparing one initial and one
+second frame and exiting, it keeps the camera open, holds an
+exponentially weighted baseline of every block in memory and compares
+each new frame against it. An event is reported only when a block
+changes state (e.g. Same -> Outage, Outage -> Same), so a light that
+stays off is reported once, not on every frame.
+
+    python3 monitor.py [fps] [duration_seconds]
+"""
+
+import sys
+import time
+from collections import deque
+import numpy as np
+from image_processor import BlockPyramid, SAME, OUTAGE, RESTORED, RESTORE_MARGIN, STATUS_NAMES
+
+
+class BaselineMonitor:
+    """
+    Rolling-baseline change detector for block brightness grids.
+
+    Parameters:
+        threshold (float): darkening from the baseline that counts as an outage
+        alpha (float): how fast the baseline follows blocks that are in the
+            Same state, per frame (0.05 is a time constant of about 20 frames)
+        restore_margin (float): extra brightening, on top of threshold,
+            that counts as a new light (Restored)
+        confirm_frames (int): frames in a row a block must show a new state
+            before the change is reported, so one noisy frame can't flap it
+        history (int): how many recent events to keep in self.events
+    """
+
+    def __init__(self, threshold=70, alpha=0.05, restore_margin=RESTORE_MARGIN, confirm_frames=2, history=1000):
+        self.threshold = threshold
+        self.alpha = alpha
+        self.restore_margin = restore_margin
+        self.confirm_frames = confirm_frames
+        self.baseline = None
+        self.state = None
+        self.pending = None
+        self.frames = 0
+        self.events = deque(maxlen=history)
+
+    def update(self, blocks, t=None):
+        """
+        Adds one frame's block grid and returns the list of events it
+        caused, each (time, row, col, old state, new state).
+        """
+        if t is None:
+            t = time.time()
+        blocks = np.asarray(blocks, dtype=np.float32)
+        self.frames += 1
+        if self.baseline is None:
+            self.baseline = blocks.copy()
+            self.state = np.full(blocks.shape, SAME, dtype=np.uint8)
+            self.pending = np.zeros(blocks.shape, dtype=np.uint16)
+            return []
+
+        diff = blocks - self.baseline
+        observed = np.full(blocks.shape, SAME, dtype=np.uint8)
+        observed[diff > self.threshold + self.restore_margin] = RESTORED
+        observed[-diff > self.threshold] = OUTAGE
+
+        # Count how long each block has disagreed with its state
+        differs = observed != self.state
+        self.pending[differs] += 1
+        self.pending[~differs] = 0
+        rows, cols = np.nonzero(self.pending >= self.confirm_frames)
+        events = [(t, int(r), int(c), int(self.state[r, c]), int(observed[r, c])) for r, c in zip(rows, cols)]
+        self.state[rows, cols] = observed[rows, cols]
+        self.pending[rows, cols] = 0
+        self.events.extend(events)
+
+        # The baseline only follows blocks that look normal, so an outage
+        # isn't slowly absorbed into it
+        steady = self.state == SAME
+        self.baseline[steady] += self.alpha * diff[steady]
+        return events
+
+
+def format_event(event):
+    t, row, col, old, new = event
+    stamp = time.strftime("%H:%M:%S", time.localtime(t))
+    return f"{stamp}  block ({row}, {col}): {STATUS_NAMES[old]} -> {STATUS_NAMES[new]}"
+
+
+def run_monitor(session, monitor, fps=2.0, duration=None, block_size=10, on_event=None):
+    """
+    Captures frames from a CameraSession (configured with a size) at fps
+    and feeds them to monitor until duration seconds have passed (forever
+    if None). Frames that can't keep up are skipped rather than queued.
+    Returns (frames processed, seconds).
+    """
+    on_event = on_event or (lambda event: print(format_event(event)))
+    period = 1.0 / fps
+    start_time = time.monotonic()
+    next_time = start_time
+    frames = 0
+    while duration is None or time.monotonic() - start_time < duration:
+        luma, frame = session.capture_luminance()
+        blocks = BlockPyramid(luma, normalize=True).means(block_size)
+        for event in monitor.update(blocks):
+            on_event(event)
+        frames += 1
+
+        # Fixed rate: sleep to the next slot, skip slots we overran
+        next_time += period
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_time += np.ceil(-delay / period) * period
+    return frames, time.monotonic() - start_time
+
+
+def main(fps=2.0, duration=None):
+    from camera_session import get_session
+    session = get_session(size=(640, 480))
+    monitor = BaselineMonitor()
+    print(f"Monitoring at {float(fps)} frames per second, Ctrl+C to stop")
+    try:
+        frames, seconds = run_monitor(session, monitor, float(fps), None if duration is None else float(duration))
+    except KeyboardInterrupt:
+        frames, seconds = monitor.frames, None
+    if seconds:
+        print(f"{frames} frames in {seconds:.0f} s ({frames / seconds:.2f} fps)")
+    print(f"{len(monitor.events)} recent state changes")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,366 @@
+"""
+Shake detection without spinning on the IMU. The LSM6DSOX has a wake-up
+engine that compares high-pass filtered acceleration with a threshold
+in hardware and latches an event, and a FIFO that batches samples, so
+the Pi only needs to look a few times a second (or sleep on the INT1 pin)
+instead of reading acceleration in a tight loop.
+
+    trigger = motion_trigger(accel_gyro, threshold=1.5)
+    while True:
+        event = trigger.wait()      # sleeps until a shake
+        ... take the photo ...
+        trigger.rearm()             # forget motion from while we were busy
+
+Sensors without the wake-up registers (IMUReader, SimulatedIMU, other
+drivers) get PollingTrigger, which reads at a fixed rate with sleeps.
+SimulatedLSM6DSOX emulates the registers for testing without the board.
+
+    python3 motion_trigger.py [seconds] [sim]     # idle CPU use, then print shakes
+"""
+
+import math
+import sys
+import time
+from collections import deque, namedtuple
+import numpy as np
+from imu_service import SimulatedIMU
+
+SHAKE_THRESHOLD = 1.5  # m/s^2 away from the slowly varying (gravity) baseline
+GRAVITY = 9.80665
+
+# LSM6DSOX registers
+WHO_AM_I = 0x0F
+LSM6DSOX_ID = 0x6C
+FIFO_CTRL1 = 0x07  # watermark bits 7:0
+FIFO_CTRL2 = 0x08  # watermark bit 8
+FIFO_CTRL3 = 0x09  # BDR_XL bits 3:0 (accelerometer batch rate)
+FIFO_CTRL4 = 0x0A  # FIFO_MODE bits 2:0
+CTRL1_XL = 0x10  # ODR_XL bits 7:4, FS_XL bits 3:2
+WAKE_UP_SRC = 0x1B  # WU_IA bit 3, X/Y/Z_WU bits 2:0, read clears a latched event
+FIFO_STATUS1 = 0x3A  # DIFF_FIFO bits 7:0 (samples waiting)
+FIFO_STATUS2 = 0x3B  # DIFF_FIFO bits 9:8
+TAP_CFG0 = 0x56  # SLOPE_FDS bit 4 (high-pass filter), LIR bit 0 (latch)
+TAP_CFG2 = 0x58  # INTERRUPTS_ENABLE bit 7
+WAKE_UP_THS = 0x5B  # WK_THS bits 5:0, in units of full scale / 64
+WAKE_UP_DUR = 0x5C  # WAKE_DUR bits 6:5, WAKE_THS_W bit 4
+MD1_CFG = 0x5E  # INT1_WU bit 5
+FIFO_DATA_OUT_TAG = 0x78  # TAG_SENSOR bits 7:3, followed by 6 data bytes at 0x79-0x7E
+
+WU_IA = 0x08
+FIFO_BYPASS = 0
+FIFO_CONTINUOUS = 6
+TAG_ACCEL = 0x02
+FIFO_DEPTH = 1023  # DIFF_FIFO is 10 bits
+# FS_XL bits -> full scale in g
+FULL_SCALE = {0: 2, 1: 16, 2: 4, 3: 8}
+# BDR_XL codes for the batch rates used here
+BATCH_RATES = {12.5: 1, 26: 2, 52: 3, 104: 4, 208: 5, 417: 6, 833: 7}
+
+MotionEvent = namedtuple("MotionEvent", ["time", "samples"])  # samples: (n, 3) m/s^2
+
+
+def peak(event):
+    """Largest change from the event's mean acceleration on any axis, in m/s^2."""
+    samples = np.asarray(event.samples)
+    if not len(samples):
+        return 0.0
+    return float(np.abs(samples - samples.mean(axis=0)).max())
+
+
+class WakeupTrigger:
+    """
+    Shake trigger using the LSM6DSOX wake-up engine and FIFO.
+
+    The wake-up event is latched in the sensor, so checking WAKE_UP_SRC
+    check_hz times a second misses nothing. While idle the FIFO is emptied
+    at every check, so on an event it holds just the samples around it,
+    which are read in one batch and returned with the event.
+
+    Parameters:
+        accel_gyro: Adafruit LSM6DSOX object (anything with an i2c_device)
+        threshold (float): m/s^2 of high-pass filtered acceleration on any axis
+        check_hz (float): how often the host looks at the sensor while idle
+        interrupt_pin (int): BCM GPIO wired to INT1. If given, the host sleeps
+            on the pin between checks and wakes as soon as the sensor fires.
+        batch_rate (float): FIFO sample rate, one of BATCH_RATES
+    """
+
+    def __init__(self, accel_gyro, threshold=SHAKE_THRESHOLD, check_hz=10, interrupt_pin=None, batch_rate=104):
+        self.device = accel_gyro.i2c_device
+        self.threshold = threshold
+        self.check_hz = check_hz
+        self.interrupt_pin = interrupt_pin
+        self.batch_rate = batch_rate
+        self.gpio = None
+        self.configure()
+
+    def _read(self, register, length=1):
+        buffer = bytearray(length)
+        with self.device as device:
+            device.write_then_readinto(bytes([register]), buffer)
+        return buffer
+
+    def _write(self, register, value):
+        with self.device as device:
+            device.write(bytes([register, value]))
+
+    def configure(self):
+        if self._read(WHO_AM_I)[0] != LSM6DSOX_ID:
+            raise OSError("IMU is not an LSM6DSOX")
+        full_scale = FULL_SCALE[(self._read(CTRL1_XL)[0] >> 2) & 0x03]
+        self.scale = full_scale * 2 / 65536 * GRAVITY  # m/s^2 per LSB
+        step = full_scale / 64 * GRAVITY
+        self._write(WAKE_UP_DUR, 0x00)  # Fire on the first sample over, threshold in FS/64
+        self._write(WAKE_UP_THS, min(max(round(self.threshold / step), 1), 63))
+        self._write(TAP_CFG0, 0x11)  # High-pass filter so gravity doesn't count, latch the event
+        self._write(TAP_CFG2, 0x80)  # Enable the embedded interrupts
+        self._write(MD1_CFG, 0x20)  # Route wake-up to INT1
+        self._write(FIFO_CTRL3, BATCH_RATES[self.batch_rate])
+        if self.interrupt_pin is not None:
+            import RPi.GPIO as GPIO
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setup(self.interrupt_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+            self.gpio = GPIO
+        self.rearm()
+
+    def reset_fifo(self):
+        """Empties the FIFO and starts batching again."""
+        self._write(FIFO_CTRL4, FIFO_BYPASS)
+        self._write(FIFO_CTRL4, FIFO_CONTINUOUS)
+
+    def rearm(self):
+        """Drops any event and samples from before now."""
+        self._read(WAKE_UP_SRC)
+        self.reset_fifo()
+
+    def read_fifo(self):
+        """Reads every batched accelerometer sample as an (n, 3) array in m/s^2."""
+        status = self._read(FIFO_STATUS1, 2)
+        waiting = status[0] | (status[1] & 0x03) << 8
+        samples = []
+        for _ in range(waiting):
+            word = self._read(FIFO_DATA_OUT_TAG, 7)
+            if word[0] >> 3 == TAG_ACCEL:
+                samples.append(np.frombuffer(bytes(word[1:]), dtype="<i2"))
+        if not samples:
+            return np.zeros((0, 3))
+        return np.array(samples, dtype=float) * self.scale
+
+    def _sleep(self, seconds):
+        if self.gpio is not None:
+            self.gpio.wait_for_edge(self.interrupt_pin, self.gpio.RISING, timeout=max(int(seconds * 1000), 1))
+        else:
+            time.sleep(seconds)
+
+    def wait(self, timeout=None):
+        """Sleeps until a shake and returns a MotionEvent, or None after timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        period = 1.0 / self.check_hz
+        while True:
+            if self._read(WAKE_UP_SRC)[0] & WU_IA:
+                return MotionEvent(time.time(), self.read_fifo())
+            self.reset_fifo()
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._sleep(min(period, remaining))
+            else:
+                self._sleep(period)
+
+    def close(self):
+        """Turns the wake-up interrupt and FIFO back off."""
+        self._write(MD1_CFG, 0x00)
+        self._write(TAP_CFG2, 0x00)
+        self._write(FIFO_CTRL4, FIFO_BYPASS)
+        if self.gpio is not None:
+            self.gpio.cleanup(self.interrupt_pin)
+
+
+class PollingTrigger:
+    """
+    Shake trigger for any object with an acceleration property. Reads at
+    rate_hz with sleeps in between and compares each axis with a slowly
+    following baseline, like the sensor's high-pass filter. An IMUReader
+    is read in batches with read_new(), so no service samples are skipped.
+
+    Parameters:
+        accel_gyro: sensor, IMUReader or SimulatedIMU
+        threshold (float): m/s^2 away from the baseline on any axis
+        rate_hz (float): reads per second
+        baseline_seconds (float): time constant of the baseline
+        keep (int): recent samples returned with each event
+    """
+
+    def __init__(self, accel_gyro, threshold=SHAKE_THRESHOLD, rate_hz=50, baseline_seconds=1.0, keep=32):
+        self.accel_gyro = accel_gyro
+        self.threshold = threshold
+        self.rate_hz = rate_hz
+        self.alpha = 1 - math.exp(-1.0 / (rate_hz * baseline_seconds))
+        self.recent = deque(maxlen=keep)
+        self.baseline = None
+        self.batched = hasattr(accel_gyro, "read_new")
+
+    def _samples(self):
+        if self.batched:
+            return self.accel_gyro.read_new()[:, 1:4]
+        return [self.accel_gyro.acceleration]
+
+    def rearm(self):
+        """Forgets the baseline and recent samples, so motion from before now is ignored."""
+        self.baseline = None
+        self.recent.clear()
+        if self.batched:
+            self.accel_gyro.read_new()
+
+    def wait(self, timeout=None):
+        """Sleeps until a shake and returns a MotionEvent, or None after timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        period = 1.0 / self.rate_hz
+        next_time = time.monotonic()
+        while True:
+            for sample in self._samples():
+                sample = np.asarray(sample, dtype=float)
+                self.recent.append(sample)
+                if self.baseline is None:
+                    self.baseline = sample.copy()
+                    continue
+                if np.abs(sample - self.baseline).max() > self.threshold:
+                    event = MotionEvent(time.time(), np.array(self.recent))
+                    self.rearm()
+                    return event
+                self.baseline += self.alpha * (sample - self.baseline)
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            next_time = max(next_time + period, time.monotonic())
+            time.sleep(next_time - time.monotonic())
+
+    def close(self):
+        pass
+
+
+def motion_trigger(accel_gyro=None, threshold=SHAKE_THRESHOLD, interrupt_pin=None, **kwargs):
+    """
+    WakeupTrigger if accel_gyro is an LSM6DSOX on the I2C bus, otherwise
+    PollingTrigger. accel_gyro defaults to hardware_imu(). kwargs go to
+    whichever trigger is made.
+    """
+    if accel_gyro is None:
+        from imu_service import hardware_imu
+        accel_gyro = hardware_imu()[0]
+    if hasattr(accel_gyro, "i2c_device"):
+        try:
+            return WakeupTrigger(accel_gyro, threshold, interrupt_pin=interrupt_pin, **kwargs)
+        except (OSError, ImportError) as e:
+            print(f"Hardware motion trigger unavailable ({e}), polling instead.")
+            kwargs.pop("check_hz", None)
+            kwargs.pop("batch_rate", None)
+    return PollingTrigger(accel_gyro, threshold, **kwargs)
+
+
+def idle_cpu(trigger, seconds=5.0):
+    """Fraction of one core this process uses while trigger waits with nothing happening."""
+    trigger.rearm()
+    wall = time.monotonic()
+    cpu = time.process_time()
+    trigger.wait(timeout=seconds)
+    return (time.process_time() - cpu) / (time.monotonic() - wall)
+
+
+class _SimulatedRegisters:
+    """Register file of a SimulatedLSM6DSOX, with the I2CDevice methods the triggers use."""
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+        self.registers = {WHO_AM_I: LSM6DSOX_ID, CTRL1_XL: 0x48}  # 104 Hz, +-4 g as the Adafruit driver sets
+        self.fifo = deque(maxlen=FIFO_DEPTH)
+        self.sample_time = 0.0
+        self.baseline = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _scale(self):
+        return FULL_SCALE[(self.registers[CTRL1_XL] >> 2) & 0x03] * 2 / 65536 * GRAVITY
+
+    def _advance(self):
+        """Produces the samples the sensor would have taken since the last bus access."""
+        code = self.registers.get(FIFO_CTRL3, 0) & 0x0F
+        rate = {c: r for r, c in BATCH_RATES.items()}.get(code, 104)
+        now = time.monotonic() - self.sensor.start_time
+        alpha = 1 - math.exp(-1.0 / rate)
+        step = FULL_SCALE[(self.registers[CTRL1_XL] >> 2) & 0x03] / 64 * GRAVITY
+        while self.sample_time <= now:
+            accel = np.array(self.sensor.motion(self.sample_time)[0], dtype=float)
+            if self.sensor.noise:
+                accel += self.sensor.random.normal(0, self.sensor.noise, 3)
+            self.sample_time += 1.0 / rate
+            if self.baseline is None:
+                self.baseline = accel.copy()
+            moved = np.abs(accel - self.baseline) > (self.registers.get(WAKE_UP_THS, 0) & 0x3F) * step
+            self.baseline += alpha * (accel - self.baseline)
+            if self.registers.get(TAP_CFG2, 0) & 0x80 and moved.any():
+                axes = int(moved[0]) << 2 | int(moved[1]) << 1 | int(moved[2])
+                self.registers[WAKE_UP_SRC] = self.registers.get(WAKE_UP_SRC, 0) | WU_IA | axes
+            if self.registers.get(FIFO_CTRL4, 0) & 0x07 == FIFO_CONTINUOUS:
+                raw = np.clip(np.round(accel / self._scale()), -32768, 32767).astype("<i2")
+                self.fifo.append(bytes([TAG_ACCEL << 3]) + raw.tobytes())
+
+    def write(self, buffer):
+        self._advance()
+        register, value = buffer[0], buffer[1]
+        self.registers[register] = value
+        if register == FIFO_CTRL4 and value & 0x07 == FIFO_BYPASS:
+            self.fifo.clear()
+
+    def write_then_readinto(self, out_buffer, in_buffer):
+        self._advance()
+        register = out_buffer[0]
+        if register == FIFO_DATA_OUT_TAG:
+            in_buffer[:] = self.fifo.popleft() if self.fifo else bytes(7)
+        elif register == FIFO_STATUS1:
+            in_buffer[:] = bytes([len(self.fifo) & 0xFF, len(self.fifo) >> 8])[:len(in_buffer)]
+        else:
+            in_buffer[0] = self.registers.get(register, 0)
+            if register == WAKE_UP_SRC and self.registers.get(TAP_CFG0, 0) & 0x01:
+                self.registers[WAKE_UP_SRC] = 0  # Reading clears a latched event
+
+
+class SimulatedLSM6DSOX(SimulatedIMU):
+    """
+    SimulatedIMU with an emulated LSM6DSOX register file behind i2c_device,
+    so WakeupTrigger can be tested without the board. Samples are made up
+    at the FIFO rate from motion as the registers are accessed.
+    """
+
+    def __init__(self, motion=None, noise=0.0, seed=None):
+        super().__init__(motion, noise, seed)
+        self.i2c_device = _SimulatedRegisters(self)
+
+
+def main(seconds=5.0, source="hardware"):
+    if source == "sim":
+        accel_gyro = SimulatedLSM6DSOX(noise=0.02, seed=0)
+    else:
+        accel_gyro = None
+    trigger = motion_trigger(accel_gyro)
+    print(f"Using {type(trigger).__name__}, measuring idle CPU for {float(seconds):.0f} s (keep the board still)")
+    print(f"Idle CPU use: {idle_cpu(trigger, float(seconds)):.2%} of one core")
+    print("Shake the board, Ctrl+C to stop")
+    try:
+        while True:
+            event = trigger.wait()
+            stamp = time.strftime("%H:%M:%S", time.localtime(event.time))
+            print(f"{stamp}  shake, peak {peak(event):.2f} m/s^2 over {len(event.samples)} samples")
+            trigger.rearm()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        trigger.close()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
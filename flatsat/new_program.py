@@ -4,12 +4,8 @@ sensor_calc.py functions.
 """
 
 #import libraries
-from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
-from adafruit_lis3mdl import LIS3MDL
 import time
 import os
-import board
-import busio
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from matplotlib import style
@@ -18,12 +14,13 @@ import sys
 from git import Repo
 sys.path.append('/path/to/directory/containing/sensor_calc_V2')
 from sensor_calc_V2 import *
+from imu_service import IMUService, IMUReader
 from picamera2 import Picamera2
-from multiprocessing import Process
-#imu initialization
-i2c = busio.I2C(board.SCL, board.SDA)
-accel_gyro = LSM6DS(i2c)
-mag = LIS3MDL(i2c)
+from multiprocessing import Process, Event
+from motion_trigger import motion_trigger
+#imu initialization: accel_gyro and mag come from sensor_calc_V2. When run
+#as a program, the IMU service in the main process is the only reader of the
+#I2C bus and each child process switches to an IMUReader in use_imu_service()
 picam2 = Picamera2()
 fig = plt.figure()
 ax = fig.add_subplot(1,1,1)
@@ -32,11 +29,19 @@ y1 = []
 y2 = []
 y3 = []
 rpy = [0,0,0]
-THRESHOLD = 0.02      #Any desired value from the accelerometer
+THRESHOLD = 1.5      #Change in acceleration (m/s^2) that counts as a shake
 REPO_PATH = "/home/pi/thinker_repo"     #Your github repo path: ex. /home/pi/FlatSatChallenge
 FOLDER_PATH = "/flatsat"   #Your image folder path in your GitHub repo: ex. /Images
 rocket = 0
-def animate(i, xs, type,y1,y2,y3, mag_offset, gyro_offset, initial_angle):
+stop_event = Event()  #Set to stop the photo process
+
+def use_imu_service(name):
+    """Reads the IMU through the service's shared ring buffer in this process."""
+    global accel_gyro, mag
+    accel_gyro = mag = IMUReader(name)
+    use_imu(accel_gyro, mag)  # Calibration reads the ring buffer too
+
+def animate(i, xs, type,y1,y2,y3, mag_offset, gyro_offset, initial_angle, mag_matrix = None):
     if len(y1) ==0:
         prev_ang = initial_angle
     else:
@@ -45,11 +50,8 @@ def animate(i, xs, type,y1,y2,y3, mag_offset, gyro_offset, initial_angle):
         c = y3[-1]
         prev_ang = [a,b,c]
     accelX, accelY, accelZ = accel_gyro.acceleration #m/s^2
-    magX, magY, magZ = mag.magnetic #gauss
-    #Calibrate magnetometer readings
-    magX = magX - mag_offset[0]
-    magY = magY - mag_offset[1]
-    magZ = magZ - mag_offset[2]
+    #Calibrated magnetometer readings (hard and soft iron)
+    magX, magY, magZ = apply_mag(mag.magnetic, mag_offset, mag_matrix) #gauss
     gyroX, gyroY, gyroZ = accel_gyro.gyro #rad/s
     gyroX = gyroX * (180/np.pi)- gyro_offset[0]
     gyroY = gyroY * (180/np.pi)- gyro_offset[1]
@@ -97,47 +99,55 @@ def animate(i, xs, type,y1,y2,y3, mag_offset, gyro_offset, initial_angle):
     plt.legend()
     plt.xlabel('Time')
 
-def plot_data(type = 'am'):
+def plot_data(type = 'am', imu_name = None):
+    if imu_name is not None:
+        use_imu_service(imu_name)
     timestamp = time.strftime("%Y%m%d_%H%M%S")
     filename = f"photo_{timestamp}.jpg"
     
-    mag_offset = calibrate_mag()
-    initial_angle = set_initial(mag_offset)
-    gyro_offset = calibrate_gyro()
-    ani = animation.FuncAnimation(fig, animate, fargs =(xs,type,y1,y2,y3,mag_offset,gyro_offset,initial_angle), interval = 1000)
+    mag_offset, gyro_offset, mag_matrix, initial_angle = calibrated_start()  # Saved calibration if it is still good
+    ani = animation.FuncAnimation(fig, animate, fargs =(xs,type,y1,y2,y3,mag_offset,gyro_offset,initial_angle,mag_matrix), interval = 1000)
 
     plt.show()
     
 
 
-def take_photo():
+def take_photo(imu_name = None):
+    if imu_name is not None:
+        use_imu_service(imu_name)
     print("Photo process started")
+    trigger = motion_trigger(accel_gyro, THRESHOLD)  #Batched reads of the IMU service, sleeping in between
     while not stop_event.is_set():
-        accelx, accely, accelz = accel_gyro.acceleration
-        
-        if accelx>THRESHOLD and accely>THRESHOLD:
-        #CHECKS IF READINGS ARE ABOVE THRESHOLD
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f"photo_{timestamp}.jpg"
-            time.sleep(2) #PAUSE
-            name = "ThinkerS"     #First Name, Last Initial  ex. MasonM
-            picam2.start_and_capture_file(filename)
-           # git_push()
-            print("Photo saved successfully") 
-            
+        if trigger.wait(timeout=0.5) is None:
+            continue  #No shake yet, check stop_event again
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        filename = f"photo_{timestamp}.jpg"
+        time.sleep(2) #PAUSE
+        name = "ThinkerS"     #First Name, Last Initial  ex. MasonM
+        picam2.start_and_capture_file(filename)
+       # git_push()
+        print("Photo saved successfully")
+        trigger.rearm() #Ignore motion from while we were capturing
 
             
 
 
 if __name__ == '__main__':
-    process1 = Process(target=plot_data, args=('am',))  # Start plot process
-    process2 = Process(target=take_photo)  # Start photo-taking process
+    imu = IMUService(rate_hz=50).start()  # One I2C reader for both processes
+    process1 = Process(target=plot_data, args=('am', imu.name))  # Start plot process
+    process2 = Process(target=take_photo, args=(imu.name,))  # Start photo-taking process
 
     process1.start()
     process2.start()
 
-    process1.join()
-    process2.join()  # Wait for both processes to finish
+    try:
+        process1.join()
+    except KeyboardInterrupt:
+        process1.terminate()
+    finally:
+        stop_event.set()  # Let the photo process finish its current photo and exit
+        process2.join()  # Wait for both processes to finish
+        imu.stop()
     
  
 
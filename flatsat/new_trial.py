@@ -1,41 +1,42 @@
 # Import libraries
-from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
-from adafruit_lis3mdl import LIS3MDL
 import time
 import os
-import board
-import busio
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from multiprocessing import Process, Event
 from picamera2 import Picamera2
 import numpy as np
+from sensor_calc_V2 import *
+from imu_service import IMUService, IMUReader
+from motion_trigger import motion_trigger
 
-# IMU Initialization
-i2c = busio.I2C(board.SCL, board.SDA)
-accel_gyro = LSM6DS(i2c)
-mag = LIS3MDL(i2c)
+# IMU Initialization: accel_gyro and mag come from sensor_calc_V2. When run
+# as a program, the IMU service in the main process is the only reader of the
+# I2C bus and each child process switches to an IMUReader in use_imu_service()
 picam2 = Picamera2()
 
 # Graphing Setup
 fig = plt.figure()
 ax = fig.add_subplot(1, 1, 1)
 xs, y1, y2, y3 = [], [], [], []
-THRESHOLD = 0.02  # Adjust this value if needed
+THRESHOLD = 1.5  # Change in acceleration (m/s^2) that counts as a shake
 stop_event = Event()  # Global stop event for clean shutdown
 
+def use_imu_service(name):
+    """Reads the IMU through the service's shared ring buffer in this process."""
+    global accel_gyro, mag
+    accel_gyro = mag = IMUReader(name)
+    use_imu(accel_gyro, mag)  # Calibration reads the ring buffer too
+
 # Animation function
-def animate(i, xs, y1, y2, y3, mag_offset, gyro_offset, initial_angle):
+def animate(i, xs, y1, y2, y3, mag_offset, gyro_offset, initial_angle, mag_matrix=None):
     if not y1:
         prev_ang = initial_angle
     else:
         prev_ang = [y1[-1], y2[-1], y3[-1]]
 
     accelX, accelY, accelZ = accel_gyro.acceleration
-    magX, magY, magZ = mag.magnetic
-    magX -= mag_offset[0]
-    magY -= mag_offset[1]
-    magZ -= mag_offset[2]
+    magX, magY, magZ = apply_mag(mag.magnetic, mag_offset, mag_matrix)  # Hard and soft iron corrected
 
     gyroX, gyroY, gyroZ = accel_gyro.gyro
     gyroX = gyroX * (180 / np.pi) - gyro_offset[0]
@@ -62,39 +63,40 @@ def animate(i, xs, y1, y2, y3, mag_offset, gyro_offset, initial_angle):
     xs, y1, y2, y3 = xs[-20:], y1[-20:], y2[-20:], y3[-20:]  # Keep recent 20 values
 
 # Function to run the plot
-def plot_data():
-    mag_offset = calibrate_mag()
-    initial_angle = set_initial(mag_offset)
-    gyro_offset = calibrate_gyro()
+def plot_data(imu_name=None):
+    if imu_name is not None:
+        use_imu_service(imu_name)
+    mag_offset, gyro_offset, mag_matrix, initial_angle = calibrated_start()  # Saved calibration if it is still good
    
-    ani = animation.FuncAnimation(fig, animate, fargs=(xs, y1, y2, y3, mag_offset, gyro_offset, initial_angle), interval=1000)
+    ani = animation.FuncAnimation(fig, animate, fargs=(xs, y1, y2, y3, mag_offset, gyro_offset, initial_angle, mag_matrix), interval=1000)
    
     print("Starting graph plotting...")
     plt.show()
 
 # Function to take photos based on acceleration threshold
-def take_photo():
+def take_photo(imu_name=None):
+    if imu_name is not None:
+        use_imu_service(imu_name)
     print("Photo process started!")  # Debugging
+    trigger = motion_trigger(accel_gyro, THRESHOLD)  # Batched reads of the IMU service, sleeping in between
 
     while not stop_event.is_set():
-        accelx, accely, accelz = accel_gyro.acceleration
-        print(f"Accel Data: X={accelx}, Y={accely}, Z={accelz}, Threshold={THRESHOLD}")  # Debugging
-       
-        if accelx > THRESHOLD and accely > THRESHOLD:
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f"photo_{timestamp}.jpg"
-            time.sleep(2)  # Pause before taking the photo
-            picam2.start_and_capture_file(filename)
-            print(f"Photo saved successfully as {filename}!")
-
-        time.sleep(0.5)  # Prevent CPU overload
+        if trigger.wait(timeout=0.5) is None:
+            continue  # No shake yet, check stop_event again
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        filename = f"photo_{timestamp}.jpg"
+        time.sleep(2)  # Pause before taking the photo
+        picam2.start_and_capture_file(filename)
+        print(f"Photo saved successfully as {filename}!")
+        trigger.rearm()  # Ignore motion from while we were capturing
 
 # Main execution
 if __name__ == '__main__':
+    imu = IMUService(rate_hz=50).start()  # One I2C reader for both processes
     try:
         # Start both processes
-        photo_process = Process(target=take_photo)
-        plot_process = Process(target=plot_data)
+        photo_process = Process(target=take_photo, args=(imu.name,))
+        plot_process = Process(target=plot_data, args=(imu.name,))
 
         photo_process.start()
         plot_process.start()
@@ -116,6 +118,8 @@ if __name__ == '__main__':
         plot_process.join()
 
         print("All processes stopped successfully.")
+    finally:
+        imu.stop()
 
 
 
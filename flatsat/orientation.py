@@ -0,0 +1,106 @@
+"""
+Orientation estimate that fuses the gyro with the accelerometer and
+magnetometer. The gyro is smooth but drifts, the accelerometer/magnetometer
+angles are noisy but don't drift, so a complementary filter trusts the
+gyro over short times and the accel/mag angles over long times.
+"""
+
+import time
+import numpy as np
+from attitude import roll_am, pitch_am, yaw_am, roll_gy, pitch_gy, yaw_gy, rpy_am
+from calibration import apply_mag_calibration
+
+
+def wrap_angle(angle):
+    """Wraps degrees into [-180, 180)."""
+    return (angle + 180) % 360 - 180
+
+
+def am_angles(accel, mag):
+    """Roll, pitch and yaw from one accelerometer/magnetometer sample, all in degrees."""
+    return [np.degrees(roll_am(*accel)), np.degrees(pitch_am(*accel)), yaw_am(*accel, *mag)]
+
+
+class OrientationEstimator:
+    """
+    Complementary filter for roll, pitch and yaw in degrees.
+
+    Parameters:
+        initial_angle (list): starting [roll, pitch, yaw] in degrees. If not
+            given, the first accel/mag sample is used.
+        time_constant (float): seconds. Motion faster than this follows the
+            gyro, slower changes follow the accelerometer and magnetometer.
+        rate_hz (float): expected sample rate, used for the very first step
+        max_step (float): longest time step in seconds that is integrated.
+            After a longer gap the estimate restarts from accel/mag.
+    """
+
+    def __init__(self, initial_angle=None, time_constant=0.5, rate_hz=50, max_step=0.5):
+        self.angle = None if initial_angle is None else list(initial_angle)
+        self.time_constant = time_constant
+        self.rate_hz = rate_hz
+        self.max_step = max_step
+        self.last_time = None
+
+    def update(self, accel, gyro, mag, t=None):
+        """
+        Adds one sample and returns the new [roll, pitch, yaw].
+
+        Parameters:
+            accel (tuple): accelerometer reading in m/s^2
+            gyro (tuple): calibrated gyro reading in deg/s
+            mag (tuple): calibrated magnetometer reading in gauss
+            t (float): sample time in seconds, time.monotonic() if not given
+        """
+        if t is None:
+            t = time.monotonic()
+        measured = am_angles(accel, mag)
+        return self.fuse(measured, gyro, t)
+
+    def fuse(self, measured, gyro, t):
+        """update() with the accel/mag angles already worked out."""
+        if self.last_time is None:
+            delT = 1.0 / self.rate_hz
+        else:
+            delT = t - self.last_time
+        self.last_time = t
+
+        if self.angle is None or delT > self.max_step:
+            self.angle = list(measured)
+            return list(self.angle)
+        if delT <= 0:
+            return list(self.angle)
+
+        # Predict with the gyro (roll about X, pitch about Y, yaw about Z)
+        predicted = [
+            roll_gy(self.angle[0], delT, gyro[0]),
+            pitch_gy(self.angle[1], delT, gyro[1]),
+            yaw_gy(self.angle[2], delT, gyro[2]),
+        ]
+        # Then pull gently toward the accel/mag angles, the short way round
+        weight = delT / (self.time_constant + delT)
+        self.angle = [wrap_angle(p + weight * wrap_angle(m - p)) for p, m in zip(predicted, measured)]
+        return list(self.angle)
+
+
+def replay(samples, gyro_offset=(0, 0, 0), mag_offset=(0, 0, 0), estimator=None, mag_matrix=None):
+    """
+    Runs a recorded or simulated log through an estimator.
+
+    Parameters:
+        samples: (n, 10) array with the imu_service.FIELDS columns (time,
+            accel m/s^2, gyro rad/s, mag gauss), e.g. from IMUReader.read_new()
+        gyro_offset (list): gyro bias in deg/s, as from calibrate_gyro()
+        mag_offset (list): hard-iron offset, as from calibrate_mag()
+        estimator: an OrientationEstimator, a new one by default
+        mag_matrix: soft-iron matrix from an EllipsoidCalibrator, if any
+
+    Returns an (n, 3) array of [roll, pitch, yaw] in degrees.
+    """
+    samples = np.asarray(samples, dtype=float)
+    if estimator is None:
+        estimator = OrientationEstimator()
+    gyro = np.degrees(samples[:, 4:7]) - gyro_offset
+    roll, pitch, yaw = rpy_am(samples[:, 1:4], apply_mag_calibration(samples[:, 7:10], mag_offset, mag_matrix))
+    measured = np.column_stack((np.degrees(roll), np.degrees(pitch), yaw))
+    return np.array([estimator.fuse(m, g, t) for m, g, t in zip(measured, gyro, samples[:, 0])])
@@ -0,0 +1,321 @@
+"""
+Staged capture pipeline. Capture, analysis, writing and uploading run
+on their own threads, connected by bounded queues, so the camera keeps
+capturing while earlier frames are analysed and archived. Throughput is
+set by the slowest stage instead of the sum of all of them.
+
+Each queue has a policy for when it is full:
+    BLOCK        wait for space (nothing is lost, the stage before slows down)
+    DROP_NEWEST  throw away the item being added
+    DROP_OLDEST  throw away the oldest waiting item (keeps the freshest frames)
+
+    python3 pipeline.py [interval_seconds] [frames]
+"""
+
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import numpy as np
+
+BLOCK = "block"
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+
+_STOP = object()  # end-of-stream marker passed down the pipeline
+
+
+class Channel:
+    """
+    Bounded queue between two stages.
+
+    Parameters:
+        size (int): items that can wait in the queue
+        policy (str): BLOCK, DROP_NEWEST or DROP_OLDEST
+    """
+
+    def __init__(self, size=4, policy=BLOCK):
+        if policy not in (BLOCK, DROP_NEWEST, DROP_OLDEST):
+            raise ValueError(f"unknown queue policy {policy!r}")
+        self.queue = queue.Queue(maxsize=size)
+        self.policy = policy
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def put(self, item, stop=False):
+        """Adds an item, timestamped for the wait-time metric. Returns False if it was dropped."""
+        entry = (time.perf_counter(), item)
+        if stop or self.policy == BLOCK:
+            # The stop marker must never be dropped
+            self.queue.put(entry)
+            return True
+        with self.lock:
+            while True:
+                try:
+                    self.queue.put_nowait(entry)
+                    return True
+                except queue.Full:
+                    if self.policy == DROP_NEWEST:
+                        self.dropped += 1
+                        return False
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def get(self):
+        """Returns (item, seconds it waited in the queue)."""
+        queued_at, item = self.queue.get()
+        return item, time.perf_counter() - queued_at
+
+
+class StageStats:
+    """Counts and latencies of one stage. Keeps the last window timings for percentiles."""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+        self.waits = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, latency, wait):
+        with self.lock:
+            self.count += 1
+            self.latencies.append(latency)
+            self.waits.append(wait)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            waits = np.array(self.waits)
+            count, errors = self.count, self.errors
+        if not len(latencies):
+            return {"count": count, "errors": errors}
+        return {
+            "count": count,
+            "errors": errors,
+            "mean_ms": latencies.mean() * 1000,
+            "p50_ms": np.percentile(latencies, 50) * 1000,
+            "p95_ms": np.percentile(latencies, 95) * 1000,
+            "max_ms": latencies.max() * 1000,
+            "wait_ms": waits.mean() * 1000,
+        }
+
+
+class Stage:
+    """
+    One pipeline step: workers threads each take an item from inbox, call
+    func(item) and pass the result to outbox (a result of None is not
+    passed on). Exceptions are counted and printed, and the item is skipped.
+    """
+
+    def __init__(self, name, func, inbox, outbox=None, workers=1):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.workers = workers
+        self.stats = StageStats()
+        self.threads = []
+        self.finished = 0
+        self.finished_lock = threading.Lock()
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self):
+        while True:
+            item, wait = self.inbox.get()
+            if item is _STOP:
+                # Put it back so the other workers of this stage see it too
+                self.inbox.put(_STOP, stop=True)
+                break
+            start = time.perf_counter()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                with self.stats.lock:
+                    self.stats.errors += 1
+                print(f"{self.name} failed: {e}")
+                continue
+            self.stats.add(time.perf_counter() - start, wait)
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+        # The last worker out tells the next stage the stream has ended
+        with self.finished_lock:
+            self.finished += 1
+            last = self.finished == self.workers
+        if last and self.outbox is not None:
+            self.outbox.put(_STOP, stop=True)
+
+
+class Pipeline:
+    """
+    A source function followed by a chain of stages.
+
+    source() is called repeatedly on its own thread; each call returns
+    one item (e.g. a captured frame) or None when there are no more.
+    Add stages in order with add_stage(), then start() and join().
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.stages = []
+        self.source_stats = StageStats()
+        self.running = False
+        self.thread = None
+        self.first_channel = None
+
+    def add_stage(self, name, func, workers=1, queue_size=4, policy=BLOCK):
+        """Adds a stage reading from a new queue of queue_size items with the given full-queue policy."""
+        channel = Channel(queue_size, policy)
+        if self.stages:
+            self.stages[-1].outbox = channel
+        else:
+            self.first_channel = channel
+        self.stages.append(Stage(name, func, channel, workers=workers))
+        return self
+
+    def start(self):
+        self.running = True
+        for stage in self.stages:
+            stage.start()
+        self.thread = threading.Thread(target=self._produce, name="source", daemon=True)
+        self.thread.start()
+        return self
+
+    def _produce(self):
+        while self.running:
+            start = time.perf_counter()
+            item = self.source()
+            if item is None:
+                break
+            self.source_stats.add(time.perf_counter() - start, 0.0)
+            self.first_channel.put(item)
+        self.first_channel.put(_STOP, stop=True)
+
+    def stop(self):
+        """Stops the source. Items already in the pipeline are still finished."""
+        self.running = False
+
+    def join(self):
+        """Waits until every item has gone through every stage."""
+        self.thread.join()
+        for stage in self.stages:
+            for thread in stage.threads:
+                thread.join()
+
+    def metrics(self):
+        """Per-stage counters and latencies, with items dropped from each stage's queue."""
+        metrics = {"source": self.source_stats.summary()}
+        for stage in self.stages:
+            metrics[stage.name] = dict(stage.stats.summary(), dropped=stage.inbox.dropped)
+        return metrics
+
+    def report(self):
+        print(f"{'stage':<10} {'count':>6} {'dropped':>8} {'errors':>7} {'mean ms':>9} "
+              f"{'p95 ms':>9} {'max ms':>9} {'wait ms':>9}")
+        for name, stats in self.metrics().items():
+            print(f"{name:<10} {stats['count']:6d} {stats.get('dropped', 0):8d} {stats['errors']:7d} "
+                  f"{stats.get('mean_ms', 0):9.1f} {stats.get('p95_ms', 0):9.1f} "
+                  f"{stats.get('max_ms', 0):9.1f} {stats.get('wait_ms', 0):9.1f}")
+
+
+# The Feb25Cube outage comparison as a pipeline: every frame is compared
+# with the first one while the camera keeps capturing
+
+def outage_pipeline(session, interval=1.0, frames=None, threshold=70, analysis_workers=2, upload=True):
+    """
+    Builds a pipeline that captures a reference frame, then a frame every
+    interval seconds (frames of them, or until stopped), and for each one:
+    analyse (align, block pyramid, outage detection, overlay) -> write
+    (grid, overlay and JPEG, brightness store) -> upload.
+
+    If analysis falls behind, the oldest waiting frames are dropped, so the
+    results stay current. Writing and uploading never drop anything.
+    """
+    from Feb25Cube import SCRIPT_DIR, IMAGE_DIR, BLOCK_SIZE
+    from camera_session import yuv420_to_rgb
+    from image_processor import BlockPyramid, classify_blocks, render_overlay
+    from registration import align, shift_image
+    from block_grid import make_grid, write_grid
+    from brightness_store import BrightnessStore
+    from uploader import get_uploader
+    from PIL import Image
+
+    reference_luma, reference_frame = session.capture_luminance()
+    reference_luma = reference_luma.copy()
+    reference = BlockPyramid(reference_luma, normalize=True)
+    captured = [0]
+    next_time = [time.monotonic()]
+
+    def capture():
+        if frames is not None and captured[0] >= frames:
+            return None
+        time.sleep(max(0, next_time[0] - time.monotonic()))
+        next_time[0] = max(next_time[0] + interval, time.monotonic())
+        captured[0] += 1
+        luma, frame = session.capture_luminance()
+        return datetime.now().strftime("%Y%m%d_%H%M%S_%f"), luma, frame
+
+    def analyze(item):
+        timestamp, luma, frame = item
+        luma, shift = align(reference_luma, luma)
+        second = BlockPyramid(luma, normalize=True)
+        initial_brightness, second_brightness = reference.means(BLOCK_SIZE), second.means(BLOCK_SIZE)
+        status = classify_blocks(initial_brightness, second_brightness, threshold)
+        rgb = shift_image(yuv420_to_rgb(frame), (-shift[0], -shift[1]))
+        grid = make_grid(initial=initial_brightness, second=second_brightness, status=status)
+        return timestamp, grid, render_overlay(rgb, status, BLOCK_SIZE), yuv420_to_rgb(frame)
+
+    def write(item):
+        timestamp, grid, overlay, rgb = item
+        grid_path = write_grid(os.path.join(SCRIPT_DIR, f"brightness_diff_{timestamp}.npy"), grid)
+        overlay_path = os.path.join(IMAGE_DIR, f"brightness_overlay_{timestamp}.jpg")
+        frame_path = os.path.join(IMAGE_DIR, f"second_{timestamp}.jpg")
+        Image.fromarray(overlay).save(overlay_path)
+        Image.fromarray(rgb).save(frame_path)
+        # SQLite connections belong to one thread, so open the store here
+        with BrightnessStore() as store:
+            run_time = datetime.strptime(timestamp, "%Y%m%d_%H%M%S_%f")
+            store.add_run(run_time, grid, store.source_key(grid_path), threshold)
+        return [grid_path, overlay_path, frame_path]
+
+    def send(paths):
+        get_uploader(SCRIPT_DIR, message="Updated brightness difference data").add(*paths)
+
+    pipeline = Pipeline(capture)
+    pipeline.add_stage("analyze", analyze, workers=analysis_workers, queue_size=2, policy=DROP_OLDEST)
+    pipeline.add_stage("write", write, queue_size=8, policy=BLOCK)
+    if upload:
+        pipeline.add_stage("upload", send, queue_size=16, policy=BLOCK)
+    return pipeline
+
+
+def main(interval=1.0, frames=10):
+    from camera_session import get_session
+    from Feb25Cube import FRAME_SIZE
+    pipeline = outage_pipeline(get_session(size=FRAME_SIZE), float(interval), int(frames))
+    start = time.monotonic()
+    pipeline.start()
+    try:
+        pipeline.join()
+    except KeyboardInterrupt:
+        pipeline.stop()
+        pipeline.join()
+    seconds = time.monotonic() - start
+    written = pipeline.metrics()["write"]["count"]
+    print(f"{written} frames analysed and written in {seconds:.1f} s")
+    pipeline.report()
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
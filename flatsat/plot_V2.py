@@ -4,12 +4,8 @@ sensor_calc.py functions.
 """
 
 #import libraries
-from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
-from adafruit_lis3mdl import LIS3MDL
 import time
 import os
-import board
-import busio
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from matplotlib import style
@@ -17,87 +13,95 @@ import numpy as np
 import sys
 sys.path.append('/path/to/directory/containing/sensor_calc_V2')
 from sensor_calc_V2 import *
+from ring_buffer import RingBuffer
 
 
-#imu initialization
-i2c = busio.I2C(board.SCL, board.SDA)
-accel_gyro = LSM6DS(i2c)
-mag = LIS3MDL(i2c)
+#imu initialization: accel_gyro and mag come from sensor_calc_V2
 
-fig = plt.figure()
-ax = fig.add_subplot(1,1,1)
-xs = []
-y1 = []
-y2 = []
-y3 = []
-rpy = [0,0,0]
+class LivePlot:
+    """
+    Live roll/pitch/yaw plot of the last window samples. Only the three
+    lines are redrawn each frame (blitting), the axes stay fixed: time runs
+    from -window*interval seconds to now, angles from -180 to 180 degrees.
+    """
 
-def animate(i, xs, type,y1,y2,y3, mag_offset, gyro_offset, initial_angle):
-    if len(y1) ==0:
+    def __init__(self, ax, title, window=200, interval=0.05):
+        self.ax = ax
+        self.times = RingBuffer(window)
+        self.angles = RingBuffer(window, 3)
+        self.lines = [ax.plot([], [], label=label, animated=True)[0]
+                      for label in ("Roll", "Pitch", "Yaw")]
+        ax.set_xlim(-window * interval, 0)
+        ax.set_ylim(-180, 180)
+        ax.set_title(title)
+        ax.set_ylabel('deg')
+        ax.set_xlabel('Seconds ago')
+        ax.grid()
+        ax.legend(loc='upper left')
+
+    def init(self):
+        for line in self.lines:
+            line.set_data([], [])
+        return self.lines
+
+    def add(self, t, angles):
+        """Adds one [roll, pitch, yaw] sample and returns the lines to redraw."""
+        self.times.append(t)
+        self.angles.append(angles)
+        times = self.times.view()
+        angles = self.angles.view()
+        ago = times - times[-1]
+        for k, line in enumerate(self.lines):
+            line.set_data(ago, angles[:, k])
+        return self.lines
+
+def animate(i, plot, type, mag_offset, gyro_offset, initial_angle, mag_matrix=None):
+    if len(plot.times) == 0:
         prev_ang = initial_angle
     else:
-        a = y1[-1]
-        b = y2[-1]
-        c = y3[-1]
-        prev_ang = [a,b,c]
+        prev_ang = plot.angles.last()
     accelX, accelY, accelZ = accel_gyro.acceleration #m/s^2
-    magX, magY, magZ = mag.magnetic #gauss
-    #Calibrate magnetometer readings
-    magX = magX - mag_offset[0]
-    magY = magY - mag_offset[1]
-    magZ = magZ - mag_offset[2]
+    #Calibrated magnetometer readings (hard and soft iron)
+    magX, magY, magZ = apply_mag(mag.magnetic, mag_offset, mag_matrix) #gauss
     gyroX, gyroY, gyroZ = accel_gyro.gyro #rad/s
     gyroX = gyroX * (180/np.pi)- gyro_offset[0]
     gyroY = gyroY * (180/np.pi)- gyro_offset[1]
     gyroZ = gyroZ * (180/np.pi)- gyro_offset[2]
-    xs.append(time.time())
+    t = time.monotonic()
 
     if type == 'am':
-       y1.append(roll_am(accelX,accelY,accelZ))
-       y2.append(pitch_am(accelX,accelY,accelZ))
-       y3.append(yaw_am(accelX,accelY,accelZ,magX,magY,magZ))
-       ax.clear()
-       ax.plot(xs,y1,label = "Roll")
-       ax.plot(xs,y2,label = "Pitch")
-       ax.plot(xs,y3,label = "Yaw")
-       plt.title('Roll Pitch Yaw, Using Accelerometer and Magnetometer')
-       plt.ylabel('deg')
+       #roll_am and pitch_am are in radians, yaw_am is already in degrees
+       angles = [np.degrees(roll_am(accelX,accelY,accelZ)),
+                 np.degrees(pitch_am(accelX,accelY,accelZ)),
+                 yaw_am(accelX,accelY,accelZ,magX,magY,magZ)]
 
     elif type =='gyro':
-       if len(xs) == 1:
-           y1.append(prev_ang[0])
-           y2.append(prev_ang[1])
-           y3.append(prev_ang[2])
+       if len(plot.times) == 0:
+           angles = prev_ang
        else:
-           delT = xs[-1] - xs[-2]
-           y1.append(roll_gy(prev_ang[0],delT,gyroY))
-           y2.append(pitch_gy(prev_ang[1],delT,gyroX))
-           y3.append(yaw_gy(prev_ang[2],delT,gyroZ))
-
-       ax.clear()
-       ax.plot(xs,y1,label = "Roll")
-       ax.plot(xs,y2,label = "Pitch")
-       ax.plot(xs,y3,label = "Yaw")
-       plt.title('Roll Pitch Yaw, Using Gyro')
-       plt.ylabel('deg')
+           delT = t - plot.times.last()
+           angles = [roll_gy(prev_ang[0],delT,gyroY),
+                     pitch_gy(prev_ang[1],delT,gyroX),
+                     yaw_gy(prev_ang[2],delT,gyroZ)]
 
     else:
        print("Not a valid argument.")
-       return
-    #Keep the plot from being too long
-    xs = xs[-20:]
-    y1 = y1[-20:]
-    y2 = y2[-20:]
-    y3 = y3[-20:]
-    plt.grid()
-    plt.legend()
-    plt.xlabel('Time')
+       return plot.lines
+    return plot.add(t, angles)
+
+def plot_data(type = 'am', rate_hz = 20, window = 200):
+    rate_hz = float(rate_hz)
+    mag_offset, gyro_offset, mag_matrix, initial_angle = calibrated_start()  #Saved calibration if it is still good
+    #set_initial gives roll and pitch in radians, the plot is in degrees
+    initial_angle = [np.degrees(initial_angle[0]), np.degrees(initial_angle[1]), initial_angle[2]]
 
-def plot_data(type = 'am'):
-    mag_offset = calibrate_mag()
-    initial_angle = set_initial(mag_offset)
-    gyro_offset = calibrate_gyro()
-    ani = animation.FuncAnimation(fig, animate, fargs =(xs,type,y1,y2,y3,mag_offset,gyro_offset,initial_angle), interval = 1000)
+    titles = {'am': 'Roll Pitch Yaw, Using Accelerometer and Magnetometer',
+              'gyro': 'Roll Pitch Yaw, Using Gyro'}
+    fig = plt.figure()
+    ax = fig.add_subplot(1,1,1)
+    plot = LivePlot(ax, titles.get(type, ''), int(window), 1 / rate_hz)
+    ani = animation.FuncAnimation(fig, animate, init_func = plot.init, fargs =(plot,type,mag_offset,gyro_offset,initial_angle,mag_matrix),
+                                  interval = 1000 / rate_hz, blit = True, cache_frame_data = False)
     plt.show()
 
 
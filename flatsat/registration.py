@@ -0,0 +1,128 @@
+"""
+Frame alignment before block differencing. After the gantry brings the
+CubeSat back the camera can be off by a few pixels, which makes whole
+edges of lights look like outages or restorations when block (i, j) of
+one frame is compared with block (i, j) of the other. The shift between
+the frames is found by phase correlation, first on downsampled
+luminance and then refined at full resolution on a small central crop,
+and the second frame is moved back onto the first.
+"""
+
+import numpy as np
+from image_processor import block_means
+
+
+def _window(shape):
+    """2D Hann window, so the frame edges don't dominate the correlation."""
+    return np.outer(np.hanning(shape[0]), np.hanning(shape[1])).astype(np.float32)
+
+
+def _subpixel(left, centre, right):
+    """Offset of a peak from its centre sample, from a parabola through three samples."""
+    denominator = left - 2 * centre + right
+    if denominator == 0:
+        return 0.0
+    return float(np.clip(0.5 * (left - right) / denominator, -0.5, 0.5))
+
+
+def phase_correlate(reference, moving):
+    """
+    Shift (dy, dx) of moving relative to reference, for same-sized 2D
+    arrays, with the height of the correlation peak (1.0 for a perfect
+    match, near 0 for unrelated images).
+    """
+    window = _window(reference.shape)
+    a = np.asarray(reference, dtype=np.float32)
+    b = np.asarray(moving, dtype=np.float32)
+    a = (a - a.mean()) * window
+    b = (b - b.mean()) * window
+
+    cross = np.fft.rfft2(b) * np.conj(np.fft.rfft2(a))
+    cross /= np.abs(cross) + 1e-9
+    surface = np.fft.irfft2(cross, s=a.shape)
+
+    peak_y, peak_x = np.unravel_index(np.argmax(surface), surface.shape)
+    height, width = surface.shape
+    dy = peak_y + _subpixel(surface[peak_y - 1, peak_x], surface[peak_y, peak_x],
+                            surface[(peak_y + 1) % height, peak_x])
+    dx = peak_x + _subpixel(surface[peak_y, peak_x - 1], surface[peak_y, peak_x],
+                            surface[peak_y, (peak_x + 1) % width])
+    # The correlation wraps around: peaks past the middle are negative shifts
+    if dy > height / 2:
+        dy -= height
+    if dx > width / 2:
+        dx -= width
+    return (dy, dx), float(surface[peak_y, peak_x])
+
+
+def estimate_shift(reference, moving, downsample=4, crop=128, min_peak=0.05):
+    """
+    Estimates how far moving (the second frame) is shifted from reference
+    (the initial frame), in full-resolution pixels.
+
+    Parameters:
+        reference, moving: 2D luminance arrays of the same size
+        downsample (int): block size for the coarse pass
+        crop (int): side of the central square used for the full-resolution
+            refinement, 0 to skip refinement
+        min_peak (float): weaker correlation peaks than this mean the frames
+            don't match well enough to align, and (0, 0) is returned
+
+    Returns (dy, dx): moving[y + dy, x + dx] shows what reference[y, x] does.
+    """
+    reference = np.asarray(reference)
+    moving = np.asarray(moving)
+    (dy, dx), peak = phase_correlate(block_means(reference, downsample), block_means(moving, downsample))
+    if peak < min_peak:
+        return 0.0, 0.0
+    dy, dx = dy * downsample, dx * downsample
+
+    height, width = reference.shape
+    crop = min(crop, height - 2 * int(abs(dy)) - 2, width - 2 * int(abs(dx)) - 2)
+    if crop >= 16:
+        # Refine: same scene patch in both frames, using the coarse shift
+        top, left = (height - crop) // 2, (width - crop) // 2
+        shift_y, shift_x = int(round(dy)), int(round(dx))
+        ref_patch = reference[top:top + crop, left:left + crop]
+        moving_patch = moving[top + shift_y:top + shift_y + crop, left + shift_x:left + shift_x + crop]
+        (fine_y, fine_x), fine_peak = phase_correlate(ref_patch, moving_patch)
+        if fine_peak >= min_peak and max(abs(fine_y), abs(fine_x)) <= downsample:
+            dy, dx = shift_y + fine_y, shift_x + fine_x
+    return float(dy), float(dx)
+
+
+def shift_image(image, shift, fill=None):
+    """
+    Moves the content of image by the whole-pixel part of shift (dy, dx):
+    out[y, x] = image[y - dy, x - dx]. Works on luminance or RGB arrays.
+    Pixels with nothing shifted into them come from fill (an array of the
+    same shape) if given, otherwise from the nearest edge of image.
+    """
+    image = np.asarray(image)
+    dy, dx = (int(round(s)) for s in shift)
+    height, width = image.shape[:2]
+    if dy == 0 and dx == 0:
+        return image.copy()
+    rows = np.clip(np.arange(height) - dy, 0, height - 1)
+    cols = np.clip(np.arange(width) - dx, 0, width - 1)
+    out = image[rows][:, cols]
+    if fill is not None:
+        fill = np.asarray(fill)
+        uncovered_rows = (np.arange(height) - dy < 0) | (np.arange(height) - dy >= height)
+        uncovered_cols = (np.arange(width) - dx < 0) | (np.arange(width) - dx >= width)
+        out[uncovered_rows] = fill[uncovered_rows]
+        out[:, uncovered_cols] = fill[:, uncovered_cols]
+    return out
+
+
+def align(reference, moving, fill_from_reference=True, **kwargs):
+    """
+    Shifts moving back onto reference. Returns (aligned, (dy, dx)).
+
+    With fill_from_reference, the strip along the edge that the second
+    frame doesn't cover is copied from reference, so it reads as unchanged
+    instead of as an outage. kwargs go to estimate_shift().
+    """
+    dy, dx = estimate_shift(reference, moving, **kwargs)
+    aligned = shift_image(moving, (-dy, -dx), reference if fill_from_reference else None)
+    return aligned, (dy, dx)
@@ -0,0 +1,166 @@
+"""
+Re-runs the Feb25Cube brightness comparison on archived frame pairs, with
+no camera attached. Every images/initial_<ts>.jpg that has a matching
+images/second_<ts>.jpg is decoded, analysed and given a new block grid
+and overlay, spread over all CPU cores. The second frame is aligned to
+the first before the blocks are compared unless --no-align is given.
+
+    python3 reprocess.py --threshold 60
+    python3 reprocess.py --csv --jobs 2 --output /tmp/reprocessed
+
+Pairs whose outputs are newer than both images and were made with the
+same settings are skipped, so re-running after adding a few new pairs
+only processes those.
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from block_grid import make_grid, write_grid
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(SCRIPT_DIR, "images")
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "reprocessed")
+MANIFEST_NAME = "reprocess_manifest.json"  # settings each output was made with
+
+
+def find_pairs(image_dir=IMAGE_DIR):
+    """(timestamp, initial path, second path) for every complete frame pair, oldest first."""
+    pairs = []
+    for initial_path in sorted(glob.glob(os.path.join(image_dir, "initial_*.jpg"))):
+        timestamp = os.path.basename(initial_path)[len("initial_"):-len(".jpg")]
+        second_path = os.path.join(image_dir, f"second_{timestamp}.jpg")
+        if os.path.exists(second_path):
+            pairs.append((timestamp, initial_path, second_path))
+    return pairs
+
+
+def output_paths(output_dir, timestamp, csv_output=False):
+    """Files reprocessing a pair writes: grid, overlay and optionally the CSV."""
+    paths = [os.path.join(output_dir, f"brightness_diff_{timestamp}.npy"),
+             os.path.join(output_dir, f"brightness_overlay_{timestamp}.jpg")]
+    if csv_output:
+        paths.append(os.path.join(output_dir, f"brightness_diff_{timestamp}.csv"))
+    return paths
+
+
+def up_to_date(pair, output_dir, settings, manifest, csv_output=False):
+    """True if every output exists, is newer than both images and used these settings."""
+    timestamp, initial_path, second_path = pair
+    if manifest.get(timestamp) != settings:
+        return False
+    newest_input = max(os.path.getmtime(initial_path), os.path.getmtime(second_path))
+    for path in output_paths(output_dir, timestamp, csv_output):
+        if not os.path.exists(path) or os.path.getmtime(path) < newest_input:
+            return False
+    return True
+
+
+def process_pair(pair, output_dir, threshold, align_frames=True, csv_output=False):
+    """Analyses one pair and writes its outputs. Runs in a worker process."""
+    # Imported here so only the workers pay for loading the capture script
+    from Feb25Cube import analyze_brightness_frame, overlay_outage_map, save_brightness_to_csv
+    from image_processor import classify_blocks
+    from registration import align, shift_image
+
+    timestamp, initial_path, second_path = pair
+    grid_path, overlay_path, *csv_path = output_paths(output_dir, timestamp, csv_output)
+    second_image = Image.open(second_path).convert("RGB")
+    initial_luma = np.array(Image.open(initial_path).convert("L"))
+    second_luma = np.array(second_image.convert("L"))
+    second_rgb = np.array(second_image)
+    if align_frames:
+        second_luma, shift = align(initial_luma, second_luma)
+        second_rgb = shift_image(second_rgb, (-shift[0], -shift[1]))
+    initial = analyze_brightness_frame(initial_luma)
+    second = analyze_brightness_frame(second_luma)
+    status = classify_blocks(initial, second, threshold)
+    write_grid(grid_path, make_grid(initial=initial, second=second, status=status))
+    overlay_outage_map(second_rgb, initial, second, threshold, overlay_path)
+    if csv_path:
+        save_brightness_to_csv(initial, second, csv_path[0], threshold)
+    return timestamp
+
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def reprocess(image_dir=IMAGE_DIR, output_dir=OUTPUT_DIR, threshold=70, jobs=None, csv_output=False,
+              force=False, align_frames=True):
+    """
+    Reprocesses every out-of-date pair and returns (processed, skipped,
+    failed, seconds). A pair that can't be processed (e.g. a corrupt JPEG)
+    is reported and counted as failed, and the rest still run; the
+    manifest is saved for every pair that finished.
+
+    Parameters:
+        image_dir (str): folder with the initial_<ts>.jpg / second_<ts>.jpg pairs
+        output_dir (str): where grids, overlays and CSVs are written
+        threshold (float): brightness change that counts as an outage
+        jobs (int): worker processes, one per CPU core by default
+        csv_output (bool): also write the old per-block CSVs
+        force (bool): reprocess pairs even if their outputs are up to date
+        align_frames (bool): align the second frame to the first before comparing
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    pairs = find_pairs(image_dir)
+    settings = {"threshold": threshold, "align": align_frames}
+    todo = [pair for pair in pairs
+            if force or not up_to_date(pair, output_dir, settings, manifest, csv_output)]
+
+    start = time.perf_counter()
+    failed = 0
+    if todo:
+        try:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = [pool.submit(process_pair, pair, output_dir, threshold, align_frames, csv_output)
+                           for pair in todo]
+                for pair, future in zip(todo, futures):
+                    try:
+                        manifest[future.result()] = settings
+                    except Exception as e:
+                        failed += 1
+                        print(f"Could not reprocess {pair[0]}: {e}")
+        finally:
+            save_manifest(output_dir, manifest)
+    return len(todo) - failed, len(pairs) - len(todo), failed, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess archived frame pairs without the camera.")
+    parser.add_argument("--threshold", type=float, default=70, help="outage threshold (default 70)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU cores)")
+    parser.add_argument("--images", default=IMAGE_DIR, help="folder holding the frame pairs")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="folder for the regenerated files")
+    parser.add_argument("--csv", action="store_true", help="also write per-block CSVs")
+    parser.add_argument("--force", action="store_true", help="reprocess up-to-date pairs too")
+    parser.add_argument("--no-align", action="store_true", help="compare the frames without aligning them")
+    args = parser.parse_args()
+
+    processed, skipped, failed, seconds = reprocess(args.images, args.output, args.threshold,
+                                                    args.jobs, args.csv, args.force, not args.no_align)
+    rate = processed / seconds if seconds else 0
+    print(f"Processed {processed} pairs in {seconds:.2f} s ({rate:.1f} pairs/s), "
+          f"skipped {skipped} up-to-date pairs, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Fixed-size ring buffer backed by a NumPy array. Appending is O(1) and
+memory never grows, and view() returns the contents oldest-first without
+copying.
+"""
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Holds the last capacity rows of width values each (width=None for
+    scalars). Every row is stored twice, capacity apart, so the newest
+    capacity rows are always one contiguous slice of the array.
+    """
+
+    def __init__(self, capacity, width=None, dtype=float):
+        self.capacity = capacity
+        shape = (2 * capacity,) if width is None else (2 * capacity, width)
+        self.data = np.zeros(shape, dtype=dtype)
+        self.count = 0
+
+    def append(self, value):
+        index = self.count % self.capacity
+        self.data[index] = value
+        self.data[index + self.capacity] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def view(self):
+        """The stored rows, oldest first. A view: it changes on the next append."""
+        if self.count <= self.capacity:
+            return self.data[:self.count]
+        start = self.count % self.capacity
+        return self.data[start:start + self.capacity]
+
+    def last(self):
+        return self.data[(self.count - 1) % self.capacity] if self.count else None
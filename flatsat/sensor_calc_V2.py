@@ -13,66 +13,27 @@ import time
 import numpy as np
 import time
 import os
-import board
-import busio
-from adafruit_lsm6ds.lsm6dsox import LSM6DSOX as LSM6DS
-from adafruit_lis3mdl import LIS3MDL
-
-#imu initialization
-i2c = busio.I2C(board.SCL, board.SDA)
-accel_gyro = LSM6DS(i2c)
-mag = LIS3MDL(i2c)
-
-
-#Activity 1: RPY based on accelerometer and magnetometer
-def roll_am(accelX,accelY,accelZ):
-    roll = np.arctan2(accelY, np.sqrt(accelX**2 + accelZ**2))
-    return roll
-
-def pitch_am(accelX,accelY,accelZ):
-    pitch = np.arctan2(accelX, np.sqrt(accelY**2 + accelZ**2))
-    return pitch
-
-def yaw_am(accelX,accelY,accelZ,magX,magY,magZ):
-    # a. compute mag_x
-    mag_x = (
-        magX * np.cos(pitch_am(accelX,accelY,accelZ))+
-        magY * np.sin(roll_am(accelX,accelY,accelZ))*np.sin(pitch_am(accelX,accelY,accelZ))+
-        magZ * np.cos(roll_am(accelX,accelY,accelZ))*np.sin(pitch_am(accelX,accelY,accelZ))
-    )
-    
-    # b. compute mag_y
-    mag_y = magY * np.cos(roll_am(accelX,accelY,accelZ)) - magZ * np.sin(roll_am(accelX,accelY,accelZ))
-    # c. compute yaw
-    yaw = np.arctan2(-mag_y, mag_x)
-    return (180/np.pi)*np.arctan2(-mag_y, mag_x)
-
-#Activity 2: RPY based on gyroscope
-def roll_gy(prev_angle, delT, gyro):
-    #TODO
-    roll = ( 
-    
-    prev_angle+
-    gyro * delT
-    
-    )
-    return roll
-def pitch_gy(prev_angle, delT, gyro):
-    pitch = (
-    
-    prev_angle+
-    gyro * delT
-    
-    )
-    return pitch
-def yaw_gy(prev_angle, delT, gyro):
-    yaw = (
-    
-    prev_angle+
-    gyro * delT
-    
-    )
-    return yaw
+from imu_service import lazy_imu
+from calibration import (EllipsoidCalibrator, GyroCalibrator, run_calibration, CalibrationStore, device_key,
+                         read_temperature, check_calibration, apply_mag_calibration)
+
+#imu initialization, shared with every other script in the process. The
+#bus is only opened the first time a sensor is read.
+accel_gyro, mag = lazy_imu()
+
+
+def use_imu(new_accel_gyro, new_mag):
+    """
+    Points the calibration functions at other sensor objects, e.g. an
+    IMUReader from imu_service or a SimulatedIMU.
+    """
+    global accel_gyro, mag
+    accel_gyro, mag = new_accel_gyro, new_mag
+
+
+#Activity 1 and 2: the RPY math lives in attitude.py so it can be used
+#without the IMU attached
+from attitude import roll_am, pitch_am, yaw_am, roll_gy, pitch_gy, yaw_gy
 
 #Activity 3: Sensor calibration
 #def calibrate_mag():
@@ -84,65 +45,113 @@ def yaw_gy(prev_angle, delT, gyro):
    # print("Calibration complete.")
     #return [0,0,0]
 #Activity 3: Sensor calibration
-def calibrate_mag():
+CALIBRATION_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration_store.json")
+
+def calibrate_mag(duration=10, rate_hz=100, calibrator=None):
     """
     Calibrate the magnetometer by determining the offset values for hard iron calibration.
+    Reads at rate_hz for up to duration seconds, stopping early once the
+    min/max of every axis stops growing. Raises RuntimeError if the board
+    was not turned through every axis. Pass an EllipsoidCalibrator to
+    get the soft-iron matrix afterwards.
     """
     print("Preparing to calibrate magnetometer. Please wave it around.")
     time.sleep(3)
     print("Calibrating...")
 
-    # Initialize lists to store magnetic readings
-    magX_values, magY_values, magZ_values = [], [], []
-
-    # Collect magnetic readings over 10 seconds
-    start_time = time.time()
-    while time.time() - start_time < 10:
-        magX, magY, magZ = mag.magnetic  # Replace with actual sensor readings
-        magX_values.append(magX)
-        magY_values.append(magY)
-        magZ_values.append(magZ)
-
-    # Calculate min and max values for each axis
-    magX_min, magX_max = min(magX_values), max(magX_values)
-    magY_min, magY_max = min(magY_values), max(magY_values)
-    magZ_min, magZ_max = min(magZ_values), max(magZ_values)
-
-    # Compute offsets for hard iron calibration
-    magX_offset = (magX_min + magX_max) / 2
-    magY_offset = (magY_min + magY_max) / 2
-    magZ_offset = (magZ_min + magZ_max) / 2
+    # Offsets are the centre of the ellipsoid fitted to the readings
+    offsets = run_calibration(calibrator or EllipsoidCalibrator(), lambda: mag.magnetic, duration, rate_hz)
 
     print("Calibration complete.")
-    return [magX_offset, magY_offset, magZ_offset]
+    return offsets
 
 
-def calibrate_gyro():
+def calibrate_gyro(duration=5, rate_hz=100):
     """
     Calibrate the gyroscope by determining the bias (drift) when stationary.
+    Reads at rate_hz for up to duration seconds, stopping early once the
+    mean of every axis is known precisely enough.
     """
     print("Preparing to calibrate gyroscope. Put down the board and do not touch it.")
     time.sleep(3)
     print("Calibrating...")
 
-    # Initialize lists to store gyroscope readings
-    gyroX_values, gyroY_values, gyroZ_values = [], [], []
+    # Offsets are the running mean of each axis
+    offsets = run_calibration(GyroCalibrator(), lambda: accel_gyro.gyro, duration, rate_hz)
 
-    # Collect gyroscope readings over 5 seconds
-    start_time = time.time()
-    while time.time() - start_time < 5:
-        gyroX, gyroY, gyroZ = accel_gyro.gyro  # Replace with actual sensor readings
-        gyroX_values.append(gyroX)
-        gyroY_values.append(gyroY)
-        gyroZ_values.append(gyroZ)
+    print("Calibration complete.")
+    return offsets
 
-    # Compute mean values to determine bias
-    gyroX_offset = sum(gyroX_values) / len(gyroX_values)
-    gyroY_offset = sum(gyroY_values) / len(gyroY_values)
-    gyroZ_offset = sum(gyroZ_values) / len(gyroZ_values)
 
-    print("Calibration complete.")
-    return [gyroX_offset, gyroY_offset, gyroZ_offset]
+def verify_calibration(entry, duration=0.5, rate_hz=100, attempts=2):
+    """
+    Checks a saved calibration against duration seconds of readings with
+    the board still, instead of recalibrating. Returns (ok, reason).
+    """
+    period = 1.0 / rate_hz
+    for attempt in range(attempts):
+        print("Checking saved calibration. Please hold the IMU still.")
+        gyro, magnetic = [], []
+        next_time = time.monotonic()
+        for _ in range(max(int(duration * rate_hz), 2)):
+            gyro.append(accel_gyro.gyro)
+            magnetic.append(mag.magnetic)
+            next_time += period
+            time.sleep(max(0, next_time - time.monotonic()))
+        ok, reason = check_calibration(entry, gyro, magnetic)
+        if ok or reason != "board was moving":
+            break
+    return ok, reason
+
+
+def load_or_calibrate(max_age=7 * 24 * 3600, path=CALIBRATION_STORE, max_temp_diff=5.0, check=True):
+    """
+    Returns (mag_offset, gyro_offset, mag_matrix) for this IMU. mag_matrix
+    is the soft-iron correction for apply_mag(), None for a saved
+    calibration that only has an offset.
+
+    A saved calibration for the same device, made within max_age seconds
+    and within max_temp_diff degrees C of the current temperature, is
+    reused after a half-second check (skipped if check is False).
+    Otherwise both calibrations run and the result is saved.
+    """
+    store = CalibrationStore(path, max_age, max_temp_diff)
+    device = device_key(accel_gyro, mag)
+    temperature = read_temperature(accel_gyro)
+    entry = store.lookup(device, temperature)
+    if entry is not None:
+        ok, reason = verify_calibration(entry) if check else (True, "not checked")
+        if ok:
+            print("Using saved calibration.")
+            return entry["mag_offset"], entry["gyro_offset"], entry.get("mag_matrix")
+        print(f"Saved calibration failed its check ({reason}), recalibrating.")
+    calibrator = EllipsoidCalibrator()
+    mag_offset = calibrate_mag(calibrator=calibrator)
+    gyro_offset = calibrate_gyro()
+    store.save(device, temperature, mag_offset=mag_offset, gyro_offset=gyro_offset,
+               mag_matrix=calibrator.matrix(), mag_field=calibrator.field())
+    return mag_offset, gyro_offset, calibrator.matrix()
+
+
+def apply_mag(sample, mag_offset, mag_matrix=None):
+    """
+    Calibrated magnetometer reading: hard-iron offset removed, then the
+    soft-iron mag_matrix from load_or_calibrate() applied, if given. Works
+    on one (x, y, z) reading, returned as a tuple, or an (n, 3) array.
+    """
+    corrected = apply_mag_calibration(sample, mag_offset, mag_matrix)
+    return tuple(corrected.tolist()) if corrected.ndim == 1 else corrected
+
+
+def calibrated_start(**kwargs):
+    """
+    What a script needs from the IMU before it starts:
+    (mag_offset, gyro_offset, mag_matrix, initial_angle). Calibration comes
+    from load_or_calibrate(**kwargs), which ends with the board held still,
+    so the initial angle is taken straight away.
+    """
+    mag_offset, gyro_offset, mag_matrix = load_or_calibrate(**kwargs)
+    return mag_offset, gyro_offset, mag_matrix, set_initial(mag_offset, wait=0, mag_matrix=mag_matrix)
 
 #def calibrate_gyro():
     #TODO
@@ -154,24 +163,22 @@ def calibrate_gyro():
     #return [0, 0, 0]
 
 
-def set_initial(mag_offset = [0,0,0]):
+def set_initial(mag_offset = [0,0,0], wait = 3, mag_matrix = None):
     """
     This function is complete. Finds initial RPY values.
 
     Parameters:
         mag_offset (list): magnetometer calibration offsets
+        wait (float): seconds to give the user to hold the IMU still
+        mag_matrix: soft-iron correction from load_or_calibrate(), if any
     """
     #Sets the initial position for plotting and gyro calculations.
     print("Preparing to set initial angle. Please hold the IMU still.")
-    time.sleep(3)
+    time.sleep(wait)
     print("Setting angle...")
     accelX, accelY, accelZ = accel_gyro.acceleration #m/s^2
-    magX, magY, magZ = mag.magnetic #gauss
-    #Calibrate magnetometer readings. Defaults to zero until you
-    #write the code
-    magX = magX - mag_offset[0]
-    magY = magY - mag_offset[1]
-    magZ = magZ - mag_offset[2]
+    #Calibrate magnetometer readings (hard and soft iron)
+    magX, magY, magZ = apply_mag(mag.magnetic, mag_offset, mag_matrix) #gauss
     roll = roll_am(accelX, accelY,accelZ)
     pitch = pitch_am(accelX,accelY,accelZ)
     yaw = yaw_am(accelX,accelY,accelZ,magX,magY,magZ)
@@ -0,0 +1,232 @@
+"""
+Background uploader for captured files. Files are queued on disk and a
+worker thread commits them in batches and pushes with retries, so the
+capture loop never waits on git or the network.
+"""
+
+import atexit
+import os
+import subprocess
+import threading
+import time
+import metrics
+
+
+class Uploader:
+    """
+    Commits queued files in batches and pushes them from a background thread.
+
+    The queue is a plain text file (one path per line) inside the repo's
+    .git folder, so files queued before a crash or reboot are still
+    committed the next time an Uploader starts on that repo.
+
+    Parameters:
+        repo_path (str): any folder inside the git repo
+        batch_files (int): commit as soon as this many files are queued
+        batch_seconds (float): or once the oldest queued file is this old
+        message (str): commit message
+        max_backoff (float): longest wait in seconds between push retries
+    """
+
+    def __init__(self, repo_path, batch_files=10, batch_seconds=30, message="New capture data",
+                 max_backoff=300):
+        self.repo_path = repo_path
+        self.batch_files = batch_files
+        self.batch_seconds = batch_seconds
+        self.message = message
+        self.max_backoff = max_backoff
+        git_dir = self._git("rev-parse", "--absolute-git-dir").stdout.strip()
+        self.queue_path = os.path.join(git_dir, "upload_queue")
+
+        self.lock = threading.Condition()
+        self.pending = self._load_queue()
+        # Anything left over from a previous run is committed right away
+        self.oldest = time.monotonic() - batch_seconds if self.pending else None
+        self.needs_push = True
+        self.backoff = 1
+        self.retry_at = 0
+        self.flushing = False
+        self.running = False
+        self.thread = None
+
+    def _git(self, *args):
+        return subprocess.run(["git", "-C", self.repo_path] + list(args),
+                              capture_output=True, text=True)
+
+    def _load_queue(self):
+        if not os.path.exists(self.queue_path):
+            return []
+        with open(self.queue_path) as file:
+            return [line.rstrip("\n") for line in file if line.strip()]
+
+    def _save_queue(self):
+        """Rewrites the queue file atomically so a crash never leaves it half written."""
+        tmp_path = self.queue_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.writelines(path + "\n" for path in self.pending)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.queue_path)
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def add(self, *paths):
+        """Queues files to be committed and pushed. Returns immediately."""
+        paths = [os.path.abspath(path) for path in paths]
+        with self.lock:
+            with open(self.queue_path, "a") as file:
+                file.writelines(path + "\n" for path in paths)
+                file.flush()
+                os.fsync(file.fileno())
+            self.pending.extend(paths)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            self.lock.notify()
+
+    def flush(self, timeout=None):
+        """
+        Commits whatever is queued and tries to push it now, ignoring the
+        batching and backoff. Returns True if everything was pushed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            self.flushing = True
+            self.lock.notify_all()
+            while self.running and self.flushing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.lock.wait(remaining)
+            return not (self.pending or self.needs_push)
+
+    def stop(self, flush=True, timeout=60):
+        """Stops the worker, by default after one last commit and push."""
+        if flush and self.running:
+            self.flush(timeout)
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _batch_due(self, now):
+        if not self.pending:
+            return False
+        return (self.flushing
+                or len(self.pending) >= self.batch_files
+                or now - self.oldest >= self.batch_seconds)
+
+    def _run(self):
+        with self.lock:
+            while self.running:
+                now = time.monotonic()
+                if now >= self.retry_at or self.flushing:
+                    if self._batch_due(now):
+                        ok = self._commit_batch()
+                    elif self.needs_push:
+                        ok = self._push_unlocked()
+                    else:
+                        ok = None
+                    if ok is not None:
+                        if ok:
+                            self.backoff = 1
+                            self.retry_at = 0
+                        else:
+                            # Back off exponentially while git or the link is failing
+                            print(f"Upload failed, retrying in {self.backoff} s")
+                            self.retry_at = time.monotonic() + self.backoff
+                            self.backoff = min(self.backoff * 2, self.max_backoff)
+                            self.flushing = False
+                        self.lock.notify_all()
+                        continue
+                if self.flushing:
+                    self.flushing = False  # Nothing left to commit or push
+                    self.lock.notify_all()
+
+                # Sleep until the next batch or retry is due, or until woken
+                if now < self.retry_at:
+                    self.lock.wait(self.retry_at - now)
+                elif self.pending:
+                    self.lock.wait(max(self.oldest + self.batch_seconds - now, 0.01))
+                else:
+                    self.lock.wait()
+
+    def _commit_batch(self):
+        """Commits everything queued so far, with the lock released while git runs."""
+        batch = list(self.pending)
+        self.lock.release()
+        try:
+            committed = self._commit(batch)
+        finally:
+            self.lock.acquire()
+        if committed:
+            self.pending = self.pending[len(batch):]
+            self.oldest = time.monotonic() if self.pending else None
+            self._save_queue()
+            self.needs_push = True
+        return committed
+
+    def _push_unlocked(self):
+        self.lock.release()
+        try:
+            pushed = self._push()
+        finally:
+            self.lock.acquire()
+        if pushed:
+            self.needs_push = False
+        return pushed
+
+    @metrics.timed("git_commit")
+    def _commit(self, paths):
+        """Stages and commits one batch. Returns False if git failed."""
+        existing = [path for path in paths if os.path.exists(path)]
+        for path in set(paths) - set(existing):
+            print(f"Upload skipped, file is gone: {path}")
+        if existing:
+            result = self._git("add", "--", *existing)
+            if result.returncode != 0:
+                print(f"git add failed: {result.stderr.strip()}")
+                return False
+        if self._git("diff", "--cached", "--quiet").returncode == 0:
+            return True  # Nothing changed, nothing to commit
+        result = self._git("commit", "-m", f"{self.message} ({len(existing)} files)")
+        if result.returncode != 0:
+            print(f"git commit failed: {result.stderr.strip()}")
+            return False
+        print(f"Committed {len(existing)} files.")
+        metrics.count("files_committed", len(existing))
+        return True
+
+    @metrics.timed("git_push")
+    def _push(self):
+        """Pushes local commits, pulling first only if the remote has moved on."""
+        result = self._git("push")
+        if result.returncode == 0:
+            return True
+        if "rejected" in result.stderr and self._git("pull", "--rebase").returncode == 0:
+            result = self._git("push")
+            if result.returncode == 0:
+                return True
+        print(f"git push failed: {result.stderr.strip()}")
+        metrics.count("push_failures")
+        return False
+
+
+_uploaders = {}
+
+def get_uploader(repo_path, **kwargs):
+    """
+    Returns the running Uploader for repo_path, starting one on first use.
+    It is flushed and stopped when the script exits.
+    """
+    key = os.path.abspath(repo_path)
+    if key not in _uploaders:
+        uploader = Uploader(repo_path, **kwargs).start()
+        atexit.register(uploader.stop)
+        _uploaders[key] = uploader
+    return _uploaders[key]